@@ -0,0 +1,14 @@
+"""
+Benchmarks for wagtail-cache. These are not run as part of the unit tests.
+Run each module from the ``testproject`` directory, for example::
+
+    python -m benchmarks.serialization
+"""
+
+import os
+
+import django
+
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "testproject.settings")
+django.setup()
@@ -0,0 +1,67 @@
+"""
+Compares the latency of a cache hit under ASGI, with the middleware running
+in a thread as ``MiddlewareMixin`` does by default, versus natively on the
+event loop.
+"""
+
+import asyncio
+import time
+
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory
+from django.test import override_settings
+from django.utils.deprecation import MiddlewareMixin
+
+from wagtailcache.cache import FetchFromCacheMiddleware
+from wagtailcache.cache import UpdateCacheMiddleware
+from wagtailcache.cache import clear_cache
+
+
+ROUNDS = 2000
+
+
+class ThreadedFetchFromCacheMiddleware(FetchFromCacheMiddleware):
+    __acall__ = MiddlewareMixin.__acall__
+
+
+class ThreadedUpdateCacheMiddleware(UpdateCacheMiddleware):
+    __acall__ = MiddlewareMixin.__acall__
+
+
+async def view(request):
+    return HttpResponse("Hello, World!" * 100)
+
+
+async def bench_chain(update_class, fetch_class) -> float:
+    chain = update_class(fetch_class(view))
+    factory = AsyncRequestFactory()
+    # Prime the cache.
+    await chain(factory.get("/"))
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        response = await chain(factory.get("/"))
+    elapsed = time.perf_counter() - start
+    assert response["X-Wagtail-Cache"] == "hit", response["X-Wagtail-Cache"]
+    return elapsed / ROUNDS * 1e6
+
+
+def bench(label: str) -> None:
+    clear_cache()
+    threaded = asyncio.run(
+        bench_chain(
+            ThreadedUpdateCacheMiddleware, ThreadedFetchFromCacheMiddleware
+        )
+    )
+    clear_cache()
+    native = asyncio.run(
+        bench_chain(UpdateCacheMiddleware, FetchFromCacheMiddleware)
+    )
+    print(
+        f"{label:>8}  threaded: {threaded:>8.1f} us  native: {native:>8.1f} us"
+    )
+
+
+if __name__ == "__main__":
+    bench("backend")
+    with override_settings(WAGTAIL_CACHE_LOCAL=True):
+        bench("local")
@@ -0,0 +1,298 @@
+"""
+Measures the hot paths of the middleware against each cache backend, and
+prints the results as JSON, so that they can be compared between releases::
+
+    python -m benchmarks.middleware --output before.json
+    python -m benchmarks.middleware --compare before.json
+
+Redis is benchmarked with ``fakeredis``, and Memcached with ``pymemcache``'s
+mock client, if they are installed. Both run in memory, so they measure the
+overhead of wagtail-cache and the backend's client, not the network.
+"""
+
+import argparse
+import json
+import platform
+import sys
+import tempfile
+import time
+from typing import Callable
+from typing import Dict
+from typing import List
+
+import django
+import wagtail
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.test import override_settings
+
+import wagtailcache
+from wagtailcache.cache import FetchFromCacheMiddleware
+from wagtailcache.cache import UpdateCacheMiddleware
+from wagtailcache.cache import _chop_cookies
+from wagtailcache.cache import _chop_querystring
+from wagtailcache.cache import clear_cache
+from wagtailcache.keyring import get_keyring
+from wagtailcache.settings import wagtailcache_settings
+
+
+ROUNDS = 2000
+# Number of URLs in the keyring.
+SIZES = (100, 1000, 10000)
+QUERYSTRINGS = {
+    "clean": lambda i: "page=2&sort=date",
+    "tracking": lambda i: (
+        "utm_source=newsletter&utm_medium=email&utm_campaign=spring"
+    ),
+    "mixed": lambda i: "page=2&utm_source=google&utm_medium=cpc&q=wagtail",
+    # Click IDs are unique to each visitor.
+    "unique": lambda i: f"utm_source=google&utm_medium=cpc&gclid=Cj0K{i}",
+}
+TRACKING_COOKIES = "_ga=GA1.2.1234.5678; _gid=GA1.2.8765.4321; _fbp=fb.1.2.3"
+COOKIES = {
+    "none": "",
+    "tracking": TRACKING_COOKIES,
+    "session": f"{TRACKING_COOKIES}; csrftoken=abc123; sessionid=def456",
+}
+
+
+def get_backends() -> Dict[str, Dict]:
+    """
+    Returns the ``CACHES`` entry of each backend which can be benchmarked.
+    """
+    backends = {
+        "locmem": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "OPTIONS": {"MAX_ENTRIES": 1000000},
+        },
+        "filebased": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": tempfile.mkdtemp(prefix="wagtailcache-bench-"),
+            "OPTIONS": {"MAX_ENTRIES": 1000000},
+        },
+    }
+    try:
+        import fakeredis
+
+        backends["redis"] = {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": "redis://localhost:6379",
+            "OPTIONS": {"connection_class": fakeredis.FakeRedisConnection},
+        }
+    except ImportError:
+        pass
+    try:
+        import pymemcache  # noqa: F401
+
+        backends["memcached"] = {
+            "BACKEND": "benchmarks.middleware.MockMemcacheCache",
+            "LOCATION": "localhost:11211",
+        }
+    except ImportError:
+        pass
+    return backends
+
+
+try:
+    from django.core.cache.backends.memcached import PyMemcacheCache
+    from pymemcache.test.utils import MockMemcacheClient
+
+    class MockMemcacheCache(PyMemcacheCache):
+        """
+        Memcached, with an in-memory client in place of a server.
+        """
+
+        def __init__(self, server, params):
+            super().__init__(server, params)
+            self._class = MockMemcacheClient
+
+except ImportError:
+    pass
+
+
+def view(request):
+    return HttpResponse("Hello, World!" * 100)
+
+
+def per_op(fn: Callable[[], None], ops: int) -> float:
+    """
+    Returns the microseconds per operation of ``fn``, which runs ``ops``
+    operations.
+    """
+    start = time.perf_counter()
+    fn()
+    return (time.perf_counter() - start) / ops * 1e6
+
+
+def bench_hit(factory: RequestFactory, rounds: int) -> float:
+    chain = UpdateCacheMiddleware(FetchFromCacheMiddleware(view))
+    chain(factory.get("/hit/"))
+    requests = [factory.get("/hit/") for _ in range(rounds)]
+
+    def run():
+        for request in requests:
+            response = chain(request)
+        assert response["X-Wagtail-Cache"] == "hit"
+
+    return per_op(run, rounds)
+
+
+def bench_miss(factory: RequestFactory, rounds: int) -> Dict[str, float]:
+    chain = UpdateCacheMiddleware(FetchFromCacheMiddleware(view))
+    requests = [factory.get(f"/miss/{i}/") for i in range(rounds)]
+    bare = per_op(lambda: [view(r) for r in requests], rounds)
+
+    def run():
+        for request in requests:
+            response = chain(request)
+        assert response["X-Wagtail-Cache"] == "miss"
+
+    miss = per_op(run, rounds)
+    return {"us_per_op": miss, "overhead_us": miss - bare}
+
+
+def fill_keyring(size: int) -> None:
+    cache = caches[wagtailcache_settings.WAGTAIL_CACHE_BACKEND]
+    get_keyring(cache).add_many(
+        (f"http://testserver/page/{i}/", f"key-{i}") for i in range(size)
+    )
+
+
+def bench_keyring_add(size: int, rounds: int) -> float:
+    fill_keyring(size)
+    keyring = get_keyring(caches[wagtailcache_settings.WAGTAIL_CACHE_BACKEND])
+
+    def run():
+        for i in range(rounds):
+            keyring.add(f"http://testserver/new/{i}/", f"new-{i}")
+
+    return per_op(run, rounds)
+
+
+def bench_clear(size: int, repeat: int, **kwargs) -> float:
+    total = 0.0
+    for _ in range(repeat):
+        clear_cache()
+        fill_keyring(size)
+        total += per_op(lambda: clear_cache(**kwargs), 1)
+    return total / repeat
+
+
+def bench_chop(
+    factory: RequestFactory, rounds: int, chop: Callable, **extra
+) -> float:
+    requests = [
+        factory.get(
+            "/?" + extra.get("qs", lambda i: "")(i),
+            HTTP_COOKIE=extra.get("cookie", ""),
+        )
+        for i in range(rounds)
+    ]
+    return per_op(lambda: [chop(r) for r in requests], rounds)
+
+
+def run(rounds: int) -> List[Dict]:
+    factory = RequestFactory()
+    results = []
+
+    def add(benchmark: str, backend: str = "", **values):
+        results.append({"benchmark": benchmark, "backend": backend, **values})
+        print(json.dumps(results[-1]), file=sys.stderr)
+
+    backends = get_backends()
+    for name, backend in backends.items():
+        with override_settings(
+            CACHES={**settings.CACHES, name: backend},
+            WAGTAIL_CACHE_BACKEND=name,
+        ):
+            caches[name].clear()
+            add("hit", name, us_per_op=bench_hit(factory, rounds))
+            add("miss", name, **bench_miss(factory, rounds))
+            with override_settings(WAGTAIL_CACHE_KEYRING=True):
+                for size in SIZES:
+                    caches[name].clear()
+                    add(
+                        "keyring_add",
+                        name,
+                        size=size,
+                        us_per_op=bench_keyring_add(size, rounds // 10),
+                    )
+                for size in SIZES:
+                    for kind, kwargs in [
+                        ("urls", {"urls": [r"^http://testserver/page/1\d*/$"]}),
+                        ("exact", {"exact": ["http://testserver/page/1/"]}),
+                        ("prefixes", {"prefixes": ["/page/1"]}),
+                    ]:
+                        add(
+                            f"clear_{kind}",
+                            name,
+                            size=size,
+                            us_per_op=bench_clear(size, 5, **kwargs),
+                        )
+            caches[name].clear()
+    for mix, qs in QUERYSTRINGS.items():
+        add(
+            "chop_querystring",
+            mix=mix,
+            us_per_op=bench_chop(factory, rounds, _chop_querystring, qs=qs),
+        )
+    for mix, cookie in COOKIES.items():
+        add(
+            "chop_cookies",
+            mix=mix,
+            us_per_op=bench_chop(factory, rounds, _chop_cookies, cookie=cookie),
+        )
+    return results
+
+
+def result_id(result: Dict) -> str:
+    return " ".join(
+        f"{value}"
+        for key, value in result.items()
+        if key not in ("us_per_op", "overhead_us") and value != ""
+    )
+
+
+def compare(baseline: List[Dict], results: List[Dict]) -> None:
+    """
+    Prints the change of each result from the baseline.
+    """
+    before = {result_id(r): r["us_per_op"] for r in baseline}
+    for result in results:
+        key = result_id(result)
+        if key in before:
+            change = result["us_per_op"] / before[key] - 1
+            print(
+                f"{key:<40} {before[key]:>10.1f} us {result['us_per_op']:>10.1f}"
+                f" us {change:>+8.1%}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rounds", type=int, default=ROUNDS)
+    parser.add_argument("--output", help="Write the results to this file.")
+    parser.add_argument(
+        "--compare", help="Compare to the results in this file."
+    )
+    args = parser.parse_args()
+    report = {
+        "versions": {
+            "python": platform.python_version(),
+            "django": django.__version__,
+            "wagtail": wagtail.__version__,
+            "wagtailcache": wagtailcache.__version__,
+        },
+        "rounds": args.rounds,
+        "results": run(args.rounds),
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f)["results"], report["results"])
+    elif not args.output:
+        print(json.dumps(report, indent=2))
@@ -0,0 +1,52 @@
+"""
+Compares the size and load time of a cached response pickled whole, as
+previous versions stored it, versus the compact format stored now.
+"""
+
+import pickle
+import timeit
+
+from django.template.response import TemplateResponse
+from django.test import RequestFactory
+
+from wagtailcache.serializers import decode_response
+from wagtailcache.serializers import encode_response
+
+
+ROUNDS = 5000
+
+
+def make_response(paragraphs: int) -> TemplateResponse:
+    request = RequestFactory().get("/")
+    response = TemplateResponse(
+        request,
+        "home/page.html",
+        {"page": {"title": "Benchmark", "description": "Lorem ipsum. " * 40}},
+    )
+    response.render()
+    # Pad the body out to a realistic page size.
+    response.content = response.content * paragraphs
+    response["Cache-Control"] = "max-age=3600"
+    response["Vary"] = "Cookie"
+    return response
+
+
+def bench(label: str, paragraphs: int) -> None:
+    response = make_response(paragraphs)
+    whole = pickle.dumps(response, pickle.HIGHEST_PROTOCOL)
+    compact = pickle.dumps(encode_response(response), pickle.HIGHEST_PROTOCOL)
+    t_whole = timeit.timeit(lambda: pickle.loads(whole), number=ROUNDS)
+    t_compact = timeit.timeit(
+        lambda: decode_response(pickle.loads(compact)), number=ROUNDS
+    )
+    print(
+        f"{label:>8}  "
+        f"pickled: {len(whole):>8} B {t_whole / ROUNDS * 1e6:>8.1f} us  "
+        f"compact: {len(compact):>8} B {t_compact / ROUNDS * 1e6:>8.1f} us"
+    )
+
+
+if __name__ == "__main__":
+    bench("small", 1)
+    bench("medium", 100)
+    bench("large", 500)
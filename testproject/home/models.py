@@ -19,6 +19,7 @@ class CachedPage(WagtailCacheMixin, Page):
     """
 
     template = "home/page.html"
+    cache_tags = ["cachedpage"]
 
 
 class CacheControlPage(WagtailCacheMixin, Page):
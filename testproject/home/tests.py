@@ -1,16 +1,47 @@
+import gzip
+import multiprocessing
+import os
+import socket
+import tempfile
+import threading
 import time
-
+import unittest
+import unittest.mock
+import zlib
+from collections import Counter
+from io import StringIO
+from typing import List
+
+import django
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.contrib.contenttypes.models import ContentType
 from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.base import BaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db.models.signals import post_init
+from django.http import HttpResponse
+from django.test import Client
+from django.test import RequestFactory
 from django.test import TestCase
 from django.test import modify_settings
 from django.test import override_settings
 from django.urls import reverse
+from django.utils.cache import patch_response_headers
+from django.utils.functional import SimpleLazyObject
 from wagtail import hooks
+from wagtail.images import get_image_model
+from wagtail.images.tests.utils import get_test_image_file
 from wagtail.models import PageViewRestriction
+from wagtail.models import Site
 
+from home import views
 from home.models import CacheControlPage
 from home.models import CachedPage
 from home.models import CallableCacheControlPage
@@ -18,9 +49,55 @@ from home.models import CookiePage
 from home.models import CsrfPage
 from home.models import WagtailPage
 from wagtailcache.cache import CacheControl
+from wagtailcache.cache import FetchFromCacheMiddleware
 from wagtailcache.cache import Status
+from wagtailcache.cache import UpdateCacheMiddleware
+from wagtailcache.cache import _chop_querystring
+from wagtailcache.cache import _get_request_key
+from wagtailcache.cache import _get_revalidate_executor
+from wagtailcache.cache import _get_stale_while_revalidate
 from wagtailcache.cache import clear_cache
+from wagtailcache.dependencies import _collector
+from wagtailcache.dependencies import collect
+from wagtailcache.dependencies import get_tag
+from wagtailcache.generations import CACHE_GENERATION_KEY
+from wagtailcache.hits import WINDOW
+from wagtailcache.hits import _bucket_key
+from wagtailcache.hits import _counter
+from wagtailcache.hits import get_hit_counts
+from wagtailcache.keyring import TAGS
+from wagtailcache.keyring import FileBasedKeyring
+from wagtailcache.keyring import Keyring
+from wagtailcache.keyring import RedisKeyring
+from wagtailcache.keyring import get_keyring
+from wagtailcache.keyring import lock
+from wagtailcache.local import GENERATION_KEY
+from wagtailcache.local import MISSING
+from wagtailcache.local import LocalCache
+from wagtailcache.local import cache_get
+from wagtailcache.local import get_local_cache
+from wagtailcache.metrics import LATENCY_BUCKETS
+from wagtailcache.metrics import Histogram
+from wagtailcache.metrics import _metrics
+from wagtailcache.metrics import flush_metrics
+from wagtailcache.metrics import get_metrics
+from wagtailcache.purge import PENDING_KEY
+from wagtailcache.purge import Purge
+from wagtailcache.purge import drain_purges
+from wagtailcache.purge import enqueue_purge
+from wagtailcache.rules import Rules
+from wagtailcache.rules import get_hooks
+from wagtailcache.serializers import decode_response
+from wagtailcache.serializers import encode_response
+from wagtailcache.serializers import is_encoded_response
 from wagtailcache.settings import wagtailcache_settings
+from wagtailcache.urlindex import UrlIndex
+from wagtailcache.urlindex import compile_pattern
+from wagtailcache.warm import Warmer
+from wagtailcache.warm import _get_rewarm_executor
+from wagtailcache.warm import get_page_urls
+from wagtailcache.warm import prioritize
+from wagtailcache.warm import warm_cache
 
 
 def hook_true(obj, is_cacheable: bool) -> bool:
@@ -35,6 +112,37 @@ def hook_any(obj, is_cacheable: bool):
     return obj
 
 
+try:
+    import fakeredis
+    from django.core.cache.backends.redis import RedisCache
+except ImportError:  # Django < 4.0
+    fakeredis = None
+
+
+class AsyncLocMemCache(LocMemCache):
+    """
+    A backend which implements the async cache API itself.
+    """
+
+    async def aget(self, key, default=None, version=None):
+        return self.get(key, default, version)
+
+    async def aset(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set(key, value, timeout, version)
+
+
+def fill_keyring(keyring: Keyring, worker: int, count: int) -> None:
+    # Pile every worker onto the same few URLs to maximize contention.
+    for i in range(count):
+        keyring.add(
+            "http://testserver/%d/" % (i % 4), "key-%d-%d" % (worker, i)
+        )
+
+
+def fill_file_keyring(location: str, worker: int, count: int) -> None:
+    fill_keyring(get_keyring(FileBasedCache(location, {})), worker, count)
+
+
 class WagtailCacheTest(TestCase):
     @classmethod
     def get_content_type(cls, modelname: str):
@@ -124,6 +232,7 @@ class WagtailCacheTest(TestCase):
 
     def tearDown(self):
         # Clear the cache and log out between each test.
+        drain_purges()
         clear_cache()
         self.client.logout()
         # Delete any hooks.
@@ -135,6 +244,10 @@ class WagtailCacheTest(TestCase):
             del hooks._hooks["is_response_cacheable"]
         except KeyError:
             pass
+        try:
+            del hooks._hooks["get_cache_tags"]
+        except KeyError:
+            pass
 
     # --- UTILITIES ------------------------------------------------------------
 
@@ -290,6 +403,53 @@ class WagtailCacheTest(TestCase):
             self.head_hit(page.get_url() + "?valid=0&utm_code=0")
             self.get_hit(page.get_url() + "?valid=0&utm_code=0")
 
+    def test_chop_querystring(self):
+        rf = RequestFactory()
+        # Nothing ignored, the request is returned untouched.
+        r = _chop_querystring(rf.get("/", QUERY_STRING="valid=0&b"))
+        self.assertEqual(r.META["QUERY_STRING"], "valid=0&b")
+        # Ignored querystrings are removed.
+        r = _chop_querystring(
+            rf.get("/", QUERY_STRING="utm_code=0&valid=0&gclid=1&_ga=2")
+        )
+        self.assertEqual(r.META["QUERY_STRING"], "valid=0")
+        self.assertEqual(list(r.GET), ["valid"])
+        # Repeated querystrings are served from the memo.
+        r = _chop_querystring(
+            rf.get("/", QUERY_STRING="utm_code=0&valid=0&gclid=1&_ga=2")
+        )
+        self.assertEqual(r.META["QUERY_STRING"], "valid=0")
+        # Changing the setting takes effect immediately.
+        with override_settings(WAGTAIL_CACHE_IGNORE_QS=[r"^valid$"]):
+            r = _chop_querystring(
+                rf.get("/", QUERY_STRING="utm_code=0&valid=0")
+            )
+            self.assertEqual(r.META["QUERY_STRING"], "utm_code=0")
+        # Patterns that cannot be combined still work.
+        with override_settings(WAGTAIL_CACHE_IGNORE_QS=[r"(?i)^x$", r"^y$"]):
+            r = _chop_querystring(rf.get("/", QUERY_STRING="X=0&y=1&z=2"))
+            self.assertEqual(r.META["QUERY_STRING"], "z=2")
+        with override_settings(WAGTAIL_CACHE_IGNORE_QS=None):
+            r = _chop_querystring(rf.get("/", QUERY_STRING="utm_code=0"))
+            self.assertEqual(r.META["QUERY_STRING"], "utm_code=0")
+
+    @override_settings(WAGTAIL_CACHE_KEYRING=True)
+    def test_request_key(self):
+        # The key is computed once per request and shared by both middlewares.
+        url = self.page_cachedpage.get_url()
+        response = self.get_miss(url + "?utm_code=0&valid=0")
+        key = response.wsgi_request._wagtailcache_key
+        self.assertEqual(key.uri, "http://testserver" + url + "?valid=0")
+        self.assertEqual(
+            get_keyring(self.cache).get(key.uri),
+            [key.cache_key],
+        )
+        # The same key is found when fetching.
+        response = self.get_hit(url + "?valid=0")
+        hit_key = response.wsgi_request._wagtailcache_key
+        self.assertEqual(hit_key.cache_key, key.cache_key)
+        self.assertEqual(hit_key.header_key, key.header_key)
+
     @override_settings(WAGTAIL_CACHE_IGNORE_COOKIES=False)
     def test_cookie_page(self):
         # First request should skip, since the cookie is being set.
@@ -472,6 +632,37 @@ class WagtailCacheTest(TestCase):
     def test_page_404_without_auth(self):
         self.test_page_404()
 
+    @override_settings(WAGTAIL_CACHE_METRICS=True)
+    def test_bypass(self):
+        self.start_metrics()
+        with unittest.mock.patch(
+            "wagtailcache.cache._get_cache_key"
+        ) as get_cache_key:
+            for url in ["/static/a.css", "/media/b.png", "/admin/login/"]:
+                for _ in range(2):
+                    response = self.client.get(url)
+                    self.assertEqual(
+                        response[self.header_name], Status.SKIP.value
+                    )
+                    # Cache-Control is left to the view.
+                    self.assertNotEqual(
+                        response.get("Cache-Control"),
+                        CacheControl.NOCACHE.value,
+                    )
+        get_cache_key.assert_not_called()
+        self.assertEqual(get_metrics().counters["skip"], 6)
+
+    def test_bypass_prefixes(self):
+        with override_settings(WAGTAIL_CACHE_BYPASS_PREFIXES=["/gimme-"]):
+            for _ in range(2):
+                response = self.client.get("/gimme-a-404/")
+                self.assertEqual(response[self.header_name], Status.SKIP.value)
+            self.get_miss(self.page_cachedpage.get_url())
+        # An empty list turns off the bypass.
+        with override_settings(WAGTAIL_CACHE_BYPASS_PREFIXES=[]):
+            self.get_miss("/static/a.css")
+            self.get_hit("/static/a.css")
+
     # ---- TEST VIEWS ----------------------------------------------------------
 
     # Views use the decorators and should work without the middleware.
@@ -541,14 +732,146 @@ class WagtailCacheTest(TestCase):
     @override_settings(WAGTAIL_CACHE_KEYRING=True)
     def test_cache_keyring(self):
         # Check if keyring is not present
-        self.assertEqual(self.cache.get("keyring"), None)
+        keyring = Keyring(self.cache)
+        self.assertFalse(keyring.exists())
         # Get should hit cache.
         self.get_miss(self.page_cachedpage.get_url())
         # Get first key from keyring
-        key = next(iter(self.cache.get("keyring")))
+        key = next(iter(keyring.as_dict()))
         url = "http://%s%s" % ("testserver", self.page_cachedpage.get_url())
         # Compare Keys
         self.assertEqual(key, url)
+        # Only the bucket for this URL should have been written.
+        self.assertIsNotNone(self.cache.get(keyring.bucket_key(url)))
+        self.assertEqual(len(self.cache.get("keyring:manifest")), 1)
+        self.assertIsNone(self.cache.get("keyring"))
+
+    @override_settings(WAGTAIL_CACHE_KEYRING=True)
+    def test_cache_keyring_migrate(self):
+        # Populate a keyring in the old single-entry format.
+        self.get_miss(self.page_cachedpage.get_url())
+        url = "http://%s%s" % ("testserver", self.page_cachedpage.get_url())
+        keyring = Keyring(self.cache)
+        entries = keyring.get(url)
+        self.cache.clear()
+        self.cache.set("keyring", {url: entries, "http://testserver/x/": []})
+        # Reading the keyring moves it into buckets.
+        self.assertTrue(keyring.exists())
+        self.assertEqual(keyring.as_dict()[url], entries)
+        self.assertIsNone(self.cache.get("keyring"))
+        self.assertEqual(keyring.get(url), entries)
+
+    @override_settings(WAGTAIL_CACHE_KEYRING=True)
+    def test_cache_keyring_expiry(self):
+        keyring = Keyring(self.cache)
+        response = self.get_miss(self.page_cachedpage.get_url())
+        key = response.wsgi_request._wagtailcache_key
+        # Each key is recorded with when it expires from the cache.
+        bucket = self.cache.get(keyring.bucket_key(key.uri))
+        expires = bucket[key.uri][key.cache_key]
+        self.assertAlmostEqual(
+            expires, time.time() + self.cache.default_timeout, delta=5
+        )
+        # Expired keys are not returned, and are pruned on the next update.
+        keyring.add(key.uri, "expired", timeout=0)
+        keyring.add("http://testserver/never/", "never", timeout=None)
+        self.assertEqual(keyring.get(key.uri), [key.cache_key])
+        bucket = self.cache.get(keyring.bucket_key(key.uri))
+        self.assertNotIn("expired", bucket[key.uri])
+        # A bucket is kept until its last key expires.
+        keyring.add("http://testserver/gone/", "gone", timeout=0)
+        self.assertEqual(keyring.get("http://testserver/gone/"), [])
+
+    @override_settings(
+        WAGTAIL_CACHE_KEYRING=True,
+        WAGTAIL_CACHE_KEYRING_BUCKETS=1,
+        WAGTAIL_CACHE_KEYRING_MAX_SIZE=2,
+    )
+    def test_cache_keyring_max_size(self):
+        urls = [
+            self.page_cachedpage.get_url(),
+            self.page_wagtailpage.get_url(),
+            reverse("cached_view"),
+        ]
+        self.get_miss(urls[0])
+        self.get_miss(urls[1])
+        # Storing the first page again makes it the most recently stored.
+        keyring = Keyring(self.cache)
+        keyring.add("http://testserver" + urls[0], "again")
+        self.get_miss(urls[2])
+        # The least recently stored URL is evicted, along with its page.
+        self.assertEqual(
+            set(keyring.as_dict()),
+            {"http://testserver" + urls[0], "http://testserver" + urls[2]},
+        )
+        self.get_hit(urls[0])
+        self.get_miss(urls[1])
+
+    @override_settings(WAGTAIL_CACHE_KEYRING=True)
+    def test_cache_keyring_compact(self):
+        keyring = Keyring(self.cache)
+        tags = get_keyring(self.cache, TAGS)
+        expired = time.time() - 1
+        # Keys which have expired since they were added.
+        for ring, entries in [
+            (keyring, {"http://testserver/a/": {"a1": expired, "a2": None}}),
+            (keyring, {"http://testserver/b/": {"b1": expired}}),
+            (tags, {"tag": {"a1": expired}}),
+        ]:
+            bucket_key = ring.bucket_key(next(iter(entries)))
+            with ring.lock(bucket_key):
+                ring._save_buckets({bucket_key: entries})
+        out = StringIO()
+        call_command("compact_wagtail_cache_keyring", stdout=out)
+        self.assertEqual(
+            out.getvalue().splitlines(),
+            ["Removed 2 key(s) from keyring.", "Removed 1 key(s) from tags."],
+        )
+        self.assertEqual(keyring.as_dict(), {"http://testserver/a/": ["a2"]})
+        # Empty buckets are removed from the manifest.
+        self.assertEqual(
+            self.cache.get("keyring:manifest"),
+            {keyring.bucket_key("http://testserver/a/")},
+        )
+        self.assertEqual(keyring.compact(), 0)
+
+    @unittest.skipIf(fakeredis is None, "RedisCache needs Django >= 4.0")
+    @override_settings(
+        WAGTAIL_CACHE_KEYRING_BUCKETS=1, WAGTAIL_CACHE_KEYRING_MAX_SIZE=2
+    )
+    def test_cache_keyring_redis_expiry(self):
+        cache = RedisCache(
+            "redis://localhost:6379",
+            {"OPTIONS": {"connection_class": fakeredis.FakeRedisConnection}},
+        )
+        cache.clear()
+        self.addCleanup(cache.clear)
+        keyring = get_keyring(cache)
+        client = keyring._client()
+        bucket = keyring._key(keyring.bucket_key("http://testserver/"))
+        keyring.add("http://testserver/a/", "a1", timeout=60)
+        self.assertAlmostEqual(client.ttl(bucket), 60, delta=2)
+        # The bucket is kept until its last key expires.
+        keyring.add("http://testserver/b/", "b1", timeout=30)
+        self.assertAlmostEqual(client.ttl(bucket), 60, delta=2)
+        # The key which expires soonest is evicted, along with its page.
+        cache.set("b1", "page")
+        keyring.add("http://testserver/c/", "c1", timeout=None)
+        self.assertEqual(client.ttl(bucket), -1)
+        self.assertNotIn("b1", cache)
+        self.assertEqual(
+            set(keyring.as_dict()),
+            {"http://testserver/a/", "http://testserver/c/"},
+        )
+        # Expired keys are not returned, and are removed by ``compact()``.
+        client.zadd(bucket, {"http://testserver/e/\x00e1": time.time() - 1})
+        self.assertEqual(keyring.get("http://testserver/e/"), [])
+        self.assertEqual(keyring.compact(), 1)
+        self.assertEqual(client.zcard(bucket), 2)
+        # Clearing removes the buckets.
+        keyring.clear()
+        self.assertFalse(keyring.exists())
+        self.assertEqual(client.exists(bucket), 0)
 
     @override_settings(
         WAGTAIL_CACHE_BACKEND="one_second", WAGTAIL_CACHE_KEYRING=True
@@ -566,8 +889,8 @@ class WagtailCacheTest(TestCase):
         self.get_miss(self.page_cachedpage.get_url())
         # Check the keyring does not contain duplicate uri_keys
         url = "http://%s%s" % ("testserver", self.page_cachedpage.get_url())
-        keyring = self.cache.get("keyring")
-        self.assertEqual(len(keyring.get(url, [])), 1)
+        keyring = Keyring(self.cache)
+        self.assertEqual(len(keyring.get(url)), 1)
 
     def test_clear_cache(self):
         # First get should miss cache.
@@ -599,6 +922,1171 @@ class WagtailCacheTest(TestCase):
         self.get_hit(u1)
         self.get_miss(u2)
 
+    @override_settings(WAGTAIL_CACHE_KEYRING=True)
+    def test_clear_cache_exact_and_prefixes(self):
+        page_url = self.page_cachedpage.get_url()
+        view_url = reverse("cached_view")
+        urls = [page_url, page_url + "?p=1", view_url]
+        for url in urls:
+            self.get_miss(url)
+        # An absolute URL is cleared without reading the keyring.
+        with unittest.mock.patch.object(Keyring, "items") as items:
+            clear_cache(exact=["http://testserver" + page_url + "?p=1"])
+            items.assert_not_called()
+        self.get_hit(page_url)
+        self.get_miss(page_url + "?p=1")
+        # Paths are cleared from every host.
+        clear_cache(exact=[view_url])
+        self.get_hit(page_url)
+        self.get_miss(view_url)
+        clear_cache(prefixes=[page_url])
+        self.get_miss(page_url)
+        self.get_miss(page_url + "?p=1")
+        self.get_hit(view_url)
+
+    @override_settings(WAGTAIL_CACHE_KEYRING=True, WAGTAIL_CACHE_BATCH_SIZE=2)
+    def test_clear_cache_batched(self):
+        page_url = self.page_cachedpage.get_url()
+        urls = [page_url + "?p=%d" % i for i in range(5)]
+        for url in urls:
+            self.get_miss(url)
+        # Entries are deleted in batches rather than one at a time.
+        with unittest.mock.patch.object(
+            LocMemCache,
+            "delete_many",
+            autospec=True,
+            side_effect=LocMemCache.delete_many,
+        ) as delete_many:
+            clear_cache(prefixes=[page_url + "?p="])
+        batches = [
+            len(call.args[1])
+            for call in delete_many.call_args_list
+            if not call.args[1][0].startswith("keyring:")
+        ]
+        self.assertEqual(batches, [2, 2, 1])
+        for url in urls:
+            self.get_miss(url)
+
+    @override_settings(WAGTAIL_CACHE_KEYRING=True)
+    def test_cache_keyring_class(self):
+        self.assertIs(type(get_keyring(self.cache)), Keyring)
+        with tempfile.TemporaryDirectory() as location:
+            keyring = get_keyring(FileBasedCache(location, {}))
+            self.assertIs(type(keyring), FileBasedKeyring)
+        with override_settings(
+            WAGTAIL_CACHE_KEYRING_CLASS="wagtailcache.keyring.FileBasedKeyring"
+        ):
+            self.assertIs(type(get_keyring(self.cache)), FileBasedKeyring)
+
+    def test_lock(self):
+        with lock(self.cache, "key"):
+            self.assertIn("key:lock", self.cache)
+        self.assertNotIn("key:lock", self.cache)
+        # ``FileBasedCache`` is locked with files, as its ``add()`` is not
+        # atomic across processes.
+        with tempfile.TemporaryDirectory() as location:
+            cache = FileBasedCache(location, {})
+            path = cache._key_to_file("key") + ".lock"
+            with lock(cache, "key"):
+                self.assertTrue(os.path.exists(path))
+                self.assertNotIn("key:lock", cache)
+            self.assertFalse(os.path.exists(path))
+
+    def test_file_based_keyring_lock_timeout(self):
+        with tempfile.TemporaryDirectory() as location:
+            keyring = FileBasedKeyring(FileBasedCache(location, {}))
+            keyring.lock_timeout = 0.1
+            path = keyring.cache._key_to_file("key") + ".lock"
+            with keyring.lock("key"):
+                with open(path, "rb") as f:
+                    first = f.read()
+                # The lock is taken over once it times out.
+                with keyring.lock("key"):
+                    with open(path, "rb") as f:
+                        self.assertNotEqual(f.read(), first)
+                # Another process takes the lock after the takeover ends.
+                with open(path, "wb") as f:
+                    f.write(b"third")
+            # Releasing the first lock does not remove the other's lock.
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(), b"third")
+
+    # ---- STORAGE FORMAT ------------------------------------------------------
+
+    def test_cached_response_format(self):
+        url = reverse("template_response_view")
+        response = self.get_miss(url)
+        cache_key = response.wsgi_request._wagtailcache_key.cache_key
+        # Responses are stored in the compact format.
+        stored = self.cache.get(cache_key)
+        self.assertTrue(is_encoded_response(stored))
+        hit = self.get_hit(url)
+        self.assertEqual(hit.content, response.content)
+        self.assertEqual(hit["Content-Type"], response["Content-Type"])
+        # Responses pickled whole by previous versions are still served.
+        self.cache.set(cache_key, HttpResponse("legacy"))
+        hit = self.get_hit(url)
+        self.assertEqual(hit.content, b"legacy")
+
+    def test_encode_response(self):
+        response = HttpResponse(b"body", status=404, reason="Gone Fishing")
+        response["X-Custom"] = "value"
+        response.set_cookie("c_is_for", "cookie", max_age=60, httponly=True)
+        decoded = decode_response(encode_response(response))
+        self.assertEqual(decoded.status_code, 404)
+        self.assertEqual(decoded.reason_phrase, "Gone Fishing")
+        self.assertEqual(decoded.content, b"body")
+        self.assertEqual(list(decoded.items()), list(response.items()))
+        self.assertEqual(decoded.cookies.output(), response.cookies.output())
+        self.assertFalse(is_encoded_response(response))
+
+    @override_settings(
+        WAGTAIL_CACHE_COMPRESS="gzip", WAGTAIL_CACHE_COMPRESS_MIN_SIZE=0
+    )
+    def test_compress(self):
+        url = self.page_cachedpage.get_url()
+        response = self.get_miss(url)
+        plain = response.content
+        cache_key = response.wsgi_request._wagtailcache_key.cache_key
+        stored = self.cache.get(cache_key)
+        self.assertEqual(stored[7], "gzip")
+        self.assertEqual(gzip.decompress(stored[5]), plain)
+        # Clients which do not accept gzip get the decompressed body.
+        response = self.get_hit(url)
+        self.assertEqual(response.content, plain)
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertIn("Accept-Encoding", response["Vary"])
+        # Clients which accept gzip get the compressed body directly.
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip, br")
+        self.assertEqual(response[self.header_name], Status.HIT.value)
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(response.content), plain)
+        self.assertIn("Accept-Encoding", response["Vary"])
+
+    @override_settings(
+        WAGTAIL_CACHE_COMPRESS="zlib", WAGTAIL_CACHE_COMPRESS_MIN_SIZE=10**6
+    )
+    def test_compress_min_size(self):
+        # Bodies under the minimum size are not compressed.
+        response = self.get_miss(self.page_cachedpage.get_url())
+        cache_key = response.wsgi_request._wagtailcache_key.cache_key
+        self.assertIsNone(self.cache.get(cache_key)[7])
+        response = self.get_hit(self.page_cachedpage.get_url())
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+    @override_settings(
+        WAGTAIL_CACHE_COMPRESS="wagtailcache.codecs.ZlibCodec",
+        WAGTAIL_CACHE_COMPRESS_MIN_SIZE=0,
+    )
+    def test_compress_custom_codec(self):
+        url = self.page_cachedpage.get_url()
+        plain = self.get_miss(url).content
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING="deflate")
+        self.assertEqual(response["Content-Encoding"], "deflate")
+        self.assertEqual(self.get_hit(url).content, plain)
+
+    @override_settings(
+        WAGTAIL_CACHE_ENCODINGS=["gzip", "zlib"],
+        WAGTAIL_CACHE_COMPRESS_MIN_SIZE=0,
+    )
+    def test_encodings(self):
+        url = self.page_cachedpage.get_url()
+        plain = self.get_miss(url).content
+        cases = [
+            ("", None),
+            ("gzip", "gzip"),
+            ("deflate", "deflate"),
+            ("gzip, deflate, br", "gzip"),
+            ("gzip;q=0.5, deflate", "deflate"),
+            ("gzip;q=0, identity", None),
+            ("*", "gzip"),
+        ]
+        for accept, encoding in cases:
+            response = self.client.get(url, HTTP_ACCEPT_ENCODING=accept)
+            self.assertEqual(response[self.header_name], Status.HIT.value)
+            self.assertEqual(response.get("Content-Encoding"), encoding)
+            self.assertIn("Accept-Encoding", response["Vary"])
+            content = response.content
+            if encoding == "gzip":
+                content = gzip.decompress(content)
+            elif encoding == "deflate":
+                content = zlib.decompress(content)
+            self.assertEqual(content, plain)
+
+    def test_encodings_vary(self):
+        # Normally each Accept-Encoding is cached separately.
+        url = reverse("vary_encoding_view")
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response[self.header_name], Status.MISS.value)
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING="br")
+        self.assertEqual(response[self.header_name], Status.MISS.value)
+        # When wagtail-cache negotiates the encoding, they share an entry.
+        clear_cache()
+        with override_settings(WAGTAIL_CACHE_ENCODINGS=["gzip"]):
+            response = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip")
+            self.assertEqual(response[self.header_name], Status.MISS.value)
+            response = self.client.get(url, HTTP_ACCEPT_ENCODING="br")
+            self.assertEqual(response[self.header_name], Status.HIT.value)
+            self.assertFalse(response.has_header("Content-Encoding"))
+            response = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip")
+            self.assertEqual(response["Content-Encoding"], "gzip")
+
+    # ---- STALE-WHILE-REVALIDATE ----------------------------------------------
+
+    def test_stale_while_revalidate_header(self):
+        cases = [
+            ("max-age=60", 0),
+            ("max-age=60, stale-while-revalidate=30", 30),
+            ("Stale-While-Revalidate=30, public", 30),
+            ("stale-while-revalidate=nope", 0),
+        ]
+        for cache_control, stale in cases:
+            response = HttpResponse(headers={"Cache-Control": cache_control})
+            self.assertEqual(_get_stale_while_revalidate(response), stale)
+        with override_settings(WAGTAIL_CACHE_STALE_WHILE_REVALIDATE=10):
+            response = HttpResponse(headers={"Cache-Control": "max-age=60"})
+            self.assertEqual(_get_stale_while_revalidate(response), 10)
+
+    def test_stale_while_revalidate(self):
+        url = reverse("stale_view")
+        first = self.get_miss(url).content
+        self.assertEqual(self.get_hit(url).content, first)
+        time.sleep(1.1)
+        # The first request to find the response stale re-renders it.
+        second = self.get_miss(url).content
+        self.assertNotEqual(second, first)
+        self.assertEqual(self.get_hit(url).content, second)
+
+    @override_settings(WAGTAIL_CACHE_REVALIDATE_WORKERS=1)
+    def test_stale_while_revalidate_background(self):
+        url = reverse("stale_view")
+        first = self.get_miss(url).content
+        time.sleep(1.1)
+        # The stale response is served while a worker re-renders it.
+        response = self.client.get(url)
+        self.assertEqual(response[self.header_name], Status.STALE.value)
+        self.assertEqual(response.content, first)
+        # Wait for the worker.
+        _get_revalidate_executor().submit(lambda: None).result()
+        second = self.get_hit(url).content
+        self.assertNotEqual(second, first)
+
+    @override_settings(
+        WAGTAIL_CACHE_REVALIDATE_WORKERS=1,
+        WAGTAIL_CACHE_TIMING=["header"],
+        WAGTAIL_CACHE_TRACK_DEPENDENCIES=True,
+    )
+    def test_stale_while_revalidate_background_request(self):
+        url = reverse("stale_view")
+        first = self.get_miss(url).content
+        time.sleep(1.1)
+        submitted = []
+        executor = unittest.mock.Mock()
+        executor.submit = lambda *args: submitted.append(args)
+        with unittest.mock.patch(
+            "wagtailcache.cache._get_revalidate_executor",
+            return_value=executor,
+        ):
+            response = self.client.get(url)
+        self.assertEqual(response[self.header_name], Status.STALE.value)
+        self.assertIn("Server-Timing", response)
+        # The background render does not share state with the request.
+        render, background = submitted[0]
+        self.assertIsNot(background.META, response.wsgi_request.META)
+        self.assertFalse(hasattr(background, "_wagtailcache_timings"))
+        self.assertFalse(hasattr(background, "_wagtailcache_key"))
+        render(background)
+        self.assertNotEqual(self.get_hit(url).content, first)
+
+    # ---- MISS LOCK -----------------------------------------------------------
+
+    def get_concurrently(self, url: str, count: int):
+        responses = []
+
+        def get():
+            responses.append(Client().get(url))
+
+        threads = [threading.Thread(target=get) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return responses
+
+    def test_miss_lock_off(self):
+        views.slow_view_renders = 0
+        self.get_concurrently(reverse("slow_view"), 4)
+        self.assertEqual(views.slow_view_renders, 4)
+
+    @override_settings(WAGTAIL_CACHE_MISS_LOCK=True)
+    def test_miss_lock(self):
+        views.slow_view_renders = 0
+        responses = self.get_concurrently(reverse("slow_view"), 4)
+        # Only one request renders the page, the others wait for it.
+        self.assertEqual(views.slow_view_renders, 1)
+        statuses = sorted(r[self.header_name] for r in responses)
+        self.assertEqual(statuses, ["hit", "hit", "hit", "miss"])
+        for response in responses:
+            self.assertEqual(
+                response[self.header_name] == Status.HIT.value,
+                response.has_header(self.header_name + "-Lock-Waits"),
+            )
+        # The lock is released.
+        self.get_hit(reverse("slow_view"))
+        self.assertEqual(views.slow_view_renders, 1)
+
+    @override_settings(WAGTAIL_CACHE_MISS_LOCK=True)
+    def test_miss_lock_uncacheable(self):
+        url = reverse("slow_private_view")
+        self.assertEqual(
+            self.client.get(url)[self.header_name], Status.SKIP.value
+        )
+        # Once the response is known to be uncacheable, requests for the URL
+        # are rendered at once rather than queueing behind the lock.
+        for response in self.get_concurrently(url, 4):
+            self.assertEqual(response[self.header_name], Status.SKIP.value)
+            self.assertFalse(
+                response.has_header(self.header_name + "-Lock-Waits")
+            )
+
+    @override_settings(
+        WAGTAIL_CACHE_MISS_LOCK=True, WAGTAIL_CACHE_MISS_LOCK_TIMEOUT=0.2
+    )
+    def test_miss_lock_timeout(self):
+        url = reverse("cached_view")
+        request = RequestFactory().get(url)
+        lock_key = _get_request_key(request).header_key + ".lock"
+        self.cache.add(lock_key, True, 60)
+        # Gives up waiting for the lock, and renders the page.
+        response = self.get_miss(url)
+        self.assertTrue(int(response[self.header_name + "-Lock-Waits"]) > 1)
+
+    # ---- DEPENDENCIES --------------------------------------------------------
+
+    def get_tagged(self, tag: str) -> List[str]:
+        return get_keyring(self.cache, TAGS).get(tag)
+
+    def test_dependencies_off(self):
+        page = CachedPage.objects.get(pk=self.page_cachedpage.pk)
+        self.get_miss(self.page_cachedpage.get_url())
+        tag = get_tag(self.page_cachedpage)
+        self.assertEqual(self.get_tagged(tag), [])
+        page.save_revision().publish()
+        self.get_hit(self.page_cachedpage.get_url())
+
+    def test_dependencies_signals(self):
+        # Creating models costs no signal when dependencies are not tracked.
+        self.assertFalse(post_init.has_listeners(User))
+        with override_settings(WAGTAIL_CACHE_TRACK_DEPENDENCIES=True):
+            self.assertTrue(post_init.has_listeners(User))
+        self.assertFalse(post_init.has_listeners(User))
+
+    @override_settings(WAGTAIL_CACHE_TRACK_DEPENDENCIES=True)
+    def test_dependencies_page(self):
+        page = CachedPage.objects.get(pk=self.page_cachedpage.pk)
+        page_url = self.page_cachedpage.get_url()
+        view_url = reverse("cached_view")
+        self.get_miss(page_url)
+        self.get_miss(view_url)
+        self.assertEqual(len(self.get_tagged(get_tag(self.page_cachedpage))), 1)
+        # Only responses which depend on the published page are cleared.
+        page.save_revision().publish()
+        drain_purges()
+        self.assertEqual(self.get_tagged(get_tag(self.page_cachedpage)), [])
+        self.get_miss(page_url)
+        self.get_hit(view_url)
+        # Saving a draft does not clear anything.
+        page.save_revision()
+        self.get_hit(page_url)
+        page.unpublish()
+        drain_purges()
+        self.assertEqual(self.client.get(page_url).status_code, 404)
+
+    @override_settings(WAGTAIL_CACHE_TRACK_DEPENDENCIES=True)
+    def test_dependencies_ancestors(self):
+        home = WagtailPage.objects.get(pk=self.page_wagtailpage.pk)
+        children = [self.page_cachedpage]
+        for i in range(2):
+            children.append(
+                home.add_child(
+                    instance=CachedPage(
+                        title="Child",
+                        slug=f"child-{i}",
+                        content_type=self.get_content_type("cachedpage"),
+                    )
+                )
+            )
+        for page in children:
+            self.get_miss(page.get_url())
+            self.assertEqual(len(self.get_tagged(get_tag(page))), 1)
+        # The pages loaded to route each request are not dependencies.
+        self.assertEqual(self.get_tagged(get_tag(home)), [])
+        self.assertEqual(self.get_tagged(get_tag(home.get_parent())), [])
+        self.get_miss(home.get_url())
+        self.assertEqual(len(self.get_tagged(get_tag(home))), 1)
+        # Publishing the home page only clears the home page.
+        home.save_revision().publish()
+        drain_purges()
+        self.get_miss(home.get_url())
+        for page in children:
+            self.get_hit(page.get_url())
+
+    def test_dependencies_snippet(self):
+        self.assertIsNone(get_tag(self.user))
+        with unittest.mock.patch(
+            "wagtail.snippets.models.SNIPPET_MODELS", [User]
+        ):
+            self.assertEqual(get_tag(self.user), f"auth.user:{self.user.pk}")
+
+    @override_settings(WAGTAIL_CACHE_TRACK_DEPENDENCIES=True)
+    def test_dependencies_template_response(self):
+        url = reverse("template_response_view")
+        self.get_miss(url)
+        self.get_hit(url)
+        # The view loads no pages, so publishing one does not clear it.
+        page = CachedPage.objects.get(pk=self.page_cachedpage.pk)
+        page.save_revision().publish()
+        drain_purges()
+        self.get_hit(url)
+
+    @override_settings(WAGTAIL_CACHE_TRACK_DEPENDENCIES=True)
+    def test_dependencies_image(self):
+        backend = "django.core.files.storage.FileSystemStorage"
+        with tempfile.TemporaryDirectory() as media_root:
+            # ``STORAGES`` replaced ``DEFAULT_FILE_STORAGE`` in Django 4.2.
+            if django.VERSION >= (4, 2):
+                default = {
+                    "BACKEND": backend,
+                    "OPTIONS": {"location": media_root},
+                }
+                storages = {
+                    "STORAGES": {**settings.STORAGES, "default": default}
+                }
+            else:
+                storages = {
+                    "DEFAULT_FILE_STORAGE": backend,
+                    "MEDIA_ROOT": media_root,
+                }
+            with override_settings(**storages):
+                image = get_image_model().objects.create(
+                    title="Before", file=get_test_image_file()
+                )
+                url = reverse("image_view")
+                self.assertEqual(self.get_miss(url).content, b"Before")
+                self.assertEqual(self.get_hit(url).content, b"Before")
+                self.assertEqual(len(self.get_tagged(get_tag(image))), 1)
+                image.title = "After"
+                image.save()
+                drain_purges()
+                self.assertEqual(self.get_miss(url).content, b"After")
+                image.delete()
+                drain_purges()
+                self.assertEqual(self.get_miss(url).content, b"")
+
+    # ---- TAGS ----------------------------------------------------------------
+
+    def test_clear_cache_tags(self):
+        tagged_url = reverse("tagged_view")
+        page_url = self.page_cachedpage.get_url()
+        view_url = reverse("cached_view")
+        for url in [tagged_url, page_url, view_url]:
+            self.get_miss(url)
+            self.get_hit(url)
+        # Only responses with the tag are cleared.
+        clear_cache(tags=["featured"])
+        self.get_miss(tagged_url)
+        self.get_hit(page_url)
+        self.get_hit(view_url)
+        # Tags from ``WagtailCacheMixin.cache_tags``.
+        clear_cache(tags=["cachedpage", "unknown"])
+        self.get_hit(tagged_url)
+        self.get_miss(page_url)
+        self.get_hit(view_url)
+        # URLs and tags together.
+        clear_cache(urls=[view_url], tags=["news"])
+        self.get_miss(tagged_url)
+        self.get_miss(page_url)
+        self.get_miss(view_url)
+
+    def test_cache_tags_hook(self):
+        def hook(request, response):
+            if request.path == reverse("cached_view"):
+                return ["hooked"]
+
+        hooks.register("get_cache_tags", hook)
+        url = reverse("cached_view")
+        self.get_miss(url)
+        clear_cache(tags=["hooked"])
+        self.get_miss(url)
+        self.get_hit(url)
+
+    def test_cache_tags_header(self):
+        url = reverse("tagged_view")
+        self.assertFalse(self.get_miss(url).has_header("Surrogate-Key"))
+        clear_cache()
+        with override_settings(WAGTAIL_CACHE_TAGS_HEADER="Surrogate-Key"):
+            self.assertEqual(
+                self.get_miss(url)["Surrogate-Key"], "featured news"
+            )
+            self.assertEqual(
+                self.get_hit(url)["Surrogate-Key"], "featured news"
+            )
+        clear_cache()
+        with override_settings(WAGTAIL_CACHE_TAGS_HEADER="Cache-Tag"):
+            self.assertEqual(self.get_miss(url)["Cache-Tag"], "featured,news")
+
+    @override_settings(
+        WAGTAIL_CACHE_TRACK_DEPENDENCIES=True,
+        WAGTAIL_CACHE_TAGS_HEADER="Cache-Tag",
+    )
+    def test_cache_tags_dependencies(self):
+        response = self.get_miss(self.page_cachedpage.get_url())
+        tags = response["Cache-Tag"].split(",")
+        self.assertIn("cachedpage", tags)
+        self.assertIn(get_tag(self.page_cachedpage), tags)
+        clear_cache(tags=[get_tag(self.page_cachedpage)])
+        self.get_miss(self.page_cachedpage.get_url())
+
+    # ---- PURGE QUEUE ---------------------------------------------------------
+
+    def test_purge_queue(self):
+        page_url = self.page_cachedpage.get_url()
+        view_url = reverse("cached_view")
+        self.get_miss(page_url)
+        self.get_miss(view_url)
+        # Purges wait in the queue, merged with each other.
+        enqueue_purge(tags=["cachedpage"])
+        enqueue_purge(tags=["cachedpage"])
+        self.get_hit(page_url)
+        self.assertEqual(drain_purges(), 1)
+        self.assertEqual(drain_purges(), 0)
+        self.get_miss(page_url)
+        self.get_hit(view_url)
+
+    @override_settings(WAGTAIL_CACHE_PURGE_DELAY=0.1)
+    def test_purge_queue_thread(self):
+        url = reverse("cached_view")
+        self.get_miss(url)
+        enqueue_purge(tags=["unknown"])
+        enqueue_purge()
+        self.get_hit(url)
+        time.sleep(0.5)
+        self.assertEqual(drain_purges(), 0)
+        self.get_miss(url)
+
+    def test_purge_merge(self):
+        purge = Purge(urls=["a"], sites=["a.example"]).merge(
+            Purge(urls=["a", "b"], exact=["/c/"])
+        )
+        self.assertEqual(purge.urls, {"a", "b"})
+        self.assertEqual(purge.sites, {"a.example"})
+        self.assertEqual(purge.exact, {"/c/"})
+        self.assertTrue(purge.merge(Purge(everything=True)).everything)
+        self.assertFalse(Purge())
+
+    @override_settings(
+        WAGTAIL_CACHE_PURGE_QUEUE="wagtailcache.purge.CachePurgeQueue"
+    )
+    def test_purge_queue_cache(self):
+        url = reverse("cached_view")
+        self.get_miss(url)
+        enqueue_purge(exact=["/unknown/"])
+        enqueue_purge(exact=[url])
+        self.assertEqual(self.cache.get(PENDING_KEY).exact, {url, "/unknown/"})
+        self.get_hit(url)
+        out = StringIO()
+        call_command("clear_wagtail_cache", "--drain", stdout=out)
+        self.assertIn("Ran 1 queued purge(s).", out.getvalue())
+        self.get_miss(url)
+
+    def test_purge_queue_drain_command(self):
+        # Purges queued in memory cannot be drained by another process.
+        with self.assertRaises(CommandError):
+            call_command("clear_wagtail_cache", "--drain")
+
+    @override_settings(
+        WAGTAIL_CACHE_PURGE_QUEUE="wagtailcache.purge.ImmediatePurgeQueue"
+    )
+    def test_purge_queue_immediate(self):
+        url = reverse("cached_view")
+        self.get_miss(url)
+        enqueue_purge(exact=[url])
+        self.get_miss(url)
+
+    # ---- WARMING -------------------------------------------------------------
+
+    def test_warm_pages(self):
+        urls = get_page_urls()
+        self.assertIn(self.page_cachedpage.get_full_url(), urls)
+        self.assertNotIn(self.page_cachedpage_restricted.get_full_url(), urls)
+        statuses = warm_cache(workers=1)
+        # Pages which opt out of caching are skipped.
+        self.assertEqual(statuses, Counter(miss=2, skip=len(urls) - 2))
+        # Pages are cached under the same key as real traffic.
+        response = self.client.get(
+            self.page_cachedpage.get_url(), HTTP_HOST="localhost"
+        )
+        self.assertEqual(response[self.header_name], Status.HIT.value)
+        self.assertEqual(warm_cache(workers=1)["hit"], 2)
+        self.assertEqual(get_page_urls(sites=["unknown.example"]), [])
+        self.assertEqual(get_page_urls(sites=["localhost"]), urls)
+
+    def test_warm_urls(self):
+        urls = [
+            "http://testserver" + reverse("cached_view"),
+            "http://testserver" + reverse("nocached_view"),
+        ]
+        self.assertEqual(
+            warm_cache(urls=urls, workers=2, rate=100),
+            Counter(miss=1, skip=1),
+        )
+        self.get_hit(reverse("cached_view"))
+
+    def test_warm_sitemap(self):
+        statuses = warm_cache(
+            sitemap="http://testserver" + reverse("sitemap_view")
+        )
+        self.assertEqual(statuses, Counter(miss=1))
+        self.get_hit(reverse("cached_view"))
+
+    @override_settings(WAGTAIL_CACHE_KEYRING=True)
+    def test_warm_keyring(self):
+        url = reverse("cached_view")
+        response = self.get_miss(url)
+        self.cache.delete(response.wsgi_request._wagtailcache_key.cache_key)
+        self.assertEqual(warm_cache(keyring=True), Counter(miss=1))
+        self.get_hit(url)
+
+    @override_settings(WAGTAIL_CACHE_KEYRING=True)
+    def test_warm_keyring_escapes(self):
+        url = reverse("cached_view") + "?q=a%26b%3Dc%2Bd%3F&x=caf%C3%A9"
+        response = self.get_miss(url)
+        # Reserved characters stay encoded in the keyring, others are decoded.
+        uri = response.wsgi_request._wagtailcache_key.uri
+        self.assertTrue(uri.endswith("?q=a%26b%3Dc%2Bd%3F&x=café"))
+        request = Warmer().build_request(uri)
+        self.assertEqual(request.GET["q"], "a&b=c+d?")
+        self.assertEqual(request.GET["x"], "café")
+        self.cache.delete(response.wsgi_request._wagtailcache_key.cache_key)
+        self.assertEqual(warm_cache(keyring=True), Counter(miss=1))
+        self.get_hit(url)
+
+    @override_settings(
+        WAGTAIL_CACHE_HIT_COUNTS=True, WAGTAIL_CACHE_HIT_COUNTS_INTERVAL=0
+    )
+    def test_warm_prioritize(self):
+        popular = "http://testserver" + reverse("cached_view")
+        other = "http://testserver" + reverse("tagged_view")
+        for _ in range(3):
+            self.client.get(reverse("cached_view"))
+        self.client.get(reverse("tagged_view"))
+        # Warming requests are not counted.
+        warm_cache(urls=[popular], workers=1)
+        self.assertEqual(get_hit_counts()[popular], 3)
+        self.assertEqual(get_hit_counts([other])[other], 1)
+        self.assertEqual(prioritize([other, popular, other]), [popular, other])
+
+    @override_settings(
+        WAGTAIL_CACHE_KEYRING=True,
+        WAGTAIL_CACHE_REWARM=True,
+        WAGTAIL_CACHE_REWARM_WORKERS=1,
+    )
+    def test_rewarm(self):
+        url = reverse("cached_view")
+        self.get_miss(url)
+        clear_cache(exact=[url])
+        _get_rewarm_executor().submit(lambda: None).result()
+        # The purged page was replaced in the background.
+        self.get_hit(url)
+
+    @override_settings(
+        WAGTAIL_CACHE_KEYRING=True,
+        WAGTAIL_CACHE_REWARM=True,
+        WAGTAIL_CACHE_REWARM_WORKERS=1,
+        WAGTAIL_CACHE_HIT_COUNTS=True,
+        WAGTAIL_CACHE_HIT_COUNTS_INTERVAL=0,
+    )
+    def test_rewarm_min_hits(self):
+        popular = reverse("cached_view")
+        rare = reverse("tagged_view")
+        for url in [popular, popular, rare]:
+            self.client.get(url)
+        clear_cache(exact=[popular, rare])
+        _get_rewarm_executor().submit(lambda: None).result()
+        # Only the page requested at least twice is re-rendered.
+        self.get_hit(popular)
+        self.get_miss(rare)
+
+    @override_settings(
+        WAGTAIL_CACHE_HIT_COUNTS=True, WAGTAIL_CACHE_HIT_COUNTS_INTERVAL=0.5
+    )
+    def test_hit_counts_background(self):
+        uri = "http://testserver" + self.page_cachedpage.get_url()
+        bucket_key = _bucket_key(int(time.time() // WINDOW), uri)
+        self.client.get(self.page_cachedpage.get_url())
+        # Counts are saved by a background thread, not by the request.
+        self.assertIsNone(self.cache.get(bucket_key))
+        _counter._timer.join()
+        self.assertEqual(self.cache.get(bucket_key), {uri: 1})
+
+    def test_warm_command(self):
+        out = StringIO()
+        call_command(
+            "warm_wagtail_cache",
+            "http://testserver" + reverse("cached_view"),
+            stdout=out,
+        )
+        self.assertEqual(out.getvalue(), "miss: 1\n")
+
+    # ---- METRICS -------------------------------------------------------------
+
+    def start_metrics(self):
+        _metrics.take()
+        self.cache.clear()
+
+    @override_settings(WAGTAIL_CACHE_METRICS=True)
+    def test_metrics(self):
+        self.start_metrics()
+        url = self.page_cachedpage.get_url()
+        self.get_miss(url)
+        response = self.get_hit(url)
+        self.get_skip(reverse("nocached_view"))
+        metrics = get_metrics()
+        self.assertEqual(metrics.counters["miss"], 1)
+        self.assertEqual(metrics.counters["hit"], 1)
+        self.assertEqual(metrics.counters["skip"], 1)
+        self.assertEqual(metrics.hit_rate, 0.5)
+        self.assertEqual(
+            metrics.counters["served_bytes"], len(response.content)
+        )
+        self.assertGreater(metrics.counters["stored_bytes"], 0)
+        self.assertEqual(metrics.histograms["fetch_seconds"].count, 3)
+        self.assertEqual(metrics.histograms["store_seconds"].count, 1)
+        # Totals accumulate across flushes.
+        self.get_hit(url)
+        self.assertEqual(get_metrics().counters["hit"], 2)
+
+    @override_settings(
+        WAGTAIL_CACHE_METRICS=True, WAGTAIL_CACHE_METRICS_INTERVAL=0.5
+    )
+    def test_metrics_flush_interval(self):
+        self.start_metrics()
+        self.get_miss(reverse("cached_view"))
+        # Flushed by a background thread, not by the request.
+        self.assertIsNone(self.cache.get("metrics:miss"))
+        _metrics._timer.join()
+        self.assertEqual(self.cache.get("metrics:miss"), 1)
+
+    async def test_metrics_async(self):
+        with self.settings(WAGTAIL_CACHE_METRICS=True):
+            await sync_to_async(self.start_metrics)()
+            url = reverse("async_cached_view")
+            self.assertEqual(await self.aget_status(url), Status.MISS.value)
+            self.assertEqual(await self.aget_status(url), Status.HIT.value)
+            metrics = await sync_to_async(get_metrics)()
+        self.assertEqual(metrics.counters["miss"], 1)
+        self.assertEqual(metrics.counters["hit"], 1)
+
+    def test_metrics_disabled(self):
+        self.start_metrics()
+        self.get_miss(reverse("cached_view"))
+        self.assertEqual(get_metrics().counters["miss"], 0)
+
+    @override_settings(WAGTAIL_CACHE_METRICS=True, WAGTAIL_CACHE_KEYRING=True)
+    def test_metrics_keyring(self):
+        self.start_metrics()
+        self.get_miss(reverse("cached_view"))
+        self.get_miss(reverse("template_response_view"))
+        self.assertEqual(get_metrics().gauges["keyring_urls"], 2)
+        # The count is kept for the flush interval.
+        self.get_miss(self.page_cachedpage.get_url())
+        self.assertEqual(get_metrics().gauges["keyring_urls"], 2)
+        self.cache.delete("metrics:keyring_urls")
+        self.assertEqual(get_metrics().gauges["keyring_urls"], 3)
+
+    @override_settings(
+        WAGTAIL_CACHE_METRICS=True,
+        WAGTAIL_CACHE_METRICS_SINKS=[
+            {
+                "BACKEND": "wagtailcache.metrics.LoggingSink",
+                "OPTIONS": {"level": "WARNING"},
+            }
+        ],
+    )
+    def test_metrics_logging_sink(self):
+        self.start_metrics()
+        self.get_miss(reverse("cached_view"))
+        with self.assertLogs("wagtail-cache", "WARNING") as logs:
+            flush_metrics()
+        self.assertIn("miss=1", logs.output[0])
+
+    def test_metrics_statsd_sink(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        server.bind(("127.0.0.1", 0))
+        server.settimeout(5)
+        self.addCleanup(server.close)
+        sink = {
+            "BACKEND": "wagtailcache.metrics.StatsdSink",
+            "OPTIONS": {
+                "host": "127.0.0.1",
+                "port": server.getsockname()[1],
+                "prefix": "site",
+            },
+        }
+        with self.settings(
+            WAGTAIL_CACHE_METRICS=True, WAGTAIL_CACHE_METRICS_SINKS=[sink]
+        ):
+            self.start_metrics()
+            self.get_miss(self.page_cachedpage.get_url())
+            flush_metrics()
+        lines = server.recv(4096).decode("utf-8").splitlines()
+        self.assertIn("site.miss:1|c", lines)
+        self.assertIn("site.fetch_seconds.count:1|c", lines)
+
+    @override_settings(WAGTAIL_CACHE_METRICS=True)
+    def test_metrics_prometheus(self):
+        self.start_metrics()
+        self.get_miss(self.page_cachedpage.get_url())
+        response = self.get_skip(reverse("prometheus_view"))
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        lines = response.content.decode("utf-8").splitlines()
+        self.assertIn('wagtailcache_responses_total{status="miss"} 1', lines)
+        # Including the lookup of the metrics request itself.
+        self.assertIn('wagtailcache_fetch_seconds_bucket{le="+Inf"} 2', lines)
+        self.assertIn("wagtailcache_fetch_seconds_count 2", lines)
+
+    @override_settings(WAGTAIL_CACHE_METRICS=True)
+    def test_metrics_admin(self):
+        self.start_metrics()
+        url = reverse("cached_view")
+        self.get_miss(url)
+        self.get_hit(url)
+        self.get_hit(url)
+        self.get_hit(url)
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("wagtailcache:index"))
+        self.assertContains(response, "<b>75%</b>")
+
+    def test_histogram(self):
+        histogram = Histogram()
+        histogram.observe(LATENCY_BUCKETS[0])
+        histogram.observe(0.003)
+        histogram.observe(60)
+        self.assertEqual(histogram.counts[0], 1)
+        self.assertEqual(histogram.counts[3], 1)
+        self.assertEqual(histogram.counts[-1], 1)
+        self.assertEqual(histogram.count, 3)
+        self.assertAlmostEqual(histogram.seconds, 60.0035)
+
+    # ---- TIMING --------------------------------------------------------------
+
+    def get_timings(self, response) -> List[str]:
+        header = response.get("Server-Timing", "")
+        return [metric.split(";")[0] for metric in header.split(", ") if metric]
+
+    @override_settings(WAGTAIL_CACHE_TIMING=["header"])
+    def test_timing_header(self):
+        url = self.page_cachedpage.get_url()
+        timings = self.get_timings(self.get_miss(url))
+        for name in ["qs", "cookies", "key", "headers", "hooks", "set"]:
+            self.assertIn(f"cache-{name}", timings)
+        # The header of the miss is not cached.
+        timings = self.get_timings(self.get_hit(url))
+        self.assertEqual(
+            timings,
+            ["cache-hooks", "cache-qs", "cache-cookies", "cache-key"]
+            + ["cache-headers", "cache-get", "cache-decode"],
+        )
+        # Reported once, even if cached by both the middleware and
+        # ``cache_page``.
+        response = self.get_miss(reverse("cached_view"))
+        self.assertEqual(response["Server-Timing"].count("cache-qs"), 1)
+
+    @override_settings(WAGTAIL_CACHE_TIMING=["header"])
+    async def test_timing_header_async(self):
+        url = reverse("async_cached_view")
+        self.assertEqual(await self.aget_status(url), Status.MISS.value)
+        response = await self.async_client.get(url)
+        self.assertIn("cache-get", self.get_timings(response))
+
+    @override_settings(WAGTAIL_CACHE_TIMING=["log"])
+    def test_timing_log(self):
+        with self.assertLogs("wagtail-cache", "DEBUG") as logs:
+            response = self.get_miss(self.page_cachedpage.get_url())
+        self.assertNotIn("Server-Timing", response)
+        self.assertIn("cache-set", logs.output[0])
+        self.assertIn("set", logs.records[0].wagtailcache_timings)
+
+    def test_timing_disabled(self):
+        response = self.get_miss(self.page_cachedpage.get_url())
+        self.assertNotIn("Server-Timing", response)
+        self.assertFalse(
+            hasattr(response.wsgi_request, "_wagtailcache_timings")
+        )
+
+    # ---- GENERATIONS ---------------------------------------------------------
+
+    def get_status(self, url: str, host: str) -> str:
+        response = self.client.get(url, HTTP_HOST=host)
+        return response.get(self.header_name, None)
+
+    @override_settings(WAGTAIL_CACHE_GENERATIONS=True)
+    def test_generations(self):
+        url = reverse("cached_view")
+        self.get_miss(url)
+        self.get_hit(url)
+        cache_key = _get_request_key(RequestFactory().get(url)).header_key
+        # Clearing starts a new generation rather than emptying the backend.
+        clear_cache()
+        self.assertIsNotNone(self.cache.get(cache_key))
+        self.get_miss(url)
+        self.get_hit(url)
+        # A generation which was evicted is recreated, not reset.
+        self.cache.delete(CACHE_GENERATION_KEY)
+        self.get_miss(url)
+        self.get_hit(url)
+
+    @override_settings(
+        WAGTAIL_CACHE_GENERATIONS=True,
+        WAGTAIL_CACHE_KEYRING=True,
+        WAGTAIL_CACHE_TRACK_DEPENDENCIES=True,
+    )
+    def test_generations_keyring(self):
+        url = self.page_cachedpage.get_url()
+        self.get_miss(url)
+        self.assertTrue(get_keyring(self.cache).exists())
+        self.assertTrue(get_keyring(self.cache, TAGS).exists())
+        # The keyrings do not keep listing keys of the previous generation.
+        clear_cache()
+        self.assertEqual(get_keyring(self.cache).as_dict(), {})
+        self.assertEqual(get_keyring(self.cache, TAGS).as_dict(), {})
+        self.get_miss(url)
+        self.assertEqual(len(get_keyring(self.cache).as_dict()), 1)
+
+    @override_settings(WAGTAIL_CACHE_GENERATIONS=True)
+    def test_generations_sites(self):
+        url = reverse("cached_view")
+        hosts = ["localhost", "other.example:8000"]
+        for host in hosts:
+            self.assertEqual(self.get_status(url, host), Status.MISS.value)
+        # Only the site which was cleared starts a new generation.
+        clear_cache(sites=[Site.objects.get(is_default_site=True)])
+        self.assertEqual(self.get_status(url, hosts[0]), Status.MISS.value)
+        self.assertEqual(self.get_status(url, hosts[1]), Status.HIT.value)
+        # Sites can also be cleared by hostname.
+        clear_cache(sites=["Other.Example"])
+        self.assertEqual(self.get_status(url, hosts[0]), Status.HIT.value)
+        self.assertEqual(self.get_status(url, hosts[1]), Status.MISS.value)
+
+    @override_settings(WAGTAIL_CACHE_KEYRING=True)
+    def test_clear_cache_sites_keyring(self):
+        url = reverse("cached_view")
+        for host in ["testserver", "other.example"]:
+            self.assertEqual(self.get_status(url, host), Status.MISS.value)
+        clear_cache(sites=["other.example"])
+        self.get_hit(url)
+        self.assertEqual(
+            self.get_status(url, "other.example"), Status.MISS.value
+        )
+
+    @override_settings(
+        WAGTAIL_CACHE_GENERATIONS=True,
+        CACHES={
+            **settings.CACHES,
+            "async": {"BACKEND": "home.tests.AsyncLocMemCache"},
+        },
+        WAGTAIL_CACHE_BACKEND="async",
+    )
+    async def test_async_generations(self):
+        url = reverse("cached_view")
+        self.assertEqual(await self.aget_status(url), Status.MISS.value)
+        self.assertEqual(await self.aget_status(url), Status.HIT.value)
+        await sync_to_async(clear_cache)()
+        self.assertEqual(await self.aget_status(url), Status.MISS.value)
+
+    # ---- ASYNC ---------------------------------------------------------------
+
+    async def aget_status(self, url: str) -> str:
+        response = await self.async_client.get(url)
+        return response.get(self.header_name, None)
+
+    async def test_async_middleware(self):
+        url = reverse("cached_view")
+        self.assertEqual(await self.aget_status(url), Status.MISS.value)
+        self.assertEqual(await self.aget_status(url), Status.HIT.value)
+        # Shares the cache with sync requests.
+        await sync_to_async(self.get_hit)(url)
+
+    async def test_async_view(self):
+        url = reverse("async_cached_view")
+        self.assertEqual(await self.aget_status(url), Status.MISS.value)
+        response = await self.async_client.get(url)
+        self.assertEqual(response[self.header_name], Status.HIT.value)
+        self.assertEqual(response.content, b"Hello, async World!")
+        url = reverse("async_nocached_view")
+        self.assertEqual(await self.aget_status(url), Status.SKIP.value)
+        self.assertEqual(await self.aget_status(url), Status.SKIP.value)
+
+    @override_settings(
+        CACHES={
+            **settings.CACHES,
+            "async": {"BACKEND": "home.tests.AsyncLocMemCache"},
+        },
+        WAGTAIL_CACHE_BACKEND="async",
+    )
+    async def test_async_native_backend(self):
+        for url in [reverse("cached_view"), reverse("async_cached_view")]:
+            self.assertEqual(await self.aget_status(url), Status.MISS.value)
+            self.assertEqual(await self.aget_status(url), Status.HIT.value)
+        self.assertIsNotNone(
+            await caches["async"].aget(
+                _get_request_key(RequestFactory().get(url)).header_key
+            )
+        )
+
+    @override_settings(WAGTAIL_CACHE_LOCAL=True)
+    async def test_async_no_async_api(self):
+        # Before Django 4.0, cache backends have no async API.
+        with unittest.mock.patch.object(BaseCache, "aget", None):
+            for url in [reverse("cached_view"), reverse("async_cached_view")]:
+                self.assertEqual(await self.aget_status(url), Status.MISS.value)
+                self.assertEqual(await self.aget_status(url), Status.HIT.value)
+
+    async def test_async_sync_only(self):
+        def hook(request_or_response, is_cacheable):
+            # Raises ``SynchronousOnlyOperation`` on the event loop.
+            User.objects.exists()
+
+        hooks.register("is_request_cacheable", hook)
+        hooks.register("is_response_cacheable", hook)
+        url = reverse("async_cached_view")
+        self.assertEqual(await self.aget_status(url), Status.MISS.value)
+        self.assertEqual(await self.aget_status(url), Status.HIT.value)
+        # Before Django 5.0, requests have a lazy ``user``, but no ``auser()``.
+        request = RequestFactory().get(url)
+        request.user = SimpleLazyObject(
+            lambda: User.objects.get(pk=self.user.pk)
+        )
+        middleware = FetchFromCacheMiddleware(views.async_cached_view)
+        self.assertIsNone(await middleware.aprocess_request(request))
+        self.assertTrue(request._wagtailcache_skip)
+
+    @override_settings(WAGTAIL_CACHE_TRACK_DEPENDENCIES=True)
+    async def test_async_update_uncacheable(self):
+        request = RequestFactory().get(reverse("cached_view"))
+        collect(request)
+        middleware = UpdateCacheMiddleware(views.cached_view)
+        await middleware._aupdate(request, HttpResponse(), 0, None)
+        # Dependencies stop being collected for uncacheable responses.
+        self.assertIsNone(_collector.get())
+
+    @override_settings(WAGTAIL_CACHE_LOCAL=True)
+    async def test_async_local_cache(self):
+        url = reverse("async_cached_view")
+        self.assertEqual(await self.aget_status(url), Status.MISS.value)
+        self.assertEqual(await self.aget_status(url), Status.HIT.value)
+        self.assertEqual(len(get_local_cache()), 2)
+
+    @override_settings(WAGTAIL_CACHE_KEYRING=True)
+    async def test_async_keyring(self):
+        url = reverse("cached_view")
+        self.assertEqual(await self.aget_status(url), Status.MISS.value)
+        keyring = await sync_to_async(get_keyring(self.cache).as_dict)()
+        self.assertIn("http://testserver" + url, keyring)
+
+    @override_settings(WAGTAIL_CACHE_MISS_LOCK=True)
+    async def test_async_miss_lock(self):
+        url = reverse("cached_view")
+        self.assertEqual(await self.aget_status(url), Status.MISS.value)
+        self.assertEqual(await self.aget_status(url), Status.HIT.value)
+
+    async def test_async_template_response(self):
+        url = reverse("template_response_view")
+        self.assertEqual(await self.aget_status(url), Status.MISS.value)
+        self.assertEqual(await self.aget_status(url), Status.HIT.value)
+
+    async def test_async_skip(self):
+        url = reverse("nocached_view")
+        self.assertEqual(await self.aget_status(url), Status.SKIP.value)
+        url = reverse("cached_view")
+        response = await self.async_client.post(url)
+        self.assertEqual(response[self.header_name], Status.SKIP.value)
+        # Logged in users are checked without blocking the event loop.
+        await sync_to_async(self.async_client.force_login)(self.user)
+        self.assertEqual(await self.aget_status(url), Status.SKIP.value)
+
+    # ---- LOCAL CACHE ---------------------------------------------------------
+
+    @override_settings(WAGTAIL_CACHE_LOCAL=True)
+    def test_local_cache(self):
+        url = self.page_cachedpage.get_url()
+        self.get_miss(url)
+        self.get_hit(url)
+        # Hits are served from the local cache without touching the backend.
+        self.cache.clear()
+        self.get_hit(url)
+        self.assertEqual(len(get_local_cache()), 2)
+        # Clearing the cache also clears the local cache.
+        clear_cache()
+        self.assertEqual(len(get_local_cache()), 0)
+        self.get_miss(url)
+        self.get_hit(url)
+
+    @override_settings(
+        WAGTAIL_CACHE_LOCAL=True, WAGTAIL_CACHE_LOCAL_CHECK_INTERVAL=0
+    )
+    def test_local_cache_generation(self):
+        url = self.page_cachedpage.get_url()
+        self.get_miss(url)
+        self.get_hit(url)
+        # Simulate another process clearing the cache.
+        self.cache.clear()
+        self.cache.set(GENERATION_KEY, "other", None)
+        self.get_miss(url)
+        self.get_hit(url)
+
+    @override_settings(WAGTAIL_CACHE_LOCAL=True)
+    def test_local_cache_lifetime(self):
+        response = HttpResponse(b"body")
+        patch_response_headers(response, 5)
+        self.cache.set("short", encode_response(response), 5)
+        self.cache.set("stale", encode_response(response, (0, 1)), 5)
+        self.assertIsNotNone(cache_get(self.cache, "short"))
+        self.assertIsNotNone(cache_get(self.cache, "stale"))
+        # Entries are kept locally for no longer than they live in the
+        # backend, rather than for ``WAGTAIL_CACHE_LOCAL_TIMEOUT``.
+        local = get_local_cache()
+        expires, _ = local._data["short"]
+        self.assertLessEqual(expires - time.monotonic(), 5)
+        self.assertIs(local.get("stale"), MISSING)
+
+    def test_local_cache_limits(self):
+        local = LocalCache(
+            max_entries=2, max_bytes=1000, timeout=60, check_interval=1
+        )
+        local.set("a", "a")
+        local.set("b", "b")
+        local.get("a")
+        local.set("c", "c")
+        # The least recently used entry is evicted.
+        self.assertEqual(local.get("a"), "a")
+        self.assertEqual(local.get("c"), "c")
+        self.assertIs(local.get("b"), MISSING)
+        self.assertEqual(len(local), 2)
+        # Entries over the byte limit are evicted, or never stored.
+        local.set("d", "d" * 600)
+        local.set("e", "e" * 600)
+        self.assertEqual(len(local), 1)
+        self.assertLessEqual(local.size, 1000)
+        local.set("f", "f" * 2000)
+        self.assertEqual(len(local), 1)
+        # Entries expire.
+        local.set("g", "g", timeout=0.01)
+        time.sleep(0.02)
+        self.assertEqual(len(local), 2)
+        self.assertIs(local.get("g"), MISSING)
+        self.assertEqual(len(local), 1)
+
     # ---- ALTERNATE SETTINGS --------------------------------------------------
 
     @override_settings(WAGTAIL_CACHE=True)
@@ -718,3 +2206,217 @@ class WagtailCacheTest(TestCase):
         self.assertEqual(hook_fns, [hook_any])
         # The page should be cached normally due to hook returning garbage.
         self.test_page_hit()
+
+    def test_hooks_resolved_once(self):
+        self.assertEqual(get_hooks("is_request_cacheable"), [])
+        hooks.register("is_request_cacheable", hook_true)
+        resolved = get_hooks("is_request_cacheable")
+        self.assertEqual(resolved, [hook_true])
+        self.assertIs(get_hooks("is_request_cacheable"), resolved)
+        # Registering or removing a hook resolves them again, in order.
+        hooks.register("is_request_cacheable", hook_false, order=-1)
+        self.assertEqual(
+            get_hooks("is_request_cacheable"), [hook_false, hook_true]
+        )
+        with hooks.register_temporarily("is_request_cacheable", hook_any):
+            self.assertEqual(
+                get_hooks("is_request_cacheable"),
+                [hook_false, hook_true, hook_any],
+            )
+        self.assertEqual(
+            get_hooks("is_request_cacheable"), [hook_false, hook_true]
+        )
+
+    # ---- RULES ---------------------------------------------------------------
+
+    def test_rules_request(self):
+        url = self.page_cachedpage.get_url()
+        with override_settings(
+            WAGTAIL_CACHE_RULES=[
+                {"host": "example.com", "path_prefix": "/", "cache": True},
+                {"path_regex": r".*/cachedpage/$", "cache": False},
+            ]
+        ):
+            self.get_skip(url)
+            self.get_skip(url)
+        # Without the rules, the page is cached as usual.
+        self.get_miss(url)
+        self.get_hit(url)
+
+    def test_rules_response(self):
+        with override_settings(
+            WAGTAIL_CACHE_RULES=[{"status": [404, 410], "cache": False}]
+        ):
+            for _ in range(2):
+                response = self.client.get("/gimme-a-404/")
+                self.assertEqual(response[self.header_name], Status.SKIP.value)
+            self.get_miss(self.page_cachedpage.get_url())
+        # Rules can also force responses to be cached.
+        with override_settings(
+            WAGTAIL_CACHE_RULES=[
+                {
+                    "path_prefix": "/cachecontrolpage/",
+                    "content_type": "text/html",
+                    "cache": True,
+                }
+            ]
+        ):
+            self.get_miss(self.page_cachecontrolpage.get_url())
+            self.get_hit(self.page_cachecontrolpage.get_url())
+
+    @override_settings(
+        WAGTAIL_CACHE_RULES=[{"path_prefix": "/", "cache": False}]
+    )
+    def test_rules_before_hooks(self):
+        # Hooks are passed the decision of the rules, and have the final say.
+        hooks.register("is_request_cacheable", hook_true)
+        self.get_miss(self.page_cachedpage.get_url())
+        self.get_hit(self.page_cachedpage.get_url())
+
+    def test_rules_invalid(self):
+        for rules in [
+            [{"path_prefix": "/api/"}],
+            [{"path": "/api/", "cache": False}],
+            [{"path_regex": "(", "cache": False}],
+        ]:
+            with self.assertRaises(ImproperlyConfigured):
+                Rules(rules)
+
+
+class UrlIndexTest(unittest.TestCase):
+    uris = [
+        "http://a.example/",
+        "http://a.example/blog/",
+        "http://a.example/blog/one/",
+        "http://a.example/blogroll/",
+        "https://b.example/blog/",
+        "https://b.example:8000/blog/",
+    ]
+
+    def test_exact(self):
+        index = UrlIndex(self.uris)
+        self.assertEqual(
+            index.exact(["http://a.example/blog/", "http://a.example/x/"]),
+            {"http://a.example/blog/"},
+        )
+        self.assertEqual(
+            index.exact(["/blog/"]),
+            {
+                "http://a.example/blog/",
+                "https://b.example/blog/",
+                "https://b.example:8000/blog/",
+            },
+        )
+
+    def test_prefix(self):
+        index = UrlIndex(self.uris)
+        self.assertEqual(
+            index.prefix(["http://a.example/blog/"]),
+            {"http://a.example/blog/", "http://a.example/blog/one/"},
+        )
+        self.assertEqual(len(index.prefix(["/blog"])), 5)
+        self.assertEqual(len(index.prefix(["https://b.example"])), 2)
+
+    def test_match(self):
+        index = UrlIndex(self.uris)
+        self.assertEqual(
+            index.match([r"^http://a\.example/blog/.+", r"http://a.example/b"]),
+            {
+                "http://a.example/blog/",
+                "http://a.example/blog/one/",
+                "http://a.example/blogroll/",
+            },
+        )
+        self.assertEqual(len(index.match([r".*/blog/$"])), 3)
+        self.assertEqual(len(index.match([r"(?i)HTTPS://B"])), 2)
+
+    def test_compile_pattern(self):
+        for pattern, literal in [
+            (r"^http://a\.example/blog/", "http://a.example/blog/"),
+            (r"https?://a/", "http"),
+            (r"http://a/b*", "http://a/"),
+            (r"http://a/(x|y)", ""),
+            (r".*", ""),
+        ]:
+            self.assertEqual(compile_pattern(pattern)[1], literal)
+
+
+class KeyringConcurrencyTest(unittest.TestCase):
+    """
+    Concurrent writers must never lose each other's keys.
+    """
+
+    workers = 4
+    count = 24
+
+    def assertAllKeys(self, keyring: Keyring) -> None:
+        entries = keyring.as_dict()
+        found = {k for uri_keys in entries.values() for k in uri_keys}
+        expected = {
+            "key-%d-%d" % (w, i)
+            for w in range(self.workers)
+            for i in range(self.count)
+        }
+        self.assertEqual(len(entries), 4)
+        self.assertEqual(found, expected)
+
+    def test_threads_locmem(self):
+        cache = LocMemCache("keyring-stress", {})
+        threads = [
+            threading.Thread(
+                target=fill_keyring,
+                args=(get_keyring(cache), w, self.count),
+            )
+            for w in range(self.workers)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertAllKeys(get_keyring(cache))
+        cache.clear()
+
+    def test_processes_filebased(self):
+        ctx = multiprocessing.get_context("fork")
+        with tempfile.TemporaryDirectory() as location:
+            procs = [
+                ctx.Process(
+                    target=fill_file_keyring,
+                    args=(location, w, self.count),
+                )
+                for w in range(self.workers)
+            ]
+            for p in procs:
+                p.start()
+            for p in procs:
+                p.join()
+                self.assertEqual(p.exitcode, 0)
+            self.assertAllKeys(get_keyring(FileBasedCache(location, {})))
+
+    @unittest.skipIf(fakeredis is None, "RedisCache needs Django >= 4.0")
+    def test_threads_redis(self):
+        cache = RedisCache(
+            "redis://localhost:6379",
+            {"OPTIONS": {"connection_class": fakeredis.FakeRedisConnection}},
+        )
+        cache.clear()
+        self.assertIs(type(get_keyring(cache)), RedisKeyring)
+        threads = [
+            threading.Thread(
+                target=fill_keyring,
+                args=(get_keyring(cache), w, self.count),
+            )
+            for w in range(self.workers)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        keyring = get_keyring(cache)
+        self.assertAllKeys(keyring)
+        popped = keyring.pop(["http://testserver/0/"])
+        self.assertEqual(
+            len(popped["http://testserver/0/"]), self.workers * self.count // 4
+        )
+        self.assertEqual(keyring.get("http://testserver/0/"), [])
+        cache.clear()
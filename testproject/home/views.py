@@ -1,6 +1,12 @@
+import time
+import uuid
+
 from django.http import HttpResponse
 from django.template.response import TemplateResponse
+from django.urls import reverse
+from wagtail.images import get_image_model
 
+from wagtailcache.cache import add_cache_tags
 from wagtailcache.cache import cache_page
 from wagtailcache.cache import nocache_page
 
@@ -21,7 +27,70 @@ def vary_view(request):
     return r
 
 
+def vary_encoding_view(request):
+    r = HttpResponse("Variety is the spice of life." * 100)
+    r.headers["Vary"] = "Accept-Encoding"
+    return r
+
+
+@cache_page
+async def async_cached_view(request):
+    return HttpResponse("Hello, async World!")
+
+
+@nocache_page
+async def async_nocached_view(request):
+    return HttpResponse("Hello, async World!")
+
+
 @cache_page
 def template_response_view(request):
     response = TemplateResponse(request, "home/page.html", {})
     return response
+
+
+@cache_page
+def stale_view(request):
+    # Unique content, to tell each render apart.
+    response = HttpResponse(uuid.uuid4().hex)
+    response["Cache-Control"] = "max-age=1, stale-while-revalidate=60"
+    return response
+
+
+# Number of times ``slow_view`` has been rendered.
+slow_view_renders = 0
+
+
+def slow_view(request):
+    global slow_view_renders
+    slow_view_renders += 1
+    time.sleep(0.2)
+    return HttpResponse("Good things come to those who wait.")
+
+
+def slow_private_view(request):
+    time.sleep(0.2)
+    response = HttpResponse("For your eyes only.")
+    response["Cache-Control"] = "private"
+    return response
+
+
+def image_view(request):
+    image = get_image_model().objects.first()
+    return HttpResponse(image.title if image else "")
+
+
+def tagged_view(request):
+    response = HttpResponse("Tag, you're it!")
+    return add_cache_tags(response, "news", "featured")
+
+
+def sitemap_view(request):
+    loc = request.build_absolute_uri(reverse("cached_view"))
+    return HttpResponse(
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+        f"<url><loc>{loc}</loc></url>"
+        "</urlset>",
+        content_type="application/xml",
+    )
@@ -7,6 +7,8 @@ from wagtail import urls as wagtail_urls
 from wagtail.admin import urls as wagtailadmin_urls
 from wagtail.documents import urls as wagtaildocs_urls
 
+from wagtailcache.views import prometheus_view
+
 
 urlpatterns = [
     path("django-admin/", admin.site.urls),
@@ -14,7 +16,33 @@ urlpatterns = [
     path("documents/", include(wagtaildocs_urls)),
     path("views/cached/", views.cached_view, name="cached_view"),
     path("views/nocache/", views.nocached_view, name="nocached_view"),
+    path(
+        "views/async-cached/",
+        views.async_cached_view,
+        name="async_cached_view",
+    ),
+    path(
+        "views/async-nocache/",
+        views.async_nocached_view,
+        name="async_nocached_view",
+    ),
     path("views/vary/", views.vary_view, name="vary_view"),
+    path(
+        "views/vary-encoding/",
+        views.vary_encoding_view,
+        name="vary_encoding_view",
+    ),
+    path("views/stale/", views.stale_view, name="stale_view"),
+    path("views/slow/", views.slow_view, name="slow_view"),
+    path(
+        "views/slow-private/",
+        views.slow_private_view,
+        name="slow_private_view",
+    ),
+    path("views/image/", views.image_view, name="image_view"),
+    path("views/tagged/", views.tagged_view, name="tagged_view"),
+    path("views/sitemap.xml", views.sitemap_view, name="sitemap_view"),
+    path("views/metrics/", prometheus_view, name="prometheus_view"),
     path(
         "views/template-response-view/",
         views.template_response_view,
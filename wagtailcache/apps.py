@@ -6,3 +6,14 @@ class WagtailCacheAppConfig(AppConfig):
     name = "wagtailcache"
     label = "wagtailcache"
     verbose_name = _("Wagtail Cache")
+
+    def ready(self):
+        from wagtailcache.dependencies import connect_signals
+        from wagtailcache.rules import get_rules
+
+        # Connect the signal receivers which track and clear dependent pages.
+        connect_signals()
+
+        # Compile the rules at startup, so that mistakes in them are raised
+        # straight away.
+        get_rules()
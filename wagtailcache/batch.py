@@ -0,0 +1,64 @@
+"""
+Cache backend operations on many keys at once, split into batches of
+``WAGTAIL_CACHE_BATCH_SIZE`` keys.
+"""
+
+from itertools import islice
+from typing import Any
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Optional
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.base import BaseCache
+
+from wagtailcache.settings import wagtailcache_settings
+
+
+def chunks(items: Iterable[Any]) -> Iterator[List[Any]]:
+    """
+    Splits ``items`` into lists of at most ``WAGTAIL_CACHE_BATCH_SIZE``.
+    """
+    size = max(1, int(wagtailcache_settings.WAGTAIL_CACHE_BATCH_SIZE))
+    iterator = iter(items)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def get_many(cache: BaseCache, keys: Iterable[str]) -> Dict[str, Any]:
+    """
+    Batched ``cache.get_many()``.
+    """
+    found = {}
+    for chunk in chunks(keys):
+        found.update(cache.get_many(chunk))
+    return found
+
+
+def set_many(
+    cache: BaseCache,
+    data: Dict[str, Any],
+    timeout: Optional[float] = DEFAULT_TIMEOUT,
+) -> None:
+    """
+    Batched ``cache.set_many()``.
+    """
+    for chunk in chunks(data):
+        cache.set_many({key: data[key] for key in chunk}, timeout)
+
+
+def delete_many(cache: BaseCache, keys: Iterable[str]) -> int:
+    """
+    Batched ``cache.delete_many()``. Returns the number of keys given, as not
+    every backend reports how many were deleted.
+    """
+    count = 0
+    for chunk in chunks(keys):
+        cache.delete_many(chunk)
+        count += len(chunk)
+    return count
@@ -2,36 +2,88 @@
 Functionality to set, serve from, and clear the cache.
 """
 
+import copy
 import logging
+import math
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
+from functools import lru_cache
 from functools import wraps
 from typing import Callable
 from typing import List
 from typing import Optional
+from typing import Set
+from typing import Tuple
 from urllib.parse import unquote
 
+from asgiref.sync import async_to_sync
+from asgiref.sync import iscoroutinefunction
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.core.cache import caches
 from django.core.cache.backends.base import BaseCache
 from django.core.handlers.wsgi import WSGIRequest
+from django.core.signals import setting_changed
+from django.db import close_old_connections
+from django.dispatch import receiver
+from django.http import QueryDict
 from django.http.response import HttpResponse
 from django.template.response import SimpleTemplateResponse
+from django.utils.cache import _generate_cache_header_key
+from django.utils.cache import _generate_cache_key
 from django.utils.cache import cc_delim_re
-from django.utils.cache import get_cache_key
 from django.utils.cache import get_max_age
 from django.utils.cache import has_vary_header
-from django.utils.cache import learn_cache_key
 from django.utils.cache import patch_response_headers
 from django.utils.deprecation import MiddlewareMixin
-from wagtail import hooks
 
+from wagtailcache.batch import delete_many
+from wagtailcache.codecs import negotiates_encoding
+from wagtailcache.dependencies import clear_tags
+from wagtailcache.dependencies import collect
+from wagtailcache.dependencies import collected
+from wagtailcache.generations import aget_namespace
+from wagtailcache.generations import get_hostname
+from wagtailcache.generations import get_namespace
+from wagtailcache.generations import next_generation
+from wagtailcache.hits import count_hit
+from wagtailcache.keyring import TAGS
+from wagtailcache.keyring import get_keyring
+from wagtailcache.local import acache_get
+from wagtailcache.local import acache_set
+from wagtailcache.local import cache_get
+from wagtailcache.local import cache_set
+from wagtailcache.local import get_local_cache
+from wagtailcache.local import invalidate
+from wagtailcache.metrics import record_fetch
+from wagtailcache.metrics import record_response
+from wagtailcache.metrics import record_store
+from wagtailcache.rules import get_hooks
+from wagtailcache.rules import get_rules
+from wagtailcache.rules import is_bypassed
+from wagtailcache.serializers import decode_response
+from wagtailcache.serializers import encode_response
+from wagtailcache.serializers import get_expires
+from wagtailcache.serializers import get_size
+from wagtailcache.serializers import is_encoded_response
 from wagtailcache.settings import wagtailcache_settings
+from wagtailcache.timing import finish_timing
+from wagtailcache.timing import start_timing
+from wagtailcache.timing import timed
+from wagtailcache.urlindex import UrlIndex
+from wagtailcache.warm import rewarm
 
 
 logger = logging.getLogger("wagtail-cache")
 
 
+# Seconds for which requests skip the miss lock, after the response to their
+# URL could not be cached.
+NOLOCK_TIMEOUT = 60
+
+
 class CacheControl(Enum):
     """
     ``Cache-Control`` header values.
@@ -50,20 +102,104 @@ class Status(Enum):
     HIT = "hit"
     MISS = "miss"
     SKIP = "skip"
+    STALE = "stale"
 
 
-def _patch_header(response: HttpResponse, status: Status) -> None:
+def _patch_header(
+    response: HttpResponse, status: Status, no_cache: bool = True
+) -> None:
     """
     Adds our Cache Control status to the response headers.
     """
     # Patch cache-control with no-cache if it is not already set.
-    if status == Status.SKIP and not response.get("Cache-Control", None):
+    if (
+        status == Status.SKIP
+        and no_cache
+        and not response.get("Cache-Control", None)
+    ):
         response["Cache-Control"] = CacheControl.NOCACHE.value
+    # Remember the status for ``wagtailcache.metrics``.
+    setattr(response, "_wagtailcache_status", status.value)
     # Add our custom header.
     if wagtailcache_settings.WAGTAIL_CACHE_HEADER:
         response[wagtailcache_settings.WAGTAIL_CACHE_HEADER] = status.value
 
 
+def _patch_lock_header(request: WSGIRequest, response: HttpResponse) -> None:
+    """
+    Adds the number of times the request waited for another request to render
+    the page to the response headers.
+    """
+    waits = getattr(request, "_wagtailcache_waits", 0)
+    if waits and wagtailcache_settings.WAGTAIL_CACHE_HEADER:
+        header = wagtailcache_settings.WAGTAIL_CACHE_HEADER + "-Lock-Waits"
+        response[header] = str(waits)
+
+
+def _release_lock(
+    request: WSGIRequest, response: HttpResponse, cache: BaseCache
+) -> None:
+    """
+    Releases the miss lock held by the request, if any, once the response has
+    been cached.
+    """
+    lock_key = getattr(request, "_wagtailcache_lock", None)
+    if lock_key is None:
+        return
+    delattr(request, "_wagtailcache_lock")
+    if isinstance(response, SimpleTemplateResponse):
+        # Template responses are cached after they are rendered.
+        response.add_post_render_callback(lambda r: cache.delete(lock_key))
+    else:
+        cache.delete(lock_key)
+
+
+def add_cache_tags(response: HttpResponse, *tags: str) -> HttpResponse:
+    """
+    Attaches tags to a response, so that it can be cleared from the cache
+    along with every other response carrying any of those tags, with
+    ``clear_cache(tags=[...])``.
+    """
+    response_tags = getattr(response, "_wagtailcache_tags", None)
+    if response_tags is None:
+        response_tags = set()
+        setattr(response, "_wagtailcache_tags", response_tags)
+    response_tags.update(tags)
+    return response
+
+
+def _tag_response(request: WSGIRequest, response: HttpResponse) -> Set[str]:
+    """
+    Returns every tag of a response: those attached with ``add_cache_tags``,
+    those returned by ``get_cache_tags`` hooks, and the dependencies collected
+    while rendering it. Adds them to ``WAGTAIL_CACHE_TAGS_HEADER``.
+    """
+    tags = set(getattr(response, "_wagtailcache_tags", ()))
+    for fn in get_hooks("get_cache_tags"):
+        tags.update(fn(request, response) or ())
+    tags.update(collected(request))
+    header = wagtailcache_settings.WAGTAIL_CACHE_TAGS_HEADER
+    if tags and header:
+        # Fastly's Surrogate-Key is space separated, while others such as
+        # Cloudflare's Cache-Tag are comma separated.
+        sep = " " if header.lower() == "surrogate-key" else ","
+        response[header] = sep.join(sorted(tags))
+    return tags
+
+
+def _index_tags(
+    cache: BaseCache, cache_key: str, tags: Set[str], timeout: int
+) -> None:
+    """
+    Records ``cache_key`` as carrying each of ``tags``, until it expires after
+    ``timeout`` seconds.
+    """
+    if tags:
+        get_keyring(cache, TAGS).add_many(
+            ((tag, cache_key) for tag in tags), timeout
+        )
+
+
 def _delete_vary_cookie(response: HttpResponse) -> None:
     """
     Deletes the ``Vary: Cookie`` header while keeping other items of the
@@ -89,23 +225,104 @@ def _delete_vary_cookie(response: HttpResponse) -> None:
         response["Vary"] = ", ".join(vary_headers)
 
 
+@lru_cache(maxsize=None)
+def _ignore_qs_matcher() -> Optional[Callable[[str], bool]]:
+    """
+    Compiles ``WAGTAIL_CACHE_IGNORE_QS`` into a single regex, returning a
+    function which tests if a querystring key should be ignored.
+    """
+    patterns = wagtailcache_settings.WAGTAIL_CACHE_IGNORE_QS
+    if not patterns:
+        return None
+    try:
+        regex = re.compile("|".join(f"(?:{p})" for p in patterns))
+    except re.error:
+        # Patterns containing global inline flags such as ``(?i)`` cannot be
+        # combined, so fall back to trying each one.
+        regexes = [re.compile(p) for p in patterns]
+        return lambda q: any(r.match(q) for r in regexes)
+    return lambda q: regex.match(q) is not None
+
+
+@lru_cache(maxsize=1024)
+def _chop_querystring_str(qs: str, encoding: Optional[str]) -> Optional[str]:
+    """
+    Given a raw querystring, remove any of our ignored querystrings from it.
+    Returns ``None`` if nothing was removed.
+    """
+    ignore = _ignore_qs_matcher()
+    if ignore is None:
+        return None
+    get = QueryDict(qs, mutable=True, encoding=encoding)
+    ignored = [q for q in get if ignore(q)]
+    if not ignored:
+        return None
+    for q in ignored:
+        del get[q]
+    return get.urlencode()
+
+
+@receiver(setting_changed)
+def _reset_querystring_caches(*, setting: str, **kwargs) -> None:
+    if setting == "WAGTAIL_CACHE_IGNORE_QS":
+        _ignore_qs_matcher.cache_clear()
+        _chop_querystring_str.cache_clear()
+
+
+def _get_stale_while_revalidate(response: HttpResponse) -> int:
+    """
+    Returns the ``stale-while-revalidate`` section of the ``Cache-Control``
+    header, falling back to ``WAGTAIL_CACHE_STALE_WHILE_REVALIDATE``.
+    Inspired by ``django.utils.cache.get_max_age``.
+    """
+    for field in cc_delim_re.split(response.get("Cache-Control", "")):
+        name, _, value = field.partition("=")
+        if name.strip().lower() == "stale-while-revalidate":
+            try:
+                return max(int(value), 0)
+            except ValueError:
+                break
+    return wagtailcache_settings.WAGTAIL_CACHE_STALE_WHILE_REVALIDATE
+
+
+@lru_cache(maxsize=None)
+def _get_revalidate_executor() -> Optional[ThreadPoolExecutor]:
+    """
+    Returns the thread pool used to revalidate stale responses, or ``None`` if
+    stale responses are revalidated by the request which finds them.
+    """
+    workers = wagtailcache_settings.WAGTAIL_CACHE_REVALIDATE_WORKERS
+    if not workers:
+        return None
+    return ThreadPoolExecutor(
+        max_workers=workers, thread_name_prefix="wagtailcache"
+    )
+
+
+@receiver(setting_changed)
+def _reset_revalidate_executor(*, setting: str, **kwargs) -> None:
+    if setting == "WAGTAIL_CACHE_REVALIDATE_WORKERS":
+        executor = _get_revalidate_executor()
+        if executor is not None:
+            executor.shutdown(wait=True)
+        _get_revalidate_executor.cache_clear()
+
+
 def _chop_querystring(r: WSGIRequest) -> WSGIRequest:
     """
     Given a request object, remove any of our ignored querystrings from it.
     """
-    if len(r.GET) and wagtailcache_settings.WAGTAIL_CACHE_IGNORE_QS:
-        # Make a copy of querystrings, and delete any that should be ignored.
-        qs = r.GET.copy()
-        for q in r.GET:
-            for regex in wagtailcache_settings.WAGTAIL_CACHE_IGNORE_QS:
-                if re.match(regex, q):
-                    del qs[q]
-        # Mutate the request to include our chopped up querystrings. We must
-        # also mutate the raw QUERY_STRING as that is used within
-        # ``request.build_absolute_uri()`` which is used in Django cache
-        # middleware internals.
-        r.GET = qs
-        r.META["QUERY_STRING"] = qs.urlencode()
+    qs = r.META.get("QUERY_STRING", "")
+    if qs and wagtailcache_settings.WAGTAIL_CACHE_IGNORE_QS:
+        chopped = _chop_querystring_str(qs, r.encoding)
+        # Only mutate the request if something was removed.
+        if chopped is not None:
+            # Mutate the request to include our chopped up querystrings. We
+            # must also mutate the raw QUERY_STRING as that is used within
+            # ``request.build_absolute_uri()`` which is used in Django cache
+            # middleware internals.
+            r.GET = QueryDict(chopped, encoding=r.encoding)
+            r.META["QUERY_STRING"] = chopped
     return r
 
 
@@ -157,30 +374,195 @@ def _chop_response_vary(r: WSGIRequest, s: HttpResponse) -> HttpResponse:
     return s
 
 
-def _get_cache_key(r: WSGIRequest, c: BaseCache) -> str:
+# Percent-encoded characters which are left encoded in keyring URIs, because
+# decoding them would change where the path or a querystring value ends, or
+# make a literal percent sign ambiguous.
+_RESERVED_ESCAPES = re.compile(r"(%(?:2[3B56b]|3[DFdf]))")
+
+
+def _unquote_uri(uri: str) -> str:
     """
-    Wrapper for Django's get_cache_key which first strips specific
-    querystrings. Since the Django cache middleware is somewhat complicated and
-    RFC compliant, we are best off to chop and pass it along rather than
-    re-inventing the cache keying logic.
+    Decodes a URI for the keyring, so that it can be matched as it reads,
+    but leaves the escapes of reserved characters encoded so that the URI can
+    still be requested, e.g. by ``wagtailcache.warm``.
     """
-    r = _chop_querystring(r)
-    r = _chop_cookies(r)
-    return get_cache_key(r, None, r.method, c)
+    pieces = _RESERVED_ESCAPES.split(uri)
+    # Odd pieces are the escapes matched by the regex.
+    return "".join(p if i % 2 else unquote(p) for i, p in enumerate(pieces))
+
+
+class _RequestKey:
+    """
+    Cache keying information for a single request. This is computed once, from
+    the chopped request, and stored on the request so that it can be shared by
+    ``FetchFromCacheMiddleware`` and ``UpdateCacheMiddleware``.
+    """
+
+    def __init__(self, r: WSGIRequest, namespace: str = ""):
+        # The namespace holds the current generations of the cache, if enabled.
+        self.key_prefix: str = settings.CACHE_MIDDLEWARE_KEY_PREFIX + namespace
+        # The absolute URI used to track this request in the keyring.
+        self.uri: str = _unquote_uri(r.build_absolute_uri())
+        # The key under which the Vary header list of this URL is stored.
+        self.header_key: str = _generate_cache_header_key(self.key_prefix, r)
+        # The header list which ``cache_key`` was generated from.
+        self.headerlist: Optional[List[str]] = None
+        self.cache_key: Optional[str] = None
+
+    def generate(self, r: WSGIRequest, headerlist: List[str]) -> str:
+        """
+        Returns the cache key for the given header list, re-using the previous
+        result if the header list has not changed.
+        """
+        if self.cache_key is None or headerlist != self.headerlist:
+            self.headerlist = headerlist
+            self.cache_key = _generate_cache_key(
+                r, r.method, headerlist, self.key_prefix
+            )
+        return self.cache_key
+
+
+def _get_request_key(r: WSGIRequest) -> _RequestKey:
+    """
+    Returns the ``_RequestKey`` of a request, chopping the request and
+    computing it if this has not already been done.
+    """
+    key = getattr(r, "_wagtailcache_key", None)
+    if key is None:
+        with timed(r, "qs"):
+            r = _chop_querystring(r)
+        with timed(r, "cookies"):
+            r = _chop_cookies(r)
+        with timed(r, "key"):
+            _wagcache = caches[wagtailcache_settings.WAGTAIL_CACHE_BACKEND]
+            key = _RequestKey(r, get_namespace(_wagcache, get_hostname(r)))
+        setattr(r, "_wagtailcache_key", key)
+    return key
+
+
+async def _aget_request_key(r: WSGIRequest) -> _RequestKey:
+    """
+    Async version of ``_get_request_key``.
+    """
+    key = getattr(r, "_wagtailcache_key", None)
+    if key is None:
+        with timed(r, "qs"):
+            r = _chop_querystring(r)
+        with timed(r, "cookies"):
+            r = _chop_cookies(r)
+        with timed(r, "key"):
+            _wagcache = caches[wagtailcache_settings.WAGTAIL_CACHE_BACKEND]
+            namespace = await aget_namespace(_wagcache, get_hostname(r))
+            key = _RequestKey(r, namespace)
+        setattr(r, "_wagtailcache_key", key)
+    return key
+
+
+def _get_cache_key(r: WSGIRequest, c: BaseCache) -> Optional[str]:
+    """
+    Equivalent of Django's get_cache_key which first strips specific
+    querystrings and cookies. Since the Django cache middleware is somewhat
+    complicated and RFC compliant, we are best off to chop and re-use Django's
+    key generation rather than re-inventing the cache keying logic.
+    """
+    key = _get_request_key(r)
+    with timed(r, "headers"):
+        headerlist = cache_get(c, key.header_key)
+    if headerlist is None:
+        return None
+    return key.generate(r, headerlist)
+
+
+async def _aget_cache_key(r: WSGIRequest, c: BaseCache) -> Optional[str]:
+    """
+    Async version of ``_get_cache_key``.
+    """
+    key = await _aget_request_key(r)
+    with timed(r, "headers"):
+        headerlist = await acache_get(c, key.header_key)
+    if headerlist is None:
+        return None
+    return key.generate(r, headerlist)
+
+
+def _copy_request(request: WSGIRequest) -> WSGIRequest:
+    """
+    Returns a copy of ``request`` to render in another thread, with its own
+    ``META``, and none of the wagtail-cache state of ``request``, such as its
+    timings and collected tags, which it is still using.
+    """
+    copied = copy.copy(request)
+    copied.META = request.META.copy()
+    for attr in [a for a in vars(copied) if a.startswith("_wagtailcache_")]:
+        delattr(copied, attr)
+    return copied
+
+
+def _is_async_native(c: BaseCache) -> bool:
+    """
+    Returns ``True`` if the cache backend implements the async cache API
+    itself, rather than running the sync API in a thread. Django < 4.0 has no
+    async cache API at all.
+    """
+    aget = getattr(type(c), "aget", None)
+    return aget is not None and aget is not getattr(BaseCache, "aget", None)
+
+
+def _get_headerlist(s: HttpResponse) -> List[str]:
+    """
+    Returns the request headers which the response varies on, as
+    ``request.META`` keys.
+    """
+    headerlist = []
+    if s.has_header("Vary"):
+        # If i18n is used, the generated cache key will be suffixed with the
+        # current locale. Adding the raw value of Accept-Language is redundant
+        # in that case and would result in storing the same content under
+        # multiple keys in the cache.
+        # Likewise if we negotiate the content encoding ourselves, there is no
+        # need to store a separate copy for each raw Accept-Encoding, unless
+        # the response has already been encoded.
+        skip_accept_encoding = negotiates_encoding() and not s.has_header(
+            "Content-Encoding"
+        )
+        for header in cc_delim_re.split(s["Vary"]):
+            header = header.upper().replace("-", "_")
+            if header == "ACCEPT_LANGUAGE" and settings.USE_I18N:
+                continue
+            if header == "ACCEPT_ENCODING" and skip_accept_encoding:
+                continue
+            headerlist.append("HTTP_" + header)
+        headerlist.sort()
+    return headerlist
 
 
 def _learn_cache_key(
     r: WSGIRequest, s: HttpResponse, t: int, c: BaseCache
 ) -> str:
     """
-    Wrapper for Django's learn_cache_key which first strips specific
-    querystrings. Since the Django cache middleware is somewhat complicated and
-    RFC compliant, we are best off to chop and pass it along rather than
-    re-inventing the cache keying logic.
+    Equivalent of Django's learn_cache_key which first strips specific
+    querystrings and cookies. Since the Django cache middleware is somewhat
+    complicated and RFC compliant, we are best off to chop and re-use Django's
+    key generation rather than re-inventing the cache keying logic.
     """
-    r = _chop_querystring(r)
-    r = _chop_cookies(r)
-    return learn_cache_key(r, s, t, None, c)
+    key = _get_request_key(r)
+    headerlist = _get_headerlist(s)
+    with timed(r, "set"):
+        cache_set(c, key.header_key, headerlist, t)
+    return key.generate(r, headerlist)
+
+
+async def _alearn_cache_key(
+    r: WSGIRequest, s: HttpResponse, t: int, c: BaseCache
+) -> str:
+    """
+    Async version of ``_learn_cache_key``.
+    """
+    key = _get_request_key(r)
+    headerlist = _get_headerlist(s)
+    with timed(r, "set"):
+        await acache_set(c, key.header_key, headerlist, t)
+    return key.generate(r, headerlist)
 
 
 class FetchFromCacheMiddleware(MiddlewareMixin):
@@ -189,14 +571,28 @@ class FetchFromCacheMiddleware(MiddlewareMixin):
     Mostly stolen from ``django.middleware.cache.FetchFromCacheMiddleware``.
     """
 
+    # Seconds between checks for a page rendered by another request.
+    lock_interval = 0.05
+
     def __init__(self, get_response):
         self._wagcache = caches[wagtailcache_settings.WAGTAIL_CACHE_BACKEND]
         super().__init__(get_response)
 
-    def process_request(self, request: WSGIRequest) -> Optional[HttpResponse]:
-        if not wagtailcache_settings.WAGTAIL_CACHE:
-            return None
+    async def __acall__(self, request: WSGIRequest) -> HttpResponse:
+        """
+        Under ASGI, fetch from the cache with the async cache API, rather than
+        running ``process_request`` in a thread.
+        """
+        response = await self.aprocess_request(request)
+        return response or await self.get_response(request)
 
+    def _is_cacheable(
+        self, request: WSGIRequest, is_authenticated: bool
+    ) -> bool:
+        """
+        Returns ``True`` if the request is cacheable. Marks the request to be
+        skipped if it is not.
+        """
         # Check if request is cacheable
         # Only cache GET and HEAD requests.
         # Don't cache requests that are previews.
@@ -206,31 +602,180 @@ class FetchFromCacheMiddleware(MiddlewareMixin):
         is_cacheable = (
             request.method in ("GET", "HEAD")
             and not getattr(request, "is_preview", False)
-            and not (hasattr(request, "user") and request.user.is_authenticated)
+            and not is_authenticated
         )
 
         # Allow the user to override our caching decision.
-        for fn in hooks.get_hooks("is_request_cacheable"):
-            result = fn(request, is_cacheable)
-            if isinstance(result, bool):
-                is_cacheable = result
+        with timed(request, "hooks"):
+            rules = get_rules()
+            if rules is not None:
+                decision = rules.decide_request(request)
+                if decision is not None:
+                    is_cacheable = decision
+            for fn in get_hooks("is_request_cacheable"):
+                result = fn(request, is_cacheable)
+                if isinstance(result, bool):
+                    is_cacheable = result
 
         if not is_cacheable:
             setattr(request, "_wagtailcache_update", False)
             setattr(request, "_wagtailcache_skip", True)
+        return is_cacheable
+
+    def process_request(self, request: WSGIRequest) -> Optional[HttpResponse]:
+        if not wagtailcache_settings.WAGTAIL_CACHE:
+            return None
+        if is_bypassed(request):
+            setattr(request, "_wagtailcache_bypass", True)
+            return None
+
+        start_timing(request)
+        is_authenticated = (
+            hasattr(request, "user") and request.user.is_authenticated
+        )
+        if not self._is_cacheable(request, is_authenticated):
             return None  # Don't bother checking the cache.
 
+        start = time.perf_counter()
+        response = self._fetch(request)
+        record_fetch(time.perf_counter() - start)
+        count_hit(request)
+        if response is None and getattr(request, "_wagtailcache_update", False):
+            # Track what the response depends on while it is rendered.
+            collect(request)
+        return response
+
+    async def aprocess_request(
+        self, request: WSGIRequest
+    ) -> Optional[HttpResponse]:
+        """
+        Async version of ``process_request``. A fresh hit or a plain miss is
+        handled entirely on the event loop. Less common cases, which need to
+        wait on locks, are handed to ``process_request`` in a thread.
+        """
+        if not wagtailcache_settings.WAGTAIL_CACHE:
+            return None
+        if is_bypassed(request):
+            setattr(request, "_wagtailcache_bypass", True)
+            return None
+        if (hasattr(request, "user") and not hasattr(request, "auser")) or (
+            get_hooks("is_request_cacheable")
+        ):
+            # Before Django 5.0 there is no ``auser()``, and reading the user
+            # may load the session from the database. Hooks may also do
+            # anything synchronous. Both need a thread.
+            return await sync_to_async(self.process_request)(request)
+
+        start_timing(request)
+        if hasattr(request, "auser"):
+            is_authenticated = (await request.auser()).is_authenticated
+        else:
+            is_authenticated = False
+        if not self._is_cacheable(request, is_authenticated):
+            return None  # Don't bother checking the cache.
+
+        start = time.perf_counter()
+        response = await self._afetch(request)
+        record_fetch(time.perf_counter() - start)
+        count_hit(request)
+        if response is None and getattr(request, "_wagtailcache_update", False):
+            # Track what the response depends on while it is rendered.
+            collect(request)
+        return response
+
+    async def _afetch(self, request: WSGIRequest) -> Optional[HttpResponse]:
+        """
+        Async version of ``_fetch``.
+        """
+        if getattr(self._wagcache, "aget", None) is None or (
+            get_local_cache() is None and not _is_async_native(self._wagcache)
+        ):
+            # The backend would run each async call in a thread anyway, or has
+            # no async API, so make a single trip to a thread for the whole
+            # fetch.
+            return await sync_to_async(self._fetch)(request)
+
+        # Try and get the cached response.
+        try:
+            cache_key = await _aget_cache_key(request, self._wagcache)
+            response = None
+            if cache_key is not None:
+                with timed(request, "get"):
+                    response = await acache_get(self._wagcache, cache_key)
+            if is_encoded_response(response):
+                expires = get_expires(response)
+                if expires and expires[0] < time.time():
+                    return await sync_to_async(self._fetch)(request)
+                with timed(request, "decode"):
+                    response = decode_response(
+                        response, request.META.get("HTTP_ACCEPT_ENCODING", "")
+                    )
+
+        except Exception:
+            # If the cache backend is currently unresponsive or errors out,
+            # return None and log the error.
+            setattr(request, "_wagtailcache_error", True)
+            logger.exception("Could not fetch page from cache backend.")
+            return None
+
+        # No cache information available, need to rebuild.
+        if response is None:
+            if wagtailcache_settings.WAGTAIL_CACHE_MISS_LOCK:
+                return await sync_to_async(self._miss)(request)
+            return self._miss(request)
+
+        # Hit. Return cached response.
+        setattr(request, "_wagtailcache_update", False)
+        return response
+
+    def _fetch(self, request: WSGIRequest) -> Optional[HttpResponse]:
+        """
+        Returns the cached response of a cacheable request, or ``None`` if the
+        request should be rendered.
+        """
         # Try and get the cached response.
         try:
             cache_key = _get_cache_key(request, self._wagcache)
 
             # No cache information available, need to rebuild.
             if cache_key is None:
-                setattr(request, "_wagtailcache_update", True)
-                return None
+                return self._miss(request)
 
             # We have a key, get the cached response.
-            response = self._wagcache.get(cache_key)
+            with timed(request, "get"):
+                response = cache_get(self._wagcache, cache_key)
+            if is_encoded_response(response):
+                expires = get_expires(response)
+                if expires and expires[0] < time.time():
+                    # The response is stale. Check the backend in case a
+                    # fresher copy was stored since it was cached locally.
+                    if get_local_cache() is not None:
+                        response = self._wagcache.get(cache_key) or response
+                        expires = get_expires(response)
+                if expires and expires[0] < time.time():
+                    executor = _get_revalidate_executor()
+                    if getattr(request, "_wagtailcache_revalidate", False):
+                        # This request is already revalidating it.
+                        setattr(request, "_wagtailcache_update", True)
+                        return None
+                    elif not self._lock_revalidate(cache_key, expires):
+                        # Another request is revalidating it. Serve stale.
+                        setattr(request, "_wagtailcache_stale", True)
+                    elif executor is None:
+                        # Revalidate it by rendering this request.
+                        setattr(request, "_wagtailcache_revalidate", True)
+                        setattr(request, "_wagtailcache_update", True)
+                        return None
+                    else:
+                        # Serve stale, and revalidate it in the background.
+                        background = _copy_request(request)
+                        setattr(background, "_wagtailcache_revalidate", True)
+                        setattr(request, "_wagtailcache_stale", True)
+                        executor.submit(self._render, background)
+                with timed(request, "decode"):
+                    response = decode_response(
+                        response, request.META.get("HTTP_ACCEPT_ENCODING", "")
+                    )
 
         except Exception:
             # If the cache backend is currently unresponsive or errors out,
@@ -241,13 +786,94 @@ class FetchFromCacheMiddleware(MiddlewareMixin):
 
         # No cache information available, need to rebuild.
         if response is None:
-            setattr(request, "_wagtailcache_update", True)
-            return None
+            return self._miss(request)
 
         # Hit. Return cached response.
         setattr(request, "_wagtailcache_update", False)
         return response
 
+    def _miss(self, request: WSGIRequest) -> Optional[HttpResponse]:
+        """
+        Handles a cache miss. With ``WAGTAIL_CACHE_MISS_LOCK``, only the
+        request which takes a lock with ``cache.add`` renders the page, while
+        other requests for the same URL wait for it to be cached. Returns the
+        cached response, or ``None`` if this request should render the page.
+        """
+        setattr(request, "_wagtailcache_update", True)
+        if not wagtailcache_settings.WAGTAIL_CACHE_MISS_LOCK or hasattr(
+            request, "_wagtailcache_lock"
+        ):
+            return None
+        timeout = wagtailcache_settings.WAGTAIL_CACHE_MISS_LOCK_TIMEOUT
+        header_key = _get_request_key(request).header_key
+        lock_key = header_key + ".lock"
+        nolock_key = header_key + ".nolock"
+        deadline = time.monotonic() + timeout
+        waits = 0
+        try:
+            # Don't queue requests for a URL whose response cannot be cached.
+            if self._wagcache.get(nolock_key):
+                return None
+            while not self._wagcache.add(lock_key, True, math.ceil(timeout)):
+                # Stop waiting and render the page.
+                if time.monotonic() >= deadline:
+                    return None
+                time.sleep(self.lock_interval)
+                waits += 1
+                cache_key = _get_cache_key(request, self._wagcache)
+                if cache_key is None:
+                    if self._wagcache.get(nolock_key):
+                        return None
+                    continue
+                response = cache_get(self._wagcache, cache_key)
+                if response is None:
+                    continue
+                setattr(request, "_wagtailcache_update", False)
+                if is_encoded_response(response):
+                    response = decode_response(
+                        response, request.META.get("HTTP_ACCEPT_ENCODING", "")
+                    )
+                return response
+            setattr(request, "_wagtailcache_lock", lock_key)
+        except Exception:
+            logger.exception("Could not lock page in cache backend.")
+        finally:
+            setattr(request, "_wagtailcache_waits", waits)
+        return None
+
+    def _lock_revalidate(
+        self, cache_key: str, expires: Tuple[float, float]
+    ) -> bool:
+        """
+        Returns ``True`` if the caller should revalidate a stale response,
+        using ``cache.add`` as a lock so that only one request, in any process,
+        revalidates each response. The lock is held until the stale response
+        expires, or until it is replaced by a fresh one.
+        """
+        lock_key = f"{cache_key}.revalidate.{expires[0]}"
+        timeout = max(int(expires[1] - time.time()), 1)
+        return self._wagcache.add(lock_key, True, timeout)
+
+    def _render(self, request: WSGIRequest) -> None:
+        """
+        Renders a request and updates the cache with the response. Runs in the
+        background, after the stale response has been served.
+        """
+        try:
+            setattr(request, "_wagtailcache_update", True)
+            collect(request)
+            middleware = UpdateCacheMiddleware(self.get_response)
+            if iscoroutinefunction(middleware):
+                response = async_to_sync(middleware)(request)
+            else:
+                response = middleware(request)
+            if isinstance(response, SimpleTemplateResponse):
+                response.render()
+        except Exception:
+            logger.exception("Could not revalidate page in cache backend.")
+        finally:
+            close_old_connections()
+
 
 class UpdateCacheMiddleware(MiddlewareMixin):
     """
@@ -259,11 +885,74 @@ class UpdateCacheMiddleware(MiddlewareMixin):
         self._wagcache = caches[wagtailcache_settings.WAGTAIL_CACHE_BACKEND]
         super().__init__(get_response)
 
+    async def __acall__(self, request: WSGIRequest) -> HttpResponse:
+        """
+        Under ASGI, update the cache with the async cache API, rather than
+        running ``process_response`` in a thread.
+        """
+        response = await self.get_response(request)
+        return await self.aprocess_response(request, response)
+
     def process_response(
         self, request: WSGIRequest, response: HttpResponse
     ) -> HttpResponse:
+        timeouts = self._get_timeouts(request, response)
+        if timeouts is not None:
+            self._update(request, response, *timeouts)
+        else:
+            collected(request)
+        record_response(request, response)
+        finish_timing(request, response)
+        return response
+
+    async def aprocess_response(
+        self, request: WSGIRequest, response: HttpResponse
+    ) -> HttpResponse:
+        """
+        Async version of ``process_response``.
+        """
+        if get_hooks("is_response_cacheable") or get_hooks("get_cache_tags"):
+            # Hooks may do anything synchronous, such as query the database.
+            return await sync_to_async(self.process_response)(request, response)
+        timeouts = self._get_timeouts(request, response)
+        if timeouts is None:
+            collected(request)
+        elif (
+            not _is_async_native(self._wagcache)
+            or wagtailcache_settings.WAGTAIL_CACHE_KEYRING
+            or hasattr(request, "_wagtailcache_lock")
+            or (
+                isinstance(response, SimpleTemplateResponse)
+                and not response.is_rendered
+            )
+        ):
+            # These need a thread anyway, need locks, or need to wait until
+            # the response is rendered.
+            await sync_to_async(self._update)(request, response, *timeouts)
+        else:
+            await self._aupdate(request, response, *timeouts)
+        record_response(request, response)
+        finish_timing(request, response)
+        return response
+
+    def _get_timeouts(
+        self, request: WSGIRequest, response: HttpResponse
+    ) -> Optional[Tuple[int, Optional[Tuple[float, float]]]]:
+        """
+        Patches the response's headers, and returns the timeout to cache it
+        for and its ``expires`` for ``encode_response()``. Returns ``None`` if
+        the response should not be cached.
+        """
         if not wagtailcache_settings.WAGTAIL_CACHE:
-            return response
+            return None
+
+        _patch_lock_header(request, response)
+
+        if getattr(request, "_wagtailcache_bypass", False):
+            # Static files, media, and the admin set their own
+            # ``Cache-Control``, or have no need for one.
+            _patch_header(response, Status.SKIP, no_cache=False)
+            return None
 
         if (
             hasattr(request, "_wagtailcache_skip")
@@ -271,7 +960,7 @@ class UpdateCacheMiddleware(MiddlewareMixin):
         ):
             # If we should skip this response, add header and return.
             _patch_header(response, Status.SKIP)
-            return response
+            return None
 
         if (
             hasattr(request, "_wagtailcache_error")
@@ -280,18 +969,22 @@ class UpdateCacheMiddleware(MiddlewareMixin):
             # There was an error trying to fetch this response from the cache.
             # Do not try to update, simply return.
             _patch_header(response, Status.ERROR)
-            return response
+            return None
 
         if (
             hasattr(request, "_wagtailcache_update")
             and not request._wagtailcache_update
         ):
-            # Add a response header to indicate this was a cache hit.
-            _patch_header(response, Status.HIT)
+            # Add a response header to indicate this was a cache hit, or that
+            # a stale response was served while it is being revalidated.
+            if getattr(request, "_wagtailcache_stale", False):
+                _patch_header(response, Status.STALE)
+            else:
+                _patch_header(response, Status.HIT)
             # Potentially remove the ``Vary: Cookie`` header.
             _chop_response_vary(request, response)
             # We don't need to update the cache, just return.
-            return response
+            return None
 
         # Check if the response is cacheable
         # Don't cache private or no-cache responses.
@@ -314,26 +1007,53 @@ class UpdateCacheMiddleware(MiddlewareMixin):
         )
 
         # Allow the user to override our caching decision.
-        for fn in hooks.get_hooks("is_response_cacheable"):
-            result = fn(response, is_cacheable)
-            if isinstance(result, bool):
-                is_cacheable = result
+        with timed(request, "hooks"):
+            rules = get_rules()
+            if rules is not None:
+                decision = rules.decide_response(request, response)
+                if decision is not None:
+                    is_cacheable = decision
+            for fn in get_hooks("is_response_cacheable"):
+                result = fn(response, is_cacheable)
+                if isinstance(result, bool):
+                    is_cacheable = result
 
         # If we are not allowed to cache the response, just return.
         if not is_cacheable:
             # Add response header to indicate this was intentionally not cached.
             _patch_header(response, Status.SKIP)
-            return response
-
-        # Potentially remove the ``Vary: Cookie`` header.
-        _chop_response_vary(request, response)
-        # Try to get the timeout from the ``max-age`` section of the
-        # ``Cache-Control`` header before reverting to using the cache's
-        # default.
-        timeout = get_max_age(response)
-        if timeout is None:
-            timeout = self._wagcache.default_timeout
-        patch_response_headers(response, timeout)
+            timeout = 0
+        else:
+            # Potentially remove the ``Vary: Cookie`` header.
+            _chop_response_vary(request, response)
+            # Try to get the timeout from the ``max-age`` section of the
+            # ``Cache-Control`` header before reverting to using the cache's
+            # default.
+            timeout = get_max_age(response)
+            if timeout is None:
+                timeout = self._wagcache.default_timeout
+            patch_response_headers(response, timeout)
+
+        # Keep the response past its timeout, to serve it stale while it is
+        # revalidated.
+        expires = None
+        stale = _get_stale_while_revalidate(response) if timeout else 0
+        if stale:
+            now = time.time()
+            expires = (now + timeout, now + timeout + stale)
+            timeout += stale
+        return timeout, expires
+
+    def _update(
+        self,
+        request: WSGIRequest,
+        response: HttpResponse,
+        timeout: int,
+        expires: Optional[Tuple[float, float]],
+    ) -> None:
+        """
+        Stores the response in the cache, if ``timeout`` is not zero.
+        """
         if timeout:
             try:
                 cache_key = _learn_cache_key(
@@ -341,88 +1061,221 @@ class UpdateCacheMiddleware(MiddlewareMixin):
                 )
                 # Track cache keys based on URI.
                 # (of the chopped request, not the real one).
-                cr = _chop_querystring(request)
-                uri = unquote(cr.build_absolute_uri())
-
                 if wagtailcache_settings.WAGTAIL_CACHE_KEYRING:
-                    keyring = self._wagcache.get("keyring", {})
-                    # Get current cache keys belonging to this URI.
-                    # This should be a list of keys.
-                    uri_keys: List[str] = keyring.get(uri, [])
-                    # Append the key to this list if not already present and save.
-                    if cache_key not in uri_keys:
-                        uri_keys.append(cache_key)
-                        keyring[uri] = uri_keys
-                        self._wagcache.set("keyring", keyring)
+                    uri = _get_request_key(request).uri
+                    with timed(request, "keyring"):
+                        get_keyring(self._wagcache).add(uri, cache_key, timeout)
 
                 if isinstance(response, SimpleTemplateResponse):
 
                     def callback(r):
-                        self._wagcache.set(cache_key, r, timeout)
+                        self._store(request, cache_key, r, timeout, expires)
 
                     response.add_post_render_callback(callback)
                 else:
-                    self._wagcache.set(cache_key, response, timeout)
+                    self._store(request, cache_key, response, timeout, expires)
                 # Add a response header to indicate this was a cache miss.
                 _patch_header(response, Status.MISS)
             except Exception:
                 _patch_header(response, Status.ERROR)
                 logger.exception("Could not update page in cache backend.")
+        else:
+            collected(request)
+            if hasattr(request, "_wagtailcache_lock"):
+                # Let other requests for this URL render it at once, rather
+                # than waiting for a response which will never be cached.
+                self._wagcache.set(
+                    _get_request_key(request).header_key + ".nolock",
+                    True,
+                    NOLOCK_TIMEOUT,
+                )
 
-        return response
+        _release_lock(request, response, self._wagcache)
+
+    def _store(
+        self,
+        request: WSGIRequest,
+        cache_key: str,
+        response: HttpResponse,
+        timeout: int,
+        expires: Optional[Tuple[float, float]],
+    ) -> None:
+        """
+        Encodes and stores the response in the cache, and indexes its tags.
+        """
+        tags = _tag_response(request, response)
+        start = time.perf_counter()
+        with timed(request, "encode"):
+            value = encode_response(response, expires)
+        with timed(request, "set"):
+            cache_set(self._wagcache, cache_key, value, timeout)
+        record_store(time.perf_counter() - start, get_size(value))
+        with timed(request, "tags"):
+            _index_tags(self._wagcache, cache_key, tags, timeout)
+
+    async def _aupdate(
+        self,
+        request: WSGIRequest,
+        response: HttpResponse,
+        timeout: int,
+        expires: Optional[Tuple[float, float]],
+    ) -> None:
+        """
+        Async version of ``_update``, for rendered responses without a URL
+        keyring or lock to update.
+        """
+        if not timeout:
+            collected(request)
+            return
+        try:
+            cache_key = await _alearn_cache_key(
+                request, response, timeout, self._wagcache
+            )
+            tags = _tag_response(request, response)
+            start = time.perf_counter()
+            with timed(request, "encode"):
+                value = encode_response(response, expires)
+            with timed(request, "set"):
+                await acache_set(self._wagcache, cache_key, value, timeout)
+            record_store(time.perf_counter() - start, get_size(value))
+            if tags:
+                with timed(request, "tags"):
+                    await sync_to_async(_index_tags)(
+                        self._wagcache, cache_key, tags, timeout
+                    )
+            # Add a response header to indicate this was a cache miss.
+            _patch_header(response, Status.MISS)
+        except Exception:
+            # Stop collecting dependencies, if the error came before the tags.
+            collected(request)
+            _patch_header(response, Status.ERROR)
+            logger.exception("Could not update page in cache backend.")
 
 
-def clear_cache(urls: List[str] = []) -> None:
+def clear_cache(
+    urls: List[str] = [],
+    tags: List[str] = [],
+    sites: List[object] = [],
+    exact: List[str] = [],
+    prefixes: List[str] = [],
+) -> None:
     """
     Clears the Wagtail cache backend.
 
     :param urls: An optional list of strings, representing regular expressions
     to match against the list of URLs in the cache. If a URL matches, it is
     deleted from the cache. If ``urls`` is ``None`` the entire cache is cleared.
+
+    :param tags: An optional list of tags. Every response carrying any of these
+    tags is deleted from the cache. If only ``tags`` are given, nothing else is
+    cleared.
+
+    :param sites: An optional list of Wagtail ``Site`` objects, or hostnames.
+    Every response served from these hostnames is cleared. If only ``sites``
+    are given, other sites are not cleared.
+
+    :param exact: An optional list of URLs to delete from the cache. Absolute
+    URLs are deleted without reading the rest of the keyring, and paths
+    starting with ``/`` are deleted from every host.
+
+    :param prefixes: An optional list of URL prefixes. Every URL starting with
+    one of these is deleted from the cache. Prefixes starting with ``/`` apply
+    to every host.
     """
 
     if not wagtailcache_settings.WAGTAIL_CACHE:
         return
 
+    if tags:
+        clear_tags(tags)
+        if not urls and not sites and not exact and not prefixes:
+            return
+
     _wagcache = caches[wagtailcache_settings.WAGTAIL_CACHE_BACKEND]
+    hostnames = [getattr(site, "hostname", site) for site in sites]
+    if hostnames and wagtailcache_settings.WAGTAIL_CACHE_GENERATIONS:
+        next_generation(_wagcache, hostnames)
+        if not urls and not exact and not prefixes:
+            return
+    elif hostnames:
+        urls = list(urls) + [
+            r"^https?://%s(:\d+)?/" % re.escape(hostname)
+            for hostname in hostnames
+        ]
+
+    keyring = get_keyring(_wagcache)
     if (
-        urls
+        (urls or exact or prefixes)
         and wagtailcache_settings.WAGTAIL_CACHE_KEYRING
-        and "keyring" in _wagcache
+        and keyring.exists()
     ):
-        keyring = _wagcache.get("keyring")
-        # Check the provided URL matches a key in our keyring.
-        matched_urls = []
-        for regex in urls:
-            for key in keyring:
-                if re.match(regex, key):
-                    matched_urls.append(key)
-        # If it matches, delete each entry from the cache,
-        # and delete the URL from the keyring.
-        for url in matched_urls:
-            entries = keyring.get(url, [])
-            for cache_key in entries:
-                _wagcache.delete(cache_key)
-            del keyring[url]
-        # Save the keyring.
-        _wagcache.set("keyring", keyring)
+        matched_urls = {url for url in exact if not url.startswith("/")}
+        # Only read the whole keyring if the URLs are not all known.
+        if urls or prefixes or len(matched_urls) < len(exact):
+            index = UrlIndex(uri for uri, _ in keyring.items())
+            matched_urls.update(index.exact(exact))
+            matched_urls.update(index.prefix(prefixes))
+            matched_urls.update(index.match(urls))
+        # Delete the matched URLs from the keyring, and delete each entry from
+        # the cache.
+        popped = keyring.pop(matched_urls)
+        delete_many(_wagcache, (k for keys in popped.values() for k in keys))
+        # Clear the local cache of every process.
+        invalidate(_wagcache)
+        # Replace the purged pages, rather than leaving them to be rendered by
+        # the next visitor.
+        rewarm(popped)
+    # Starts a new generation, leaving the previous one to expire.
+    elif wagtailcache_settings.WAGTAIL_CACHE_GENERATIONS:
+        next_generation(_wagcache)
+        # The keyrings only list keys of the previous generation.
+        keyring.clear()
+        get_keyring(_wagcache, TAGS).clear()
     # Clears the entire cache backend used by wagtail-cache.
     else:
         _wagcache.clear()
+        invalidate(_wagcache)
 
 
 def cache_page(view_func: Callable[..., HttpResponse]):
     """
     Decorator that determines whether or not to cache a page or serve a cached
-    page.
+    page. Supports both regular and ``async def`` views.
     """
 
+    if iscoroutinefunction(view_func):
+
+        @wraps(view_func)
+        async def _async_wrapped_view_func(
+            request: WSGIRequest, *args, **kwargs
+        ) -> HttpResponse:
+            async def view(r: WSGIRequest) -> HttpResponse:
+                return await view_func(r, *args, **kwargs)
+
+            # Try to fetch an already cached page from wagtail-cache.
+            response = await FetchFromCacheMiddleware(view).aprocess_request(
+                request
+            )
+            if response is None:
+                # Since we don't have a response at this point, process the
+                # request.
+                response = await view_func(request, *args, **kwargs)
+            # Cache the response.
+            return await UpdateCacheMiddleware(view).aprocess_response(
+                request, response
+            )
+
+        return _async_wrapped_view_func
+
     @wraps(view_func)
     def _wrapped_view_func(
         request: WSGIRequest, *args, **kwargs
     ) -> HttpResponse:
+        def view(r: WSGIRequest) -> HttpResponse:
+            return view_func(r, *args, **kwargs)
+
         # Try to fetch an already cached page from wagtail-cache.
-        response = FetchFromCacheMiddleware(view_func).process_request(request)
+        response = FetchFromCacheMiddleware(view).process_request(request)
         if response is None:
             # Since we don't have a response at this point, process the request.
             response = view_func(request, *args, **kwargs)
@@ -437,9 +1290,25 @@ def cache_page(view_func: Callable[..., HttpResponse]):
 
 def nocache_page(view_func: Callable[..., HttpResponse]):
     """
-    Decorator that sets no-cache on all responses.
+    Decorator that sets no-cache on all responses. Supports both regular and
+    ``async def`` views.
     """
 
+    if iscoroutinefunction(view_func):
+
+        @wraps(view_func)
+        async def _async_wrapped_view_func(
+            request: WSGIRequest, *args, **kwargs
+        ) -> HttpResponse:
+            # Run the view.
+            response = await view_func(request, *args, **kwargs)
+            # Set cache-control if wagtail-cache is enabled.
+            if wagtailcache_settings.WAGTAIL_CACHE:
+                _patch_header(response, Status.SKIP)
+            return response
+
+        return _async_wrapped_view_func
+
     @wraps(view_func)
     def _wrapped_view_func(
         request: WSGIRequest, *args, **kwargs
@@ -472,7 +1341,7 @@ class WagtailCacheMixin:
     def serve(self, request, *args, **kwargs):
         """
         Add a custom cache-control header, or set to private if the page is
-        being served behind a view restriction.
+        being served behind a view restriction. Add any custom cache tags.
         """
         response = super().serve(request, *args, **kwargs)  # type: ignore
         if self.get_view_restrictions():  # type: ignore
@@ -482,4 +1351,9 @@ class WagtailCacheMixin:
                 response["Cache-Control"] = self.cache_control()
             else:
                 response["Cache-Control"] = self.cache_control
+        if hasattr(self, "cache_tags"):
+            if callable(self.cache_tags):
+                add_cache_tags(response, *self.cache_tags())
+            else:
+                add_cache_tags(response, *self.cache_tags)
         return response
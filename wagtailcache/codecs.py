@@ -0,0 +1,182 @@
+"""
+Codecs used to compress the bodies of cached responses.
+"""
+
+import gzip
+import zlib
+from functools import lru_cache
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from wagtailcache.settings import wagtailcache_settings
+
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class Codec:
+    """
+    Compresses and decompresses bytes. Subclass this to provide a custom codec
+    for ``WAGTAIL_CACHE_COMPRESS`` or ``WAGTAIL_CACHE_ENCODINGS``.
+    """
+
+    # The HTTP ``Content-Encoding`` produced by ``compress()``, if any. When a
+    # client accepts this encoding, compressed bodies are served as-is.
+    content_encoding: Optional[str] = None
+
+    def compress(self, data: bytes) -> bytes:
+        raise NotImplementedError
+
+    def decompress(self, data: bytes) -> bytes:
+        raise NotImplementedError
+
+
+class GzipCodec(Codec):
+    content_encoding = "gzip"
+
+    def __init__(self, level: int = 6):
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        # A fixed mtime makes the output deterministic.
+        return gzip.compress(data, compresslevel=self.level, mtime=0)
+
+    def decompress(self, data: bytes) -> bytes:
+        return gzip.decompress(data)
+
+
+class ZlibCodec(Codec):
+    # HTTP's "deflate" is the zlib format.
+    content_encoding = "deflate"
+
+    def __init__(self, level: int = 6):
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        return zlib.compress(data, self.level)
+
+    def decompress(self, data: bytes) -> bytes:
+        return zlib.decompress(data)
+
+
+class BrotliCodec(Codec):
+    """
+    Requires the ``brotli`` package.
+    """
+
+    content_encoding = "br"
+
+    def __init__(self, quality: int = 5):
+        if brotli is None:
+            raise ImproperlyConfigured(
+                "The brotli codec requires the `brotli` package."
+            )
+        self.quality = quality
+
+    def compress(self, data: bytes) -> bytes:
+        return brotli.compress(data, quality=self.quality)
+
+    def decompress(self, data: bytes) -> bytes:
+        return brotli.decompress(data)
+
+
+CODECS = {
+    "br": BrotliCodec,
+    "gzip": GzipCodec,
+    "zlib": ZlibCodec,
+}
+
+
+@lru_cache(maxsize=None)
+def get_codec(name: str) -> Codec:
+    """
+    Returns the codec registered as ``name``, or the codec class at the dotted
+    path ``name``.
+    """
+    if name in CODECS:
+        return CODECS[name]()
+    return import_string(name)()
+
+
+def get_storage_codec() -> Optional[Codec]:
+    """
+    Returns the codec configured by ``WAGTAIL_CACHE_COMPRESS``, if any.
+    """
+    name = wagtailcache_settings.WAGTAIL_CACHE_COMPRESS
+    return get_codec(name) if name else None
+
+
+def get_variant_codecs() -> List[Codec]:
+    """
+    Returns the codecs configured by ``WAGTAIL_CACHE_ENCODINGS``, in order of
+    preference.
+    """
+    names = wagtailcache_settings.WAGTAIL_CACHE_ENCODINGS or []
+    return [get_codec(name) for name in names]
+
+
+def negotiates_encoding() -> bool:
+    """
+    Returns ``True`` if wagtail-cache chooses the ``Content-Encoding`` of
+    cached responses itself, based on the request's ``Accept-Encoding``.
+    """
+    return bool(
+        wagtailcache_settings.WAGTAIL_CACHE_ENCODINGS
+        or wagtailcache_settings.WAGTAIL_CACHE_COMPRESS
+    )
+
+
+def parse_accept_encoding(header: str) -> Dict[str, float]:
+    """
+    Parses an ``Accept-Encoding`` header into ``{encoding: qvalue}``.
+    """
+    accepted = {}
+    for item in header.split(","):
+        encoding, _, params = item.partition(";")
+        encoding = encoding.strip().lower()
+        if not encoding:
+            continue
+        q = 1.0
+        params = params.strip().lower()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[encoding] = q
+    return accepted
+
+
+def negotiate(header: str, available: List[str]) -> Optional[str]:
+    """
+    Picks the best of the ``available`` content encodings which the client's
+    ``Accept-Encoding`` header allows, preferring the client's highest qvalue
+    and then the order of ``available``. Returns ``None`` if no encoding is
+    acceptable, in which case the identity body should be served.
+    """
+    accepted = parse_accept_encoding(header)
+    wildcard = accepted.get("*", 0.0)
+    best: Optional[Tuple[float, int]] = None
+    chosen = None
+    for i, encoding in enumerate(available):
+        q = accepted.get(encoding, wildcard)
+        if q > 0 and (best is None or (q, -i) > best):
+            best = (q, -i)
+            chosen = encoding
+    return chosen
+
+
+@receiver(setting_changed)
+def _reset_codecs(*, setting: str, **kwargs) -> None:
+    if setting in ("WAGTAIL_CACHE_COMPRESS", "WAGTAIL_CACHE_ENCODINGS"):
+        get_codec.cache_clear()
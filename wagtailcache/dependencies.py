@@ -0,0 +1,205 @@
+"""
+Tracks which Wagtail pages, snippets, images, and documents each cached
+response depends on, and clears only those responses when they change.
+"""
+
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Any
+from typing import FrozenSet
+from typing import Iterable
+from typing import Optional
+from typing import Set
+from typing import Tuple
+
+from django.apps import apps
+from django.core.cache import caches
+from django.core.handlers.wsgi import WSGIRequest
+from django.core.signals import setting_changed
+from django.db.models.signals import post_delete
+from django.db.models.signals import post_init
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from wagtail.signals import page_published
+from wagtail.signals import page_unpublished
+
+from wagtailcache.batch import delete_many
+from wagtailcache.keyring import TAGS
+from wagtailcache.keyring import get_keyring
+from wagtailcache.local import invalidate
+from wagtailcache.purge import enqueue_purge
+from wagtailcache.settings import wagtailcache_settings
+
+
+# Tags collected while rendering the current request, if it will be cached.
+_collector: ContextVar[Optional[Set[str]]] = ContextVar(
+    "wagtailcache_collector", default=None
+)
+# Tags of the ancestors of the page being served, once Wagtail has routed to
+# it.
+_ancestors: ContextVar[FrozenSet[str]] = ContextVar(
+    "wagtailcache_ancestors", default=frozenset()
+)
+# Prefix of the tags of pages.
+PAGE_TAG = "wagtailcore.page:"
+
+
+@lru_cache(maxsize=None)
+def _get_media_classes() -> Tuple[type, ...]:
+    """
+    Returns the base classes of images and documents, if those apps are
+    installed.
+    """
+    classes = []
+    if apps.is_installed("wagtail.images"):
+        from wagtail.images.models import AbstractImage
+
+        classes.append(AbstractImage)
+    if apps.is_installed("wagtail.documents"):
+        from wagtail.documents.models import AbstractDocument
+
+        classes.append(AbstractDocument)
+    return tuple(classes)
+
+
+def _is_page(instance: Any) -> bool:
+    from wagtail.models import Page
+
+    return isinstance(instance, Page)
+
+
+def _is_snippet(instance: Any) -> bool:
+    if not apps.is_installed("wagtail.snippets"):
+        return False
+    from wagtail.snippets.models import get_snippet_models
+
+    return isinstance(instance, tuple(get_snippet_models()))
+
+
+def get_tag(instance: Any) -> Optional[str]:
+    """
+    Returns the tag of a model instance which cached responses can depend on,
+    or ``None`` if changes to it are not tracked. Every kind of page shares
+    the ``wagtailcore.page`` tag, so a page is tracked by its ID whether or not
+    it was loaded as its specific type.
+    """
+    if instance.pk is None:
+        return None
+    if _is_page(instance):
+        return f"{PAGE_TAG}{instance.pk}"
+    if isinstance(instance, _get_media_classes()) or _is_snippet(instance):
+        return f"{instance._meta.label_lower}:{instance.pk}"
+    return None
+
+
+def collect(request: WSGIRequest) -> None:
+    """
+    Starts collecting the tags of objects loaded while rendering ``request``.
+    """
+    if not wagtailcache_settings.WAGTAIL_CACHE_TRACK_DEPENDENCIES:
+        return
+    tags = getattr(request, "_wagtailcache_tags", None)
+    if tags is None:
+        tags = set()
+        setattr(request, "_wagtailcache_tags", tags)
+        _ancestors.set(frozenset())
+    _collector.set(tags)
+
+
+def collected(request: WSGIRequest) -> Set[str]:
+    """
+    Stops collecting, and returns the tags collected for ``request``.
+    """
+    _collector.set(None)
+    _ancestors.set(frozenset())
+    return getattr(request, "_wagtailcache_tags", None) or set()
+
+
+def collect_served_page(page: Any) -> None:
+    """
+    Called once Wagtail has routed a request to ``page``. Drops the ancestors
+    loaded to find it, and stops collecting them, so that the site root and
+    home page do not depend on every page below them.
+    """
+    tags = _collector.get()
+    if tags is None:
+        return
+    ancestors = frozenset(
+        f"{PAGE_TAG}{pk}"
+        for pk in page.get_ancestors().values_list("pk", flat=True)
+    )
+    tags.difference_update(ancestors)
+    _ancestors.set(ancestors)
+
+
+def _collect_instance(*, instance: Any, **kwargs) -> None:
+    tags = _collector.get()
+    if tags is None:
+        return
+    tag = get_tag(instance)
+    if tag is not None and tag not in _ancestors.get():
+        tags.add(tag)
+
+
+def clear_tags(tags: Iterable[str]) -> None:
+    """
+    Deletes every cached response which carries any of ``tags``.
+    """
+    if not wagtailcache_settings.WAGTAIL_CACHE:
+        return
+    _wagcache = caches[wagtailcache_settings.WAGTAIL_CACHE_BACKEND]
+    keyring = get_keyring(_wagcache, TAGS)
+    popped = keyring.pop(tags)
+    if not popped:
+        return
+    delete_many(_wagcache, (k for keys in popped.values() for k in keys))
+    # Clear the local cache of every process.
+    invalidate(_wagcache)
+
+
+@receiver(page_published)
+@receiver(page_unpublished)
+def _clear_page(*, instance: Any, **kwargs) -> None:
+    if not wagtailcache_settings.WAGTAIL_CACHE_TRACK_DEPENDENCIES:
+        return
+    # The parent is cleared too, as it may list its children.
+    tags = [get_tag(instance)]
+    parent = instance.get_parent()
+    if parent is not None:
+        tags.append(get_tag(parent))
+    enqueue_purge(tags=tags)
+
+
+def _clear_instance(*, instance: Any, **kwargs) -> None:
+    # Pages are cleared when published or unpublished, rather than each time
+    # a draft is saved.
+    if _is_page(instance):
+        return
+    tag = get_tag(instance)
+    if tag is not None:
+        enqueue_purge(tags=[tag])
+
+
+def connect_signals() -> None:
+    """
+    Connects the receivers of every model's signals if
+    ``WAGTAIL_CACHE_TRACK_DEPENDENCIES`` is on, and disconnects them if not.
+    Django skips sending signals which have no receivers, so this keeps
+    creating model instances cheap when dependencies are not tracked.
+    """
+    receivers = [
+        (post_init, _collect_instance),
+        (post_save, _clear_instance),
+        (post_delete, _clear_instance),
+    ]
+    for signal, func in receivers:
+        if wagtailcache_settings.WAGTAIL_CACHE_TRACK_DEPENDENCIES:
+            signal.connect(func)
+        else:
+            signal.disconnect(func)
+
+
+@receiver(setting_changed)
+def _reset_signals(*, setting: str, **kwargs) -> None:
+    if setting == "WAGTAIL_CACHE_TRACK_DEPENDENCIES":
+        connect_signals()
@@ -0,0 +1,99 @@
+"""
+Generations, which are folded into every cache key so that the cache can be
+cleared by changing a single value rather than deleting every entry.
+"""
+
+import uuid
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+
+from asgiref.sync import sync_to_async
+from django.core.cache.backends.base import BaseCache
+from django.core.handlers.wsgi import WSGIRequest
+from django.http.request import split_domain_port
+
+from wagtailcache.local import acache_get_many
+from wagtailcache.local import cache_get_many
+from wagtailcache.local import invalidate
+from wagtailcache.settings import wagtailcache_settings
+
+
+# Cache key of the generation of the whole cache.
+CACHE_GENERATION_KEY = "generation:all"
+# Cache key prefix of the generation of each site, by hostname.
+SITE_GENERATION_PREFIX = "generation:site:"
+
+
+def get_hostname(request: WSGIRequest) -> str:
+    """
+    Returns the hostname which a request's site generation is tracked by.
+    """
+    return split_domain_port(request.get_host())[0].lower()
+
+
+def _get_keys(hostname: str) -> List[str]:
+    return [CACHE_GENERATION_KEY, SITE_GENERATION_PREFIX + hostname]
+
+
+def _new_generation() -> str:
+    # Random, rather than counting up, so that an evicted generation can never
+    # be recreated with a previous value and revive old entries.
+    return uuid.uuid4().hex[:12]
+
+
+def _join(cache: BaseCache, keys: List[str], found: Dict[str, str]) -> str:
+    generations = []
+    for key in keys:
+        generation = found.get(key)
+        if generation is None:
+            generation = _new_generation()
+            # Another process may have created it first.
+            if not cache.add(key, generation, None):
+                generation = cache.get(key, generation)
+        generations.append(generation)
+    return "." + ".".join(generations)
+
+
+def get_namespace(cache: BaseCache, hostname: str) -> str:
+    """
+    Returns the current generations of the whole cache and of the site at
+    ``hostname``, to be added to the prefix of its cache keys. Returns an
+    empty string if ``WAGTAIL_CACHE_GENERATIONS`` is off.
+    """
+    if not wagtailcache_settings.WAGTAIL_CACHE_GENERATIONS:
+        return ""
+    keys = _get_keys(hostname)
+    return _join(cache, keys, cache_get_many(cache, keys))
+
+
+async def aget_namespace(cache: BaseCache, hostname: str) -> str:
+    """
+    Async version of ``get_namespace()``.
+    """
+    if not wagtailcache_settings.WAGTAIL_CACHE_GENERATIONS:
+        return ""
+    keys = _get_keys(hostname)
+    found = await acache_get_many(cache, keys)
+    if len(found) < len(keys):
+        # Creating a generation is rare, and needs a few round trips.
+        return await sync_to_async(_join)(cache, keys, found)
+    return _join(cache, keys, found)
+
+
+def next_generation(
+    cache: BaseCache, hostnames: Optional[Iterable[str]] = None
+) -> None:
+    """
+    Starts a new generation of the whole cache, or only of the sites at
+    ``hostnames``. Entries of previous generations are never read again, and
+    expire by themselves.
+    """
+    if hostnames is None:
+        keys = [CACHE_GENERATION_KEY]
+    else:
+        keys = [SITE_GENERATION_PREFIX + h.lower() for h in hostnames]
+    cache.set_many({key: _new_generation() for key in keys}, None)
+    # Clear the local cache of every process.
+    invalidate(cache)
@@ -0,0 +1,156 @@
+"""
+Counts recent requests for each URL, to warm the most popular pages first.
+"""
+
+import atexit
+import logging
+import threading
+import time
+import zlib
+from collections import Counter
+from typing import Dict
+from typing import List
+from typing import Optional
+
+from django.core.cache import caches
+from django.core.handlers.wsgi import WSGIRequest
+
+from wagtailcache.batch import get_many
+from wagtailcache.batch import set_many
+from wagtailcache.keyring import lock_many
+from wagtailcache.settings import wagtailcache_settings
+
+
+logger = logging.getLogger("wagtail-cache")
+
+# Namespace of the hit counts in the cache.
+HITS = "hits"
+# Seconds covered by each window of counts. Counts are kept for the current
+# and previous window.
+WINDOW = 3600
+# Number of buckets the counts of each window are split into by URL.
+BUCKETS = 64
+# WSGI environ key marking requests which should not be counted, such as those
+# made by ``warm_cache()``.
+NOT_COUNTED = "wagtailcache.not_counted"
+
+
+def _bucket_key(window: int, uri: str) -> str:
+    n = zlib.crc32(uri.encode("utf-8")) % BUCKETS
+    return f"{HITS}:{window}:{n}"
+
+
+class HitCounter:
+    """
+    Counts requests in memory, and adds them to the counts in the cache from a
+    background thread every ``WAGTAIL_CACHE_HIT_COUNTS_INTERVAL`` seconds, so
+    that counting a request costs no I/O.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Held while flushing, so that ``flush()`` returns once every count
+        # taken before it was called is in the cache.
+        self._flush_lock = threading.Lock()
+        self._pending: Counter = Counter()
+        self._timer: Optional[threading.Timer] = None
+        # Do not lose counts which are waiting when the process exits.
+        atexit.register(self._run)
+
+    def record(self, uri: str) -> None:
+        """
+        Counts a request for ``uri``, and schedules a flush if none is.
+        """
+        with self._lock:
+            self._pending[uri] += 1
+            if self._timer is None:
+                self._timer = threading.Timer(
+                    wagtailcache_settings.WAGTAIL_CACHE_HIT_COUNTS_INTERVAL,
+                    self._run,
+                )
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _run(self) -> None:
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Could not save hit counts to cache backend.")
+
+    def flush(self) -> None:
+        """
+        Adds the counts in memory to the counts in the cache.
+        """
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, Counter()
+                timer, self._timer = self._timer, None
+            if timer is not None:
+                timer.cancel()
+            if pending:
+                self._save(pending)
+
+    def _save(self, pending: Counter) -> None:
+        cache = caches[wagtailcache_settings.WAGTAIL_CACHE_BACKEND]
+        window = int(time.time() // WINDOW)
+        by_bucket: Dict[str, List[str]] = {}
+        for uri in pending:
+            by_bucket.setdefault(_bucket_key(window, uri), []).append(uri)
+        with lock_many(cache, by_bucket):
+            buckets = get_many(cache, by_bucket)
+            for bucket_key, uris in by_bucket.items():
+                bucket = buckets.setdefault(bucket_key, {})
+                for uri in uris:
+                    bucket[uri] = bucket.get(uri, 0) + pending[uri]
+            set_many(cache, buckets, WINDOW * 2)
+
+
+_counter = HitCounter()
+
+
+def count_hit(request: WSGIRequest) -> None:
+    """
+    Counts a cacheable request, if ``WAGTAIL_CACHE_HIT_COUNTS`` is on.
+    """
+    if not wagtailcache_settings.WAGTAIL_CACHE_HIT_COUNTS or request.META.get(
+        NOT_COUNTED
+    ):
+        return
+    key = getattr(request, "_wagtailcache_key", None)
+    # The cache may be checked by both the middleware and ``cache_page``.
+    if key is None or getattr(request, "_wagtailcache_counted", False):
+        return
+    setattr(request, "_wagtailcache_counted", True)
+    _counter.record(key.uri)
+
+
+def flush_hits() -> None:
+    """
+    Adds the counts of this process to the counts in the cache now.
+    """
+    _counter._run()
+
+
+def get_hit_counts(uris: Optional[List[str]] = None) -> Counter:
+    """
+    Returns the number of requests for each URL in the current and previous
+    window, across every process. If ``uris`` is given, only the buckets
+    holding those URLs are read.
+    """
+    flush_hits()
+    cache = caches[wagtailcache_settings.WAGTAIL_CACHE_BACKEND]
+    window = int(time.time() // WINDOW)
+    if uris is None:
+        keys = [
+            f"{HITS}:{w}:{n}"
+            for w in (window - 1, window)
+            for n in range(BUCKETS)
+        ]
+    else:
+        keys = list(
+            {_bucket_key(w, uri) for w in (window - 1, window) for uri in uris}
+        )
+    counts: Counter = Counter()
+    for bucket in get_many(cache, keys).values():
+        counts.update(bucket)
+    return counts
@@ -0,0 +1,684 @@
+"""
+Storage for the keyring, an index of cache keys by URL.
+"""
+
+import math
+import os
+import time
+import uuid
+import zlib
+from contextlib import ExitStack
+from contextlib import contextmanager
+from typing import ContextManager
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Set
+from typing import Tuple
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.base import BaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.utils.module_loading import import_string
+
+from wagtailcache.batch import chunks
+from wagtailcache.batch import delete_many
+from wagtailcache.batch import get_many
+from wagtailcache.batch import set_many
+from wagtailcache.settings import wagtailcache_settings
+
+
+try:
+    from django.core.cache.backends.redis import RedisCache
+except ImportError:  # Django < 4.0
+    RedisCache = None  # type: ignore
+
+
+# Namespace of the keyring of URLs. The pre-3.1 keyring stored every URL in a
+# single entry under this key.
+URLS = "keyring"
+# Namespace of the keyring of tags, see ``wagtailcache.dependencies``.
+TAGS = "tags"
+# Seconds after which a lock is considered abandoned.
+LOCK_TIMEOUT = 5
+# Seconds to sleep between attempts to acquire a lock.
+LOCK_INTERVAL = 0.005
+
+
+@contextmanager
+def _add_lock(
+    cache: BaseCache, key: str, timeout: float, interval: float
+) -> Iterator[None]:
+    """
+    A lock which is an entry created with ``cache.add()``. This is safe on any
+    Django cache backend where ``add()`` is atomic.
+    """
+    lock_key = f"{key}:lock"
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + timeout
+    while not cache.add(lock_key, token, timeout):
+        if time.monotonic() > deadline:
+            cache.set(lock_key, token, timeout)
+            break
+        time.sleep(interval)
+    try:
+        yield
+    finally:
+        if cache.get(lock_key) == token:
+            cache.delete(lock_key)
+
+
+@contextmanager
+def _file_lock(
+    cache: FileBasedCache, key: str, timeout: float, interval: float
+) -> Iterator[None]:
+    """
+    A lock for ``FileBasedCache``, whose ``add()`` is not atomic across
+    processes. Locks are files created exclusively in the cache directory,
+    which the cache itself ignores.
+    """
+    path = cache._key_to_file(key) + ".lock"
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    token = uuid.uuid4().hex.encode()
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            if time.monotonic() > deadline:
+                # Take over the abandoned lock by atomically replacing its
+                # file with our own.
+                tmp = f"{path}.{token.decode()}"
+                with open(tmp, "wb") as f:
+                    f.write(token)
+                os.replace(tmp, path)
+                break
+            time.sleep(interval)
+        else:
+            with os.fdopen(fd, "wb") as f:
+                f.write(token)
+            break
+    try:
+        yield
+    finally:
+        # Only remove the lock if it is still ours, and has not been taken
+        # over by another process.
+        try:
+            with open(path, "rb") as f:
+                owned = f.read() == token
+            if owned:
+                os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def lock(cache: BaseCache, key: str) -> ContextManager[None]:
+    """
+    Holds an exclusive lock on ``key`` across every process using ``cache``.
+    If the lock cannot be acquired within ``LOCK_TIMEOUT`` seconds it is
+    assumed to be abandoned, and is taken over.
+    """
+    if isinstance(cache, FileBasedCache):
+        return _file_lock(cache, key, LOCK_TIMEOUT, LOCK_INTERVAL)
+    return _add_lock(cache, key, LOCK_TIMEOUT, LOCK_INTERVAL)
+
+
+@contextmanager
+def lock_many(cache: BaseCache, keys: Iterable[str]) -> Iterator[None]:
+    """
+    Holds a lock on each of ``keys``. Locks are always acquired in sorted
+    order so that two callers can never deadlock each other.
+    """
+    with ExitStack() as stack:
+        for key in sorted(set(keys)):
+            stack.enter_context(lock(cache, key))
+        yield
+
+
+class Keyring:
+    """
+    Tracks the cache keys belonging to each URL in the cache. Keyrings with
+    another ``namespace`` track cache keys by something other than URL, such
+    as tags.
+
+    Rather than storing the whole index in one cache entry, URLs are split into
+    a fixed number of buckets by hash. Each bucket is a dict of
+    ``{uri: {cache_key: expires}}`` stored under its own cache key, and a small
+    manifest records which buckets are in use. Storing a new key only touches
+    the bucket for its URL. The manifest never expires, so that buckets are
+    not orphaned if it ages out before they do.
+
+    Each cache key is recorded with the time it expires from the cache. Expired
+    keys are pruned whenever their bucket is updated, or by ``compact()``, and
+    each bucket is kept in the cache until its last key expires. URLs are kept
+    in the order they were last stored, so that with
+    ``WAGTAIL_CACHE_KEYRING_MAX_SIZE`` the least recently stored URLs can be
+    evicted, along with their pages in the cache.
+
+    Buckets are read, modified, and written back while holding a lock, which is
+    an entry created with ``cache.add()``. This is safe on any Django cache
+    backend where ``add()`` is atomic.
+    """
+
+    # Seconds after which a lock is considered abandoned.
+    lock_timeout = LOCK_TIMEOUT
+    # Seconds to sleep between attempts to acquire a lock.
+    lock_interval = LOCK_INTERVAL
+
+    def __init__(self, cache: BaseCache, namespace: str = URLS):
+        self.cache = cache
+        self.buckets = max(
+            1, int(wagtailcache_settings.WAGTAIL_CACHE_KEYRING_BUCKETS)
+        )
+        # Cache key of the pre-3.1 keyring, stored in a single entry.
+        self.legacy_key = namespace
+        # Cache key of the manifest, which lists the buckets currently in use.
+        self.manifest_key = f"{namespace}:manifest"
+        # Cache key prefix of each bucket.
+        self.bucket_prefix = f"{namespace}:bucket:"
+        # Maximum number of URLs in each bucket, only for the keyring of URLs.
+        max_size = wagtailcache_settings.WAGTAIL_CACHE_KEYRING_MAX_SIZE
+        self.bucket_size: Optional[int] = None
+        if max_size and namespace == URLS:
+            self.bucket_size = max(1, math.ceil(max_size / self.buckets))
+
+    def expires(
+        self,
+        timeout: Optional[float] = DEFAULT_TIMEOUT,  # type: ignore
+    ) -> Optional[float]:
+        """
+        Returns the time at which a key stored for ``timeout`` seconds
+        expires, or ``None`` if it never does.
+        """
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.cache.default_timeout
+        return None if timeout is None else time.time() + timeout
+
+    def bucket_key(self, uri: str) -> str:
+        """
+        Returns the cache key of the bucket holding ``uri``.
+        """
+        n = zlib.crc32(uri.encode("utf-8")) % self.buckets
+        return f"{self.bucket_prefix}{n}"
+
+    def lock(self, key: str) -> ContextManager[None]:
+        """
+        Holds an exclusive lock on ``key`` across every process using the
+        cache. If the lock cannot be acquired within ``lock_timeout`` it is
+        assumed to be abandoned, and is taken over.
+        """
+        return _add_lock(self.cache, key, self.lock_timeout, self.lock_interval)
+
+    @contextmanager
+    def lock_many(self, keys: Iterable[str]) -> Iterator[None]:
+        """
+        Holds a lock on each of ``keys``. Locks are always acquired in sorted
+        order so that two callers can never deadlock each other.
+        """
+        with ExitStack() as stack:
+            for key in sorted(set(keys)):
+                stack.enter_context(self.lock(key))
+            yield
+
+    def _get_manifest(self) -> Set[str]:
+        return self.cache.get(self.manifest_key) or set()
+
+    def _get_buckets(self, bucket_keys: Iterable[str]) -> Dict[str, Dict]:
+        return get_many(self.cache, bucket_keys)
+
+    def _prune(self, bucket: Dict[str, Dict], evict: bool = True) -> List[str]:
+        """
+        Removes expired keys from ``bucket``, and if ``evict``, the least
+        recently stored URLs beyond ``bucket_size``. Returns the keys of the
+        evicted URLs, which must be deleted from the cache along with them.
+        The caller must hold the lock on the bucket.
+        """
+        now = time.time()
+        for uri in list(bucket):
+            uri_keys = bucket[uri]
+            for cache_key, expires in list(uri_keys.items()):
+                if expires is not None and expires <= now:
+                    del uri_keys[cache_key]
+            if not uri_keys:
+                del bucket[uri]
+        evicted: List[str] = []
+        while evict and self.bucket_size and len(bucket) > self.bucket_size:
+            evicted.extend(bucket.pop(next(iter(bucket))))
+        return evicted
+
+    def _timeout(self, bucket: Dict[str, Dict]) -> Optional[int]:
+        """
+        Returns the timeout to store ``bucket`` for, so that it expires along
+        with its last key.
+        """
+        expires = [e for uri_keys in bucket.values() for e in uri_keys.values()]
+        if None in expires:
+            return None
+        return max(1, math.ceil(max(expires, default=0) - time.time()))
+
+    def _save_buckets(self, buckets: Dict[str, Dict]) -> None:
+        """
+        Writes the given buckets, deleting any that are now empty, and updates
+        the manifest if the set of buckets in use has changed. The caller must
+        hold the lock on each bucket.
+        """
+        by_timeout: Dict[Optional[int], Dict[str, Dict]] = {}
+        for bucket_key, bucket in buckets.items():
+            if bucket:
+                by_timeout.setdefault(self._timeout(bucket), {})[bucket_key] = (
+                    bucket
+                )
+        full = {k for k, v in buckets.items() if v}
+        empty = [k for k, v in buckets.items() if not v]
+        for timeout, group in by_timeout.items():
+            set_many(self.cache, group, timeout)
+        if empty:
+            delete_many(self.cache, empty)
+        with self.lock(self.manifest_key):
+            manifest = self._get_manifest()
+            updated = (manifest | full) - set(empty)
+            if updated != manifest:
+                self.cache.set(self.manifest_key, updated, None)
+
+    def exists(self) -> bool:
+        """
+        Returns ``True`` if the keyring contains anything.
+        """
+        return bool(self._get_manifest()) or self.legacy_key in self.cache
+
+    def clear(self) -> None:
+        """
+        Removes everything from the keyring, without deleting the cache keys
+        it lists.
+        """
+        bucket_keys = self._get_manifest()
+        with self.lock_many(bucket_keys):
+            delete_many(
+                self.cache,
+                [*bucket_keys, self.manifest_key, self.legacy_key],
+            )
+
+    def add(
+        self,
+        uri: str,
+        cache_key: str,
+        timeout: Optional[float] = DEFAULT_TIMEOUT,  # type: ignore
+    ) -> None:
+        """
+        Records ``cache_key`` as belonging to ``uri``, and expiring from the
+        cache after ``timeout`` seconds.
+        """
+        bucket_key = self.bucket_key(uri)
+        with self.lock(bucket_key):
+            bucket: Dict[str, Dict] = self.cache.get(bucket_key) or {}
+            self._prune(bucket, evict=False)
+            # Move the URL to the end, as the most recently stored.
+            uri_keys = bucket.pop(uri, {})
+            uri_keys[cache_key] = self.expires(timeout)
+            bucket[uri] = uri_keys
+            evicted = self._prune(bucket)
+            self.cache.set(bucket_key, bucket, self._timeout(bucket))
+            # Only touch the manifest when a new bucket comes into use.
+            if len(bucket) == 1 and bucket_key not in self._get_manifest():
+                with self.lock(self.manifest_key):
+                    manifest = self._get_manifest()
+                    manifest.add(bucket_key)
+                    self.cache.set(self.manifest_key, manifest, None)
+        if evicted:
+            delete_many(self.cache, evicted)
+
+    def add_many(
+        self,
+        entries: Iterable[Tuple[str, str]],
+        timeout: Optional[float] = DEFAULT_TIMEOUT,  # type: ignore
+    ) -> None:
+        """
+        Records each ``(uri, cache_key)``, expiring after ``timeout`` seconds,
+        loading and rewriting each bucket involved once.
+        """
+        by_bucket: Dict[str, List[Tuple[str, str]]] = {}
+        for uri, cache_key in entries:
+            by_bucket.setdefault(self.bucket_key(uri), []).append(
+                (uri, cache_key)
+            )
+        if not by_bucket:
+            return
+        expires = self.expires(timeout)
+        evicted = []
+        with self.lock_many(by_bucket):
+            buckets = self._get_buckets(by_bucket)
+            for bucket_key, bucket_entries in by_bucket.items():
+                bucket = buckets.setdefault(bucket_key, {})
+                self._prune(bucket, evict=False)
+                for uri, cache_key in bucket_entries:
+                    uri_keys = bucket.pop(uri, {})
+                    uri_keys[cache_key] = expires
+                    bucket[uri] = uri_keys
+                evicted.extend(self._prune(bucket))
+            self._save_buckets(buckets)
+        if evicted:
+            delete_many(self.cache, evicted)
+
+    def get(self, uri: str) -> List[str]:
+        """
+        Returns the unexpired cache keys belonging to ``uri``.
+        """
+        bucket = self.cache.get(self.bucket_key(uri)) or {}
+        self._prune(bucket, evict=False)
+        return list(bucket.get(uri, ()))
+
+    def items(self) -> Iterator[Tuple[str, List[str]]]:
+        """
+        Iterates over every ``(uri, cache_keys)`` in the keyring, skipping
+        expired keys.
+        """
+        self.migrate()
+        for bucket in self._get_buckets(self._get_manifest()).values():
+            self._prune(bucket, evict=False)
+            for uri, uri_keys in bucket.items():
+                yield uri, list(uri_keys)
+
+    def as_dict(self) -> Dict[str, List[str]]:
+        """
+        Returns the entire keyring as a single dict of ``{uri: cache_keys}``.
+        """
+        return dict(self.items())
+
+    def pop(self, uris: Iterable[str]) -> Dict[str, List[str]]:
+        """
+        Removes ``uris`` from the keyring, returning their cache keys. Only the
+        buckets holding ``uris`` are loaded and rewritten.
+        """
+        by_bucket: Dict[str, List[str]] = {}
+        for uri in uris:
+            by_bucket.setdefault(self.bucket_key(uri), []).append(uri)
+        if not by_bucket:
+            return {}
+        popped = {}
+        with self.lock_many(by_bucket):
+            changed = {}
+            for bucket_key, bucket in self._get_buckets(by_bucket).items():
+                for uri in by_bucket[bucket_key]:
+                    if uri in bucket:
+                        popped[uri] = list(bucket.pop(uri))
+                        changed[bucket_key] = bucket
+            if changed:
+                self._save_buckets(changed)
+        return popped
+
+    def compact(self) -> int:
+        """
+        Removes every expired key from the keyring, and evicts URLs beyond
+        ``WAGTAIL_CACHE_KEYRING_MAX_SIZE``. Returns the number of keys removed.
+        """
+        self.migrate()
+        removed = 0
+        evicted = []
+        for bucket_keys in chunks(sorted(self._get_manifest())):
+            with self.lock_many(bucket_keys):
+                buckets = self._get_buckets(bucket_keys)
+                changed = {k: {} for k in bucket_keys if k not in buckets}
+                for bucket_key, bucket in buckets.items():
+                    before = sum(len(uri_keys) for uri_keys in bucket.values())
+                    evicted.extend(self._prune(bucket))
+                    after = sum(len(uri_keys) for uri_keys in bucket.values())
+                    if after != before:
+                        removed += before - after
+                        changed[bucket_key] = bucket
+                if changed:
+                    self._save_buckets(changed)
+        if evicted:
+            delete_many(self.cache, evicted)
+        return removed
+
+    def migrate(self) -> None:
+        """
+        Moves entries from the legacy single-entry keyring into buckets.
+        """
+        if self.legacy_key not in self.cache:
+            return
+        with self.lock(self.legacy_key):
+            legacy: Dict[str, List[str]] = self.cache.get(self.legacy_key)
+            if legacy is None:
+                return
+            # Legacy entries were stored with the default timeout.
+            expires = self.expires()
+            by_bucket: Dict[str, Dict[str, List[str]]] = {}
+            for uri, uri_keys in legacy.items():
+                by_bucket.setdefault(self.bucket_key(uri), {})[uri] = uri_keys
+            with self.lock_many(by_bucket):
+                buckets = self._get_buckets(by_bucket)
+                for bucket_key, entries in by_bucket.items():
+                    bucket = buckets.setdefault(bucket_key, {})
+                    for uri, uri_keys in entries.items():
+                        current = bucket.setdefault(uri, {})
+                        for cache_key in uri_keys:
+                            current.setdefault(cache_key, expires)
+                    self._prune(bucket, evict=False)
+                self._save_buckets(buckets)
+            self.cache.delete(self.legacy_key)
+
+
+class FileBasedKeyring(Keyring):
+    """
+    Keyring for ``FileBasedCache``, whose ``add()`` is not atomic across
+    processes. Locks are instead files created exclusively in the cache
+    directory, which the cache itself ignores.
+    """
+
+    cache: FileBasedCache
+
+    def lock(self, key: str) -> ContextManager[None]:
+        return _file_lock(
+            self.cache, key, self.lock_timeout, self.lock_interval
+        )
+
+
+class RedisKeyring(Keyring):
+    """
+    Keyring for Django's ``RedisCache``, which needs no locks. Each bucket is a
+    Redis sorted set, so adding a key is a single atomic ``ZADD``, and the
+    manifest is a set. Bucket members are ``uri`` and ``cache_key`` joined by a
+    null byte, scored by the time the key expires.
+
+    Expired keys are pruned with ``ZREMRANGEBYSCORE``. With
+    ``WAGTAIL_CACHE_KEYRING_MAX_SIZE``, the size of each bucket is counted in
+    keys rather than URLs, and the keys which expire soonest are evicted,
+    which are the least recently stored when pages share a timeout.
+    """
+
+    SEPARATOR = "\x00"
+
+    def _client(self):
+        return self.cache._cache.get_client(write=True)  # type: ignore
+
+    def _key(self, key: str) -> str:
+        return self.cache.make_key(key)
+
+    def _member(self, member: bytes) -> Tuple[str, str]:
+        uri, cache_key = member.decode("utf-8").split(self.SEPARATOR)
+        return uri, cache_key
+
+    def _get_manifest(self) -> Set[str]:
+        members = self._client().smembers(self._key(self.manifest_key))
+        return {m.decode("utf-8") for m in members}
+
+    def _get_buckets(self, bucket_keys: Iterable[str]) -> Dict[str, Dict]:
+        bucket_keys = list(bucket_keys)
+        pipe = self._client().pipeline()
+        for bucket_key in bucket_keys:
+            pipe.zrangebyscore(self._key(bucket_key), time.time(), "+inf")
+        buckets: Dict[str, Dict] = {}
+        for bucket_key, members in zip(bucket_keys, pipe.execute()):
+            bucket: Dict[str, List[str]] = {}
+            for member in members:
+                uri, cache_key = self._member(member)
+                bucket.setdefault(uri, []).append(cache_key)
+            if bucket:
+                buckets[bucket_key] = bucket
+        return buckets
+
+    def _evict(self, sizes: Dict[str, int]) -> None:
+        """
+        Evicts the keys beyond ``bucket_size`` from buckets of the given
+        sizes, and deletes them from the cache.
+        """
+        full = {
+            bucket_key: size - self.bucket_size
+            for bucket_key, size in sizes.items()
+            if self.bucket_size and size > self.bucket_size
+        }
+        if not full:
+            return
+        pipe = self._client().pipeline()
+        for bucket_key, count in full.items():
+            pipe.zpopmin(self._key(bucket_key), count)
+        evicted = [
+            self._member(member)[1]
+            for popped in pipe.execute()
+            for member, _ in popped
+        ]
+        delete_many(self.cache, evicted)
+
+    def exists(self) -> bool:
+        return (
+            bool(self._client().exists(self._key(self.manifest_key)))
+            or self.legacy_key in self.cache
+        )
+
+    def clear(self) -> None:
+        bucket_keys = self._get_manifest()
+        self._client().delete(
+            *(self._key(k) for k in [*bucket_keys, self.manifest_key])
+        )
+        self.cache.delete(self.legacy_key)
+
+    def add(
+        self,
+        uri: str,
+        cache_key: str,
+        timeout: Optional[float] = DEFAULT_TIMEOUT,  # type: ignore
+    ) -> None:
+        self.add_many([(uri, cache_key)], timeout)
+
+    def add_many(
+        self,
+        entries: Iterable[Tuple[str, str]],
+        timeout: Optional[float] = DEFAULT_TIMEOUT,  # type: ignore
+    ) -> None:
+        """
+        Records each ``(uri, cache_key)`` in a single round trip, unless a
+        bucket needs its expiry extended or keys evicted.
+        """
+        expires = self.expires(timeout)
+        score = math.inf if expires is None else expires
+        by_bucket: Dict[str, Dict[str, float]] = {}
+        for uri, cache_key in entries:
+            by_bucket.setdefault(self.bucket_key(uri), {})[
+                f"{uri}{self.SEPARATOR}{cache_key}"
+            ] = score
+        if not by_bucket:
+            return
+        pipe = self._client().pipeline()
+        for bucket_key, members in by_bucket.items():
+            key = self._key(bucket_key)
+            pipe.zadd(key, members)
+            pipe.zremrangebyscore(key, "-inf", time.time())
+            # Keep the bucket until its last key expires.
+            if expires is None:
+                pipe.persist(key)
+            else:
+                pipe.expireat(key, math.ceil(expires))
+            pipe.zcard(key)
+            pipe.zrange(key, -1, -1, withscores=True)
+        pipe.sadd(self._key(self.manifest_key), *by_bucket)
+        results = pipe.execute()
+        sizes = {}
+        extend = self._client().pipeline()
+        for i, bucket_key in enumerate(by_bucket):
+            size, last = results[i * 5 + 3 : i * 5 + 5]
+            sizes[bucket_key] = size
+            # Another key in the bucket expires later than these.
+            if last and last[0][1] > score:
+                if last[0][1] == math.inf:
+                    extend.persist(self._key(bucket_key))
+                else:
+                    last_expires = math.ceil(last[0][1])
+                    extend.expireat(self._key(bucket_key), last_expires)
+        if len(extend):
+            extend.execute()
+        self._evict(sizes)
+
+    def items(self) -> Iterator[Tuple[str, List[str]]]:
+        self.migrate()
+        for bucket in self._get_buckets(self._get_manifest()).values():
+            yield from bucket.items()
+
+    def get(self, uri: str) -> List[str]:
+        bucket_key = self.bucket_key(uri)
+        bucket = self._get_buckets([bucket_key]).get(bucket_key, {})
+        return bucket.get(uri, [])
+
+    def pop(self, uris: Iterable[str]) -> Dict[str, List[str]]:
+        # Buckets are never removed from the manifest, as that could race with
+        # a concurrent ``ZADD`` to the same bucket. There are at most
+        # ``WAGTAIL_CACHE_KEYRING_BUCKETS`` of them.
+        uris = set(uris)
+        by_bucket = {self.bucket_key(uri) for uri in uris}
+        popped: Dict[str, List[str]] = {}
+        pipe = self._client().pipeline()
+        for bucket_key, bucket in self._get_buckets(by_bucket).items():
+            for uri in uris.intersection(bucket):
+                popped[uri] = bucket[uri]
+                pipe.zrem(
+                    self._key(bucket_key),
+                    *(f"{uri}{self.SEPARATOR}{k}" for k in bucket[uri]),
+                )
+        pipe.execute()
+        return popped
+
+    def compact(self) -> int:
+        self.migrate()
+        bucket_keys = sorted(self._get_manifest())
+        pipe = self._client().pipeline()
+        for bucket_key in bucket_keys:
+            pipe.zremrangebyscore(self._key(bucket_key), "-inf", time.time())
+            pipe.zcard(self._key(bucket_key))
+        results = pipe.execute()
+        sizes = dict(zip(bucket_keys, results[1::2]))
+        removed = sum(results[::2]) + sum(
+            max(0, size - self.bucket_size)
+            for size in sizes.values()
+            if self.bucket_size
+        )
+        self._evict(sizes)
+        return removed
+
+    def migrate(self) -> None:
+        legacy: Dict[str, List[str]] = self.cache.get(self.legacy_key)
+        if legacy is None:
+            return
+        self.add_many(
+            (uri, cache_key)
+            for uri, uri_keys in legacy.items()
+            for cache_key in uri_keys
+        )
+        self.cache.delete(self.legacy_key)
+
+
+def get_keyring(cache: BaseCache, namespace: str = URLS) -> Keyring:
+    """
+    Returns the keyring implementation best suited to ``cache``, or the class
+    named by ``WAGTAIL_CACHE_KEYRING_CLASS`` if set.
+    """
+    if wagtailcache_settings.WAGTAIL_CACHE_KEYRING_CLASS:
+        cls = import_string(wagtailcache_settings.WAGTAIL_CACHE_KEYRING_CLASS)
+    elif RedisCache is not None and isinstance(cache, RedisCache):
+        cls = RedisKeyring
+    elif isinstance(cache, FileBasedCache):
+        cls = FileBasedKeyring
+    else:
+        cls = Keyring
+    return cls(cache, namespace)
@@ -0,0 +1,313 @@
+"""
+An optional in-process cache in front of the wagtail-cache backend.
+"""
+
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from django.core.cache.backends.base import BaseCache
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from wagtailcache.serializers import get_lifetime
+from wagtailcache.serializers import is_encoded_response
+from wagtailcache.settings import wagtailcache_settings
+
+
+# Cache key in the backend which changes every time the cache is cleared.
+GENERATION_KEY = "generation"
+
+# Returned by ``LocalCache.get()`` when a key is not present, since ``None``
+# may be a valid value.
+MISSING = object()
+
+
+class LocalCache:
+    """
+    A bounded, thread-safe LRU cache held in the memory of this process.
+
+    Values are stored pickled, so that each caller gets its own copy, and the
+    cache is limited both by number of entries and by total size in bytes.
+    Entries expire after ``timeout`` seconds.
+
+    To stay coherent with other processes, the local cache remembers the value
+    of ``GENERATION_KEY`` in the backend, and empties itself when it changes.
+    The backend is checked at most once every ``check_interval`` seconds, so a
+    hit in the local cache usually needs no I/O at all.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        max_bytes: int,
+        timeout: float,
+        check_interval: float,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.check_interval = check_interval
+        self._data: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._generation: Any = MISSING
+        self._checked = 0.0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    @property
+    def size(self) -> int:
+        """
+        Total size in bytes of the values currently stored.
+        """
+        return self._bytes
+
+    def _delete(self, key: str) -> None:
+        _, value = self._data.pop(key)
+        self._bytes -= len(value)
+
+    def get(self, key: str) -> Any:
+        """
+        Returns the value of ``key``, or ``MISSING``.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return MISSING
+            expires, value = entry
+            if expires < time.monotonic():
+                self._delete(key)
+                return MISSING
+            self._data.move_to_end(key)
+        return pickle.loads(value)
+
+    def set(self, key: str, value: Any, timeout: Optional[float] = None):
+        """
+        Stores ``value``, evicting the least recently used entries to make
+        room. ``timeout`` can only shorten the local cache's own timeout.
+        """
+        if timeout is None or timeout > self.timeout:
+            timeout = self.timeout
+        if timeout <= 0:
+            return
+        value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._data:
+                self._delete(key)
+            self._data[key] = (time.monotonic() + timeout, value)
+            self._bytes += len(value)
+            while (
+                len(self._data) > self.max_entries
+                or self._bytes > self.max_bytes
+            ):
+                self._delete(next(iter(self._data)))
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            if key in self._data:
+                self._delete(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def _should_check(self) -> bool:
+        now = time.monotonic()
+        if now - self._checked < self.check_interval:
+            return False
+        self._checked = now
+        return True
+
+    def _set_generation(self, generation: Any) -> None:
+        if generation != self._generation:
+            if self._generation is not MISSING:
+                self.clear()
+            self._generation = generation
+
+    def check(self, cache: BaseCache) -> None:
+        """
+        Empties the local cache if the backend has been cleared since the last
+        check. Only checks the backend once per ``check_interval``.
+        """
+        if self._should_check():
+            self._set_generation(cache.get(GENERATION_KEY))
+
+    async def acheck(self, cache: BaseCache) -> None:
+        """
+        Async version of ``check()``.
+        """
+        if self._should_check():
+            self._set_generation(await cache.aget(GENERATION_KEY))
+
+
+# Local caches of this process, by cache alias.
+_local_caches: Dict[str, LocalCache] = {}
+
+
+def get_local_cache() -> Optional[LocalCache]:
+    """
+    Returns the local cache in front of ``WAGTAIL_CACHE_BACKEND``, or ``None``
+    if ``WAGTAIL_CACHE_LOCAL`` is off.
+    """
+    if not wagtailcache_settings.WAGTAIL_CACHE_LOCAL:
+        return None
+    s = wagtailcache_settings
+    local = _local_caches.get(s.WAGTAIL_CACHE_BACKEND)
+    if local is None:
+        local = _local_caches.setdefault(
+            s.WAGTAIL_CACHE_BACKEND,
+            LocalCache(
+                max_entries=s.WAGTAIL_CACHE_LOCAL_MAX_ENTRIES,
+                max_bytes=s.WAGTAIL_CACHE_LOCAL_MAX_BYTES,
+                timeout=s.WAGTAIL_CACHE_LOCAL_TIMEOUT,
+                check_interval=s.WAGTAIL_CACHE_LOCAL_CHECK_INTERVAL,
+            ),
+        )
+    return local
+
+
+def _fill(local: LocalCache, key: str, value: Any) -> None:
+    """
+    Stores a value fetched from the backend in the local cache, for no longer
+    than it has left to live in the backend.
+    """
+    timeout = get_lifetime(value) if is_encoded_response(value) else None
+    local.set(key, value, timeout)
+
+
+def cache_get(cache: BaseCache, key: str) -> Any:
+    """
+    Gets ``key`` from the local cache if possible, otherwise from ``cache``,
+    storing the result locally for next time.
+    """
+    local = get_local_cache()
+    if local is None:
+        return cache.get(key)
+    local.check(cache)
+    value = local.get(key)
+    if value is MISSING:
+        value = cache.get(key)
+        if value is not None:
+            _fill(local, key, value)
+    return value
+
+
+async def acache_get(cache: BaseCache, key: str) -> Any:
+    """
+    Async version of ``cache_get()``. A hit in the local cache is served
+    without leaving the event loop.
+    """
+    local = get_local_cache()
+    if local is None:
+        return await cache.aget(key)
+    await local.acheck(cache)
+    value = local.get(key)
+    if value is MISSING:
+        value = await cache.aget(key)
+        if value is not None:
+            _fill(local, key, value)
+    return value
+
+
+def cache_get_many(cache: BaseCache, keys: List[str]) -> Dict[str, Any]:
+    """
+    Gets ``keys`` from the local cache if possible, and any others from
+    ``cache`` in a single round trip, storing them locally for next time.
+    """
+    local = get_local_cache()
+    if local is None:
+        return cache.get_many(keys)
+    local.check(cache)
+    found, missing = _split_local(local, keys)
+    if missing:
+        fetched = cache.get_many(missing)
+        for key, value in fetched.items():
+            _fill(local, key, value)
+        found.update(fetched)
+    return found
+
+
+async def acache_get_many(cache: BaseCache, keys: List[str]) -> Dict[str, Any]:
+    """
+    Async version of ``cache_get_many()``.
+    """
+    local = get_local_cache()
+    if local is None:
+        return await cache.aget_many(keys)
+    await local.acheck(cache)
+    found, missing = _split_local(local, keys)
+    if missing:
+        fetched = await cache.aget_many(missing)
+        for key, value in fetched.items():
+            _fill(local, key, value)
+        found.update(fetched)
+    return found
+
+
+def _split_local(
+    local: LocalCache, keys: List[str]
+) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    Returns the values of ``keys`` found in the local cache, and the keys
+    which were not.
+    """
+    found = {}
+    missing = []
+    for key in keys:
+        value = local.get(key)
+        if value is MISSING:
+            missing.append(key)
+        else:
+            found[key] = value
+    return found, missing
+
+
+def cache_set(cache: BaseCache, key: str, value: Any, timeout: int) -> None:
+    """
+    Sets ``key`` in ``cache`` and in the local cache.
+    """
+    cache.set(key, value, timeout)
+    local = get_local_cache()
+    if local is not None:
+        local.set(key, value, timeout)
+
+
+async def acache_set(
+    cache: BaseCache, key: str, value: Any, timeout: int
+) -> None:
+    """
+    Async version of ``cache_set()``.
+    """
+    await cache.aset(key, value, timeout)
+    local = get_local_cache()
+    if local is not None:
+        local.set(key, value, timeout)
+
+
+def invalidate(cache: BaseCache) -> None:
+    """
+    Empties the local cache of this process, and signals every other process
+    to do the same.
+    """
+    local = get_local_cache()
+    if local is not None:
+        cache.set(GENERATION_KEY, uuid.uuid4().hex, None)
+        local.clear()
+
+
+@receiver(setting_changed)
+def _reset_local_caches(*, setting: str, **kwargs) -> None:
+    if setting.startswith("WAGTAIL_CACHE_LOCAL"):
+        _local_caches.clear()
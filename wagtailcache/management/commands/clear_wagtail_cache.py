@@ -1,12 +1,36 @@
 """CLI tool to clear wagtailcache."""
 
 from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
 
 from wagtailcache.cache import clear_cache
+from wagtailcache.purge import drain_purges
+from wagtailcache.purge import get_purge_queue
 
 
 class Command(BaseCommand):
     help = "Clears the cache for the entire site."
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--drain",
+            action="store_true",
+            help=(
+                "Only run the purges waiting in the purge queue. Requires a "
+                "persistent WAGTAIL_CACHE_PURGE_QUEUE, such as CachePurgeQueue."
+            ),
+        )
+
     def handle(self, *args, **options):
-        clear_cache()
+        if options["drain"]:
+            if not get_purge_queue().persistent:
+                raise CommandError(
+                    "The purge queue only holds purges in the memory of the "
+                    "process which enqueued them, so there is nothing to "
+                    "drain. Set WAGTAIL_CACHE_PURGE_QUEUE to "
+                    '"wagtailcache.purge.CachePurgeQueue" to use --drain.'
+                )
+            count = drain_purges()
+            self.stdout.write(f"Ran {count} queued purge(s).")
+        else:
+            clear_cache()
@@ -0,0 +1,22 @@
+"""CLI tool to remove expired keys from the wagtailcache keyring."""
+
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+
+from wagtailcache.keyring import TAGS
+from wagtailcache.keyring import URLS
+from wagtailcache.keyring import get_keyring
+from wagtailcache.settings import wagtailcache_settings
+
+
+class Command(BaseCommand):
+    help = (
+        "Removes expired keys from the keyring, and evicts URLs beyond "
+        "WAGTAIL_CACHE_KEYRING_MAX_SIZE."
+    )
+
+    def handle(self, *args, **options):
+        _wagcache = caches[wagtailcache_settings.WAGTAIL_CACHE_BACKEND]
+        for namespace in (URLS, TAGS):
+            count = get_keyring(_wagcache, namespace).compact()
+            self.stdout.write(f"Removed {count} key(s) from {namespace}.")
@@ -0,0 +1,59 @@
+"""CLI tool to warm wagtailcache."""
+
+from django.core.management.base import BaseCommand
+
+from wagtailcache.warm import warm_cache
+
+
+class Command(BaseCommand):
+    help = (
+        "Renders pages into the cache, most requested first. By default, every "
+        "live, public page is warmed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "urls", nargs="*", help="Absolute URLs to warm, instead of pages."
+        )
+        parser.add_argument(
+            "--site",
+            action="append",
+            dest="sites",
+            default=[],
+            help="Only warm pages of the site with this hostname.",
+        )
+        parser.add_argument(
+            "--sitemap", help="Warm the URLs listed in this sitemap URL."
+        )
+        parser.add_argument(
+            "--keyring",
+            action="store_true",
+            help="Warm every URL in the keyring.",
+        )
+        parser.add_argument(
+            "--limit", type=int, help="The maximum number of URLs to warm."
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=4,
+            help="The number of pages rendered at once.",
+        )
+        parser.add_argument(
+            "--rate",
+            type=float,
+            help="The maximum number of pages requested per second.",
+        )
+
+    def handle(self, *args, **options):
+        statuses = warm_cache(
+            urls=options["urls"] or None,
+            sites=options["sites"],
+            sitemap=options["sitemap"],
+            keyring=options["keyring"],
+            limit=options["limit"],
+            workers=options["workers"],
+            rate=options["rate"],
+        )
+        for status, count in sorted(statuses.items()):
+            self.stdout.write(f"{status}: {count}")
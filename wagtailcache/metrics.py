@@ -0,0 +1,433 @@
+"""
+Counters and latency histograms of the cache, to monitor how well it performs.
+"""
+
+import atexit
+import logging
+import socket
+import threading
+from bisect import bisect_left
+from collections import Counter
+from functools import lru_cache
+from typing import Dict
+from typing import List
+from typing import Optional
+
+from django.core.cache import caches
+from django.core.handlers.wsgi import WSGIRequest
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.http.response import HttpResponse
+from django.utils.module_loading import import_string
+
+from wagtailcache.batch import get_many
+from wagtailcache.batch import set_many
+from wagtailcache.hits import NOT_COUNTED
+from wagtailcache.keyring import get_keyring
+from wagtailcache.keyring import lock
+from wagtailcache.settings import wagtailcache_settings
+
+
+logger = logging.getLogger("wagtail-cache")
+
+# Namespace of the totals in the cache, see ``CacheSink``.
+METRICS = "metrics"
+# Values of the ``WAGTAIL_CACHE_HEADER`` header, each counted separately.
+STATUSES = ("hit", "stale", "miss", "skip", "err")
+# Counters of bytes served from the cache, and stored in the cache.
+BYTES = ("served_bytes", "stored_bytes")
+# Histograms of the seconds taken to fetch from, and store in, the cache.
+HISTOGRAMS = ("fetch_seconds", "store_seconds")
+# Upper bounds of the histogram buckets, in seconds.
+LATENCY_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+)
+
+
+class Histogram:
+    """
+    The number of observations in each of ``LATENCY_BUCKETS``, plus one for
+    slower observations, and the sum of all observations in microseconds.
+    """
+
+    def __init__(self, counts: Optional[List[int]] = None, total: int = 0):
+        self.counts = counts or [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = total
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    @property
+    def seconds(self) -> float:
+        return self.total / 1000000
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.total += int(seconds * 1000000)
+
+
+class Snapshot:
+    """
+    Counters, histograms, and gauges, either of one process since it was last
+    flushed, or the totals of every process.
+    """
+
+    def __init__(self):
+        self.counters: Counter = Counter()
+        self.histograms: Dict[str, Histogram] = {}
+        self.gauges: Dict[str, int] = {}
+
+    def __bool__(self) -> bool:
+        return bool(self.counters or self.histograms)
+
+    @property
+    def hit_rate(self) -> Optional[float]:
+        """
+        The fraction of cacheable requests served from the cache, or ``None``
+        if there were none.
+        """
+        hits = self.counters["hit"] + self.counters["stale"]
+        total = hits + self.counters["miss"] + self.counters["err"]
+        return hits / total if total else None
+
+
+class Metrics:
+    """
+    Collects metrics in memory, and sends them to the sinks from a background
+    thread every ``WAGTAIL_CACHE_METRICS_INTERVAL`` seconds, so that recording
+    a metric costs no I/O.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Held while flushing, so that ``flush()`` returns once every metric
+        # taken before it was called has been sent.
+        self._flush_lock = threading.Lock()
+        self._current = Snapshot()
+        self._timer: Optional[threading.Timer] = None
+        # Do not lose metrics which are waiting when the process exits.
+        atexit.register(self._run)
+
+    def _schedule(self) -> None:
+        # Called with ``_lock`` held.
+        if self._timer is None:
+            self._timer = threading.Timer(
+                wagtailcache_settings.WAGTAIL_CACHE_METRICS_INTERVAL,
+                self._run,
+            )
+            self._timer.daemon = True
+            self._timer.start()
+
+    def incr(self, name: str, value: int = 1) -> None:
+        """
+        Adds ``value`` to a counter, and schedules a flush if none is.
+        """
+        with self._lock:
+            self._current.counters[name] += value
+            self._schedule()
+
+    def observe(self, name: str, seconds: float) -> None:
+        """
+        Adds an observation to a histogram, and schedules a flush if none is.
+        """
+        with self._lock:
+            histogram = self._current.histograms.get(name)
+            if histogram is None:
+                histogram = self._current.histograms[name] = Histogram()
+            histogram.observe(seconds)
+            self._schedule()
+
+    def take(self) -> Snapshot:
+        """
+        Returns the metrics collected since the last call, and starts over.
+        """
+        with self._lock:
+            snapshot, self._current = self._current, Snapshot()
+            timer, self._timer = self._timer, None
+        if timer is not None:
+            timer.cancel()
+        return snapshot
+
+    def _run(self) -> None:
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Could not collect cache metrics.")
+
+    def flush(self) -> None:
+        """
+        Sends the metrics collected since the last flush to each sink.
+        """
+        with self._flush_lock:
+            snapshot = self.take()
+            if not snapshot:
+                return
+            for sink in get_sinks():
+                try:
+                    sink.emit(snapshot)
+                except Exception:
+                    logger.exception(
+                        "Could not send cache metrics to %s.",
+                        type(sink).__name__,
+                    )
+
+
+_metrics = Metrics()
+
+
+class MetricsSink:
+    """
+    Receives the metrics of each process as they are flushed. Counters and
+    histograms only hold what changed since the previous flush. Subclass this
+    to send metrics elsewhere, and add it to ``WAGTAIL_CACHE_METRICS_SINKS``.
+    """
+
+    def emit(self, snapshot: Snapshot) -> None:
+        raise NotImplementedError
+
+
+class LoggingSink(MetricsSink):
+    """
+    Logs a summary of the metrics to the ``wagtail-cache`` logger.
+    """
+
+    def __init__(self, level: str = "INFO"):
+        self.level = logging.getLevelName(level)
+
+    def emit(self, snapshot: Snapshot) -> None:
+        parts = [f"{name}={snapshot.counters[name]}" for name in STATUSES]
+        if snapshot.hit_rate is not None:
+            parts.append(f"hit_rate={snapshot.hit_rate:.1%}")
+        parts += [f"{name}={snapshot.counters[name]}" for name in BYTES]
+        for name, histogram in snapshot.histograms.items():
+            average = histogram.seconds / histogram.count * 1000
+            parts.append(f"{name[:-8]}_avg={average:.2f}ms")
+        parts += [f"{name}={value}" for name, value in snapshot.gauges.items()]
+        logger.log(self.level, "Cache metrics: %s", " ".join(parts))
+
+
+class StatsdSink(MetricsSink):
+    """
+    Sends the metrics to a StatsD server over UDP. Each histogram is sent as
+    its count, and as one timing of its average in milliseconds.
+    """
+
+    # Maximum size of each packet, to avoid fragmentation.
+    packet_size = 512
+
+    def __init__(
+        self,
+        host: str = "localhost",
+        port: int = 8125,
+        prefix: str = "wagtailcache",
+    ):
+        self.address = (host, port)
+        self.prefix = prefix
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def emit(self, snapshot: Snapshot) -> None:
+        lines = [
+            f"{self.prefix}.{name}:{value}|c"
+            for name, value in snapshot.counters.items()
+        ]
+        for name, histogram in snapshot.histograms.items():
+            average = histogram.seconds / histogram.count * 1000
+            lines.append(f"{self.prefix}.{name}.count:{histogram.count}|c")
+            lines.append(f"{self.prefix}.{name[:-8]}:{average:.3f}|ms")
+        lines += [
+            f"{self.prefix}.{name}:{value}|g"
+            for name, value in snapshot.gauges.items()
+        ]
+        packet = ""
+        for line in lines:
+            if packet and len(packet) + len(line) + 1 > self.packet_size:
+                self.socket.sendto(packet.encode("utf-8"), self.address)
+                packet = ""
+            packet = f"{packet}\n{line}" if packet else line
+        if packet:
+            self.socket.sendto(packet.encode("utf-8"), self.address)
+
+
+class CacheSink(MetricsSink):
+    """
+    Adds the metrics of each process to totals in the cache backend, which
+    are shown in the wagtail admin and served by ``prometheus_view``.
+    """
+
+    def emit(self, snapshot: Snapshot) -> None:
+        cache = caches[wagtailcache_settings.WAGTAIL_CACHE_BACKEND]
+        deltas = {
+            f"{METRICS}:{name}": value
+            for name, value in snapshot.counters.items()
+        }
+        for name, histogram in snapshot.histograms.items():
+            for i, count in enumerate(histogram.counts):
+                if count:
+                    deltas[f"{METRICS}:{name}:{i}"] = count
+            deltas[f"{METRICS}:{name}:sum"] = histogram.total
+        with lock(cache, METRICS):
+            totals = get_many(cache, deltas)
+            for key, value in deltas.items():
+                totals[key] = totals.get(key, 0) + value
+            for name, value in snapshot.gauges.items():
+                totals[f"{METRICS}:{name}"] = value
+            set_many(cache, totals, None)
+
+
+@lru_cache(maxsize=None)
+def get_sinks() -> List[MetricsSink]:
+    """
+    Returns the sinks named by ``WAGTAIL_CACHE_METRICS_SINKS``. Each is either
+    a dotted path, or a dict of its ``BACKEND`` and keyword ``OPTIONS``.
+    """
+    sinks = []
+    for sink in wagtailcache_settings.WAGTAIL_CACHE_METRICS_SINKS:
+        if isinstance(sink, str):
+            sink = {"BACKEND": sink}
+        cls = import_string(sink["BACKEND"])
+        sinks.append(cls(**sink.get("OPTIONS", {})))
+    return sinks
+
+
+@receiver(setting_changed)
+def _reset_sinks(*, setting: str, **kwargs) -> None:
+    if setting == "WAGTAIL_CACHE_METRICS_SINKS":
+        get_sinks.cache_clear()
+
+
+def record_response(request: WSGIRequest, response: HttpResponse) -> None:
+    """
+    Counts a response by its cache status, if ``WAGTAIL_CACHE_METRICS`` is
+    on.
+    """
+    if not wagtailcache_settings.WAGTAIL_CACHE_METRICS:
+        return
+    status = getattr(response, "_wagtailcache_status", None)
+    # The response may be updated by both the middleware and ``cache_page``.
+    if (
+        status is None
+        or request.META.get(NOT_COUNTED)
+        or getattr(request, "_wagtailcache_recorded", False)
+    ):
+        return
+    setattr(request, "_wagtailcache_recorded", True)
+    _metrics.incr(status)
+    if status in ("hit", "stale") and not response.streaming:
+        _metrics.incr("served_bytes", len(response.content))
+
+
+def record_fetch(seconds: float) -> None:
+    """
+    Records the time taken to look up a request in the cache.
+    """
+    if wagtailcache_settings.WAGTAIL_CACHE_METRICS:
+        _metrics.observe("fetch_seconds", seconds)
+
+
+def record_store(seconds: float, size: int) -> None:
+    """
+    Records the time taken to store a response of ``size`` bytes in the
+    cache.
+    """
+    if wagtailcache_settings.WAGTAIL_CACHE_METRICS:
+        _metrics.incr("stored_bytes", size)
+        _metrics.observe("store_seconds", seconds)
+
+
+def flush_metrics() -> None:
+    """
+    Sends the metrics of this process to each sink now.
+    """
+    _metrics._run()
+
+
+def get_metrics() -> Snapshot:
+    """
+    Returns the totals of every process, as stored by ``CacheSink``, and the
+    number of URLs in the keyring if ``WAGTAIL_CACHE_KEYRING`` is on.
+    """
+    flush_metrics()
+    cache = caches[wagtailcache_settings.WAGTAIL_CACHE_BACKEND]
+    keys = [f"{METRICS}:{name}" for name in STATUSES + BYTES]
+    keys.append(f"{METRICS}:keyring_urls")
+    for name in HISTOGRAMS:
+        keys += [
+            f"{METRICS}:{name}:{i}" for i in range(len(LATENCY_BUCKETS) + 1)
+        ]
+        keys.append(f"{METRICS}:{name}:sum")
+    totals = get_many(cache, keys)
+    snapshot = Snapshot()
+    for name in STATUSES + BYTES:
+        snapshot.counters[name] = totals.get(f"{METRICS}:{name}", 0)
+    for name in HISTOGRAMS:
+        snapshot.histograms[name] = Histogram(
+            [
+                totals.get(f"{METRICS}:{name}:{i}", 0)
+                for i in range(len(LATENCY_BUCKETS) + 1)
+            ],
+            totals.get(f"{METRICS}:{name}:sum", 0),
+        )
+    if wagtailcache_settings.WAGTAIL_CACHE_KEYRING:
+        urls = totals.get(f"{METRICS}:keyring_urls")
+        if urls is None:
+            # Counting reads the whole keyring, so is only done once per
+            # interval, however often the metrics are read.
+            urls = sum(1 for _ in get_keyring(cache).items())
+            cache.set(
+                f"{METRICS}:keyring_urls",
+                urls,
+                wagtailcache_settings.WAGTAIL_CACHE_METRICS_INTERVAL,
+            )
+        snapshot.gauges["keyring_urls"] = urls
+    return snapshot
+
+
+def render_prometheus(snapshot: Snapshot) -> str:
+    """
+    Renders metrics in the Prometheus text exposition format.
+    """
+    lines = [
+        "# HELP wagtailcache_responses_total Responses by cache status.",
+        "# TYPE wagtailcache_responses_total counter",
+    ]
+    lines += [
+        f'wagtailcache_responses_total{{status="{name}"}} '
+        f"{snapshot.counters[name]}"
+        for name in STATUSES
+    ]
+    for name in BYTES:
+        lines += [
+            f"# TYPE wagtailcache_{name}_total counter",
+            f"wagtailcache_{name}_total {snapshot.counters[name]}",
+        ]
+    for name, histogram in snapshot.histograms.items():
+        lines.append(f"# TYPE wagtailcache_{name} histogram")
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS, histogram.counts):
+            cumulative += count
+            lines.append(
+                f'wagtailcache_{name}_bucket{{le="{bound}"}} {cumulative}'
+            )
+        lines += [
+            f'wagtailcache_{name}_bucket{{le="+Inf"}} {histogram.count}',
+            f"wagtailcache_{name}_sum {histogram.seconds}",
+            f"wagtailcache_{name}_count {histogram.count}",
+        ]
+    for name, value in snapshot.gauges.items():
+        lines += [
+            f"# TYPE wagtailcache_{name} gauge",
+            f"wagtailcache_{name} {value}",
+        ]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,237 @@
+"""
+A queue of purges, so that pages can be cleared from the cache in the
+background rather than in the request which publishes them.
+"""
+
+import atexit
+import logging
+import threading
+from functools import lru_cache
+from typing import Iterable
+from typing import Optional
+from typing import Set
+
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from wagtailcache.keyring import lock
+from wagtailcache.settings import wagtailcache_settings
+
+
+logger = logging.getLogger("wagtail-cache")
+
+# Cache key of the purges waiting in ``CachePurgeQueue``.
+PENDING_KEY = "purges"
+
+
+class Purge:
+    """
+    The arguments of one or more calls to ``clear_cache()``. Purges waiting in
+    a queue are merged, so that each URL, tag, etc. is only cleared once.
+    """
+
+    def __init__(
+        self,
+        urls: Iterable[str] = (),
+        tags: Iterable[str] = (),
+        sites: Iterable[str] = (),
+        exact: Iterable[str] = (),
+        prefixes: Iterable[str] = (),
+        everything: bool = False,
+    ):
+        self.urls: Set[str] = set(urls)
+        self.tags: Set[str] = set(tags)
+        # Hostnames, as ``Site`` objects are not safe to pass between threads.
+        self.sites: Set[str] = {getattr(s, "hostname", s) for s in sites}
+        self.exact: Set[str] = set(exact)
+        self.prefixes: Set[str] = set(prefixes)
+        self.everything = everything
+
+    def __bool__(self) -> bool:
+        return bool(
+            self.everything
+            or self.urls
+            or self.tags
+            or self.sites
+            or self.exact
+            or self.prefixes
+        )
+
+    def merge(self, other: "Purge") -> "Purge":
+        """
+        Returns a purge which clears everything that this and ``other`` do.
+        """
+        if self.everything or other.everything:
+            return Purge(everything=True)
+        return Purge(
+            urls=self.urls | other.urls,
+            tags=self.tags | other.tags,
+            sites=self.sites | other.sites,
+            exact=self.exact | other.exact,
+            prefixes=self.prefixes | other.prefixes,
+        )
+
+    def run(self) -> None:
+        """
+        Clears the cache.
+        """
+        from wagtailcache.cache import clear_cache
+
+        if self.everything:
+            clear_cache()
+        elif self:
+            clear_cache(
+                urls=sorted(self.urls),
+                tags=sorted(self.tags),
+                sites=sorted(self.sites),
+                exact=sorted(self.exact),
+                prefixes=sorted(self.prefixes),
+            )
+
+
+class PurgeQueue:
+    """
+    Runs purges. Subclass this to run purges with a task queue such as Celery
+    or RQ, by overriding ``enqueue()`` to send a task which calls
+    ``purge.run()``.
+    """
+
+    # Whether purges are stored outside of the process which enqueued them,
+    # so that they can be drained by another process.
+    persistent = False
+
+    def enqueue(self, purge: Purge) -> None:
+        raise NotImplementedError
+
+    def drain(self) -> int:
+        """
+        Runs every purge which is waiting, returning how many were run.
+        """
+        return 0
+
+
+class ImmediatePurgeQueue(PurgeQueue):
+    """
+    Runs each purge as soon as it is enqueued, in the calling thread.
+    """
+
+    def enqueue(self, purge: Purge) -> None:
+        purge.run()
+
+
+class ThreadPurgeQueue(PurgeQueue):
+    """
+    Runs purges in a background thread of the current process, after waiting
+    ``WAGTAIL_CACHE_PURGE_DELAY`` seconds for more purges to merge with.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: Optional[Purge] = None
+        self._timer: Optional[threading.Timer] = None
+        # Do not lose purges which are waiting when the process exits.
+        atexit.register(self.drain)
+
+    def enqueue(self, purge: Purge) -> None:
+        with self._lock:
+            if self._pending is None:
+                self._pending = purge
+            else:
+                self._pending = self._pending.merge(purge)
+            if self._timer is None:
+                self._timer = threading.Timer(
+                    wagtailcache_settings.WAGTAIL_CACHE_PURGE_DELAY,
+                    self._run,
+                )
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _run(self) -> None:
+        try:
+            self.drain()
+        except Exception:
+            logger.exception("Could not purge pages from cache backend.")
+
+    def drain(self) -> int:
+        with self._lock:
+            purge, self._pending = self._pending, None
+            timer, self._timer = self._timer, None
+        if timer is not None:
+            timer.cancel()
+        if purge is None:
+            return 0
+        purge.run()
+        return 1
+
+
+class CachePurgeQueue(PurgeQueue):
+    """
+    Stores purges in the cache backend, to be run by the
+    ``clear_wagtail_cache --drain`` management command, e.g. every minute.
+    Purges from every process are merged while they wait.
+    """
+
+    persistent = True
+
+    def __init__(self):
+        self.cache = caches[wagtailcache_settings.WAGTAIL_CACHE_BACKEND]
+
+    def enqueue(self, purge: Purge) -> None:
+        with lock(self.cache, PENDING_KEY):
+            pending: Optional[Purge] = self.cache.get(PENDING_KEY)
+            if pending is not None:
+                purge = pending.merge(purge)
+            self.cache.set(PENDING_KEY, purge, None)
+
+    def drain(self) -> int:
+        with lock(self.cache, PENDING_KEY):
+            purge: Optional[Purge] = self.cache.get(PENDING_KEY)
+            self.cache.delete(PENDING_KEY)
+        if purge is None:
+            return 0
+        purge.run()
+        return 1
+
+
+@lru_cache(maxsize=None)
+def get_purge_queue() -> PurgeQueue:
+    """
+    Returns the queue named by ``WAGTAIL_CACHE_PURGE_QUEUE``.
+    """
+    return import_string(wagtailcache_settings.WAGTAIL_CACHE_PURGE_QUEUE)()
+
+
+@receiver(setting_changed)
+def _reset_purge_queue(*, setting: str, **kwargs) -> None:
+    if setting in ("WAGTAIL_CACHE_PURGE_QUEUE", "WAGTAIL_CACHE_BACKEND"):
+        get_purge_queue.cache_clear()
+
+
+def enqueue_purge(
+    urls: Iterable[str] = (),
+    tags: Iterable[str] = (),
+    sites: Iterable[object] = (),
+    exact: Iterable[str] = (),
+    prefixes: Iterable[str] = (),
+) -> None:
+    """
+    Clears the cache later, with the same arguments as ``clear_cache()``.
+    Without any arguments, the entire cache is cleared.
+    """
+    if not wagtailcache_settings.WAGTAIL_CACHE:
+        return
+    purge = Purge(
+        urls=urls, tags=tags, sites=sites, exact=exact, prefixes=prefixes
+    )
+    if not purge:
+        purge = Purge(everything=True)
+    get_purge_queue().enqueue(purge)
+
+
+def drain_purges() -> int:
+    """
+    Runs every purge waiting in the queue now.
+    """
+    return get_purge_queue().drain()
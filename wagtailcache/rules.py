@@ -0,0 +1,244 @@
+"""
+Decides whether requests and responses are cacheable with the declarative
+rules in ``WAGTAIL_CACHE_RULES`` and the paths in
+``WAGTAIL_CACHE_BYPASS_PREFIXES``, and resolves the cacheability hooks.
+"""
+
+import re
+from functools import lru_cache
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.handlers.wsgi import WSGIRequest
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.http.response import HttpResponse
+from django.urls import NoReverseMatch
+from django.urls import reverse
+from wagtail import hooks
+
+from wagtailcache.generations import get_hostname
+from wagtailcache.settings import wagtailcache_settings
+
+
+# Conditions which only need the request, and which need the response.
+REQUEST_CONDITIONS = ("host", "path_prefix", "path_regex")
+RESPONSE_CONDITIONS = ("content_type", "status")
+
+
+def _as_tuple(value) -> Tuple:
+    if isinstance(value, (str, int)):
+        return (value,)
+    return tuple(value)
+
+
+class Rule:
+    """
+    One compiled entry of ``WAGTAIL_CACHE_RULES``. Matches when every
+    condition it sets matches. Each condition can be one value or a list, which
+    matches if any of its values do.
+    """
+
+    def __init__(
+        self,
+        cache: bool,
+        host=(),
+        path_prefix=(),
+        path_regex=(),
+        content_type=(),
+        status=(),
+    ):
+        self.cache = bool(cache)
+        self.hosts = frozenset(h.lower() for h in _as_tuple(host))
+        # ``str.startswith()`` tests a tuple of prefixes in one call.
+        self.path_prefixes = _as_tuple(path_prefix)
+        self.path_regexes = [re.compile(r) for r in _as_tuple(path_regex)]
+        self.content_types = frozenset(
+            c.lower() for c in _as_tuple(content_type)
+        )
+        self.statuses = frozenset(int(s) for s in _as_tuple(status))
+
+    @property
+    def is_response_rule(self) -> bool:
+        return bool(self.content_types or self.statuses)
+
+    def match_request(self, host: str, path: str) -> bool:
+        return (
+            (not self.hosts or host in self.hosts)
+            and (not self.path_prefixes or path.startswith(self.path_prefixes))
+            and (
+                not self.path_regexes
+                or any(r.match(path) for r in self.path_regexes)
+            )
+        )
+
+    def match_response(self, content_type: str, status: int) -> bool:
+        return (
+            not self.content_types or content_type in self.content_types
+        ) and (not self.statuses or status in self.statuses)
+
+
+class Rules:
+    """
+    ``WAGTAIL_CACHE_RULES``, compiled. The first matching rule decides, and
+    its decision is memoized, as it only depends on the URL, and the content
+    type and status of the response.
+    """
+
+    def __init__(self, rules: List[Dict]):
+        compiled = []
+        for i, rule in enumerate(rules):
+            unknown = set(rule) - {
+                "cache",
+                *REQUEST_CONDITIONS,
+                *RESPONSE_CONDITIONS,
+            }
+            if "cache" not in rule or unknown:
+                conditions = ", ".join(REQUEST_CONDITIONS + RESPONSE_CONDITIONS)
+                raise ImproperlyConfigured(
+                    f"WAGTAIL_CACHE_RULES[{i}] must set `cache`, and may only "
+                    f"set {conditions}."
+                )
+            try:
+                compiled.append(Rule(**rule))
+            except re.error as e:
+                raise ImproperlyConfigured(
+                    f"WAGTAIL_CACHE_RULES[{i}] has an invalid path_regex: {e}"
+                )
+        self.request_rules = [r for r in compiled if not r.is_response_rule]
+        self.response_rules = [r for r in compiled if r.is_response_rule]
+        # Only look up the host of requests if a rule needs it.
+        self.match_host = any(r.hosts for r in compiled)
+        self._decide_request = lru_cache(maxsize=1024)(self._decide_request)
+        self._decide_response = lru_cache(maxsize=1024)(self._decide_response)
+
+    def _host(self, request: WSGIRequest) -> str:
+        return get_hostname(request) if self.match_host else ""
+
+    def _decide_request(self, host: str, path: str) -> Optional[bool]:
+        for rule in self.request_rules:
+            if rule.match_request(host, path):
+                return rule.cache
+        return None
+
+    def _decide_response(
+        self, host: str, path: str, content_type: str, status: int
+    ) -> Optional[bool]:
+        for rule in self.response_rules:
+            if rule.match_request(host, path) and rule.match_response(
+                content_type, status
+            ):
+                return rule.cache
+        return None
+
+    def decide_request(self, request: WSGIRequest) -> Optional[bool]:
+        """
+        Returns the decision of the first request rule matching ``request``,
+        or ``None`` if none match.
+        """
+        if not self.request_rules:
+            return None
+        return self._decide_request(self._host(request), request.path)
+
+    def decide_response(
+        self, request: WSGIRequest, response: HttpResponse
+    ) -> Optional[bool]:
+        """
+        Returns the decision of the first response rule matching ``response``
+        to ``request``, or ``None`` if none match.
+        """
+        if not self.response_rules:
+            return None
+        content_type = response.get("Content-Type", "")
+        content_type = content_type.partition(";")[0].strip().lower()
+        return self._decide_response(
+            self._host(request),
+            request.path,
+            content_type,
+            response.status_code,
+        )
+
+
+@lru_cache(maxsize=None)
+def get_rules() -> Optional[Rules]:
+    """
+    Returns the compiled ``WAGTAIL_CACHE_RULES``, or ``None`` if there are
+    none.
+    """
+    rules = wagtailcache_settings.WAGTAIL_CACHE_RULES
+    return Rules(rules) if rules else None
+
+
+@receiver(setting_changed)
+def _reset_rules(*, setting: str, **kwargs) -> None:
+    if setting == "WAGTAIL_CACHE_RULES":
+        get_rules.cache_clear()
+
+
+@lru_cache(maxsize=None)
+def get_bypass_prefixes() -> Tuple[str, ...]:
+    """
+    Returns the path prefixes of requests which bypass the cache entirely.
+    Defaults to ``STATIC_URL``, ``MEDIA_URL``, and the Wagtail admin.
+    """
+    prefixes = wagtailcache_settings.WAGTAIL_CACHE_BYPASS_PREFIXES
+    if prefixes is None:
+        prefixes = [settings.STATIC_URL, settings.MEDIA_URL]
+        try:
+            prefixes.append(reverse("wagtailadmin_home"))
+        except NoReverseMatch:
+            pass
+    # Absolute URLs are served by another host, and "/" would bypass every
+    # request.
+    return tuple(
+        p for p in dict.fromkeys(prefixes) if p and p != "/" and p[0] == "/"
+    )
+
+
+def is_bypassed(request: WSGIRequest) -> bool:
+    """
+    Returns ``True`` if ``request`` should not be served from or stored in the
+    cache, because its path starts with one of ``get_bypass_prefixes()``.
+    """
+    prefixes = get_bypass_prefixes()
+    return bool(prefixes) and request.path.startswith(prefixes)
+
+
+@receiver(setting_changed)
+def _reset_bypass_prefixes(*, setting: str, **kwargs) -> None:
+    if setting in (
+        "WAGTAIL_CACHE_BYPASS_PREFIXES",
+        "STATIC_URL",
+        "MEDIA_URL",
+        "ROOT_URLCONF",
+    ):
+        get_bypass_prefixes.cache_clear()
+
+
+# The functions of each hook, and the registrations they were resolved from.
+_resolved_hooks: Dict[str, Tuple[Tuple, List[Callable]]] = {}
+
+
+def get_hooks(hook_name: str) -> List[Callable]:
+    """
+    Returns the functions registered for ``hook_name`` in order, like
+    ``wagtail.hooks.get_hooks()``, but only sorts them again once hooks have
+    been registered or removed, rather than on every request.
+    """
+    hooks.search_for_hooks()
+    registered = hooks._hooks.get(hook_name)
+    # Wagtail appends to and removes from the same list, so its identity,
+    # length, and last entry change whenever the hooks do.
+    version = (
+        (id(registered), len(registered), registered[-1]) if registered else ()
+    )
+    resolved = _resolved_hooks.get(hook_name)
+    if resolved is None or resolved[0] != version:
+        resolved = (version, hooks.get_hooks(hook_name))
+        _resolved_hooks[hook_name] = resolved
+    return resolved[1]
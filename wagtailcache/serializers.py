@@ -0,0 +1,171 @@
+"""
+Compact representation of responses stored in the cache.
+"""
+
+import time
+from http.cookies import SimpleCookie
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from django.http.response import HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_http_date_safe
+
+from wagtailcache.codecs import get_codec
+from wagtailcache.codecs import get_storage_codec
+from wagtailcache.codecs import get_variant_codecs
+from wagtailcache.codecs import negotiate
+from wagtailcache.settings import wagtailcache_settings
+
+
+# First item of every encoded response, to tell it apart from other values
+# which may be in the cache, such as responses pickled by previous versions.
+MARKER = "wagtailcache.response"
+VERSION = 1
+
+# ``(MARKER, VERSION, status, reason, headers, body, cookies, codec,
+# variants, expires)``
+EncodedResponse = Tuple[
+    str,
+    int,
+    int,
+    str,
+    List[Tuple[str, str]],
+    bytes,
+    List[str],
+    Optional[str],
+    Dict[str, bytes],
+    Optional[Tuple[float, float]],
+]
+
+
+def encode_response(
+    response: HttpResponse, expires: Optional[Tuple[float, float]] = None
+) -> EncodedResponse:
+    """
+    Reduces a response to a tuple of built-in types, which is much smaller
+    and faster to pickle than the response object itself, and does not drag
+    along references to the request, resolver, template context, etc.
+
+    Bodies of at least ``WAGTAIL_CACHE_COMPRESS_MIN_SIZE`` bytes are
+    compressed with ``WAGTAIL_CACHE_COMPRESS``, and a pre-compressed variant is
+    added for each of ``WAGTAIL_CACHE_ENCODINGS``.
+
+    ``expires`` is an optional ``(fresh_until, stale_until)`` pair of
+    timestamps, used to serve the response stale while it is revalidated.
+    """
+    body = response.content
+    codec_name = None
+    variants = {}
+    min_size = wagtailcache_settings.WAGTAIL_CACHE_COMPRESS_MIN_SIZE
+    if len(body) >= min_size and not response.has_header("Content-Encoding"):
+        codec = get_storage_codec()
+        for variant in get_variant_codecs():
+            # A variant identical to the stored body would be redundant.
+            if codec is None or (
+                variant.content_encoding != codec.content_encoding
+            ):
+                variants[variant.content_encoding] = variant.compress(body)
+        if codec is not None:
+            body = codec.compress(body)
+            codec_name = wagtailcache_settings.WAGTAIL_CACHE_COMPRESS
+    return (
+        MARKER,
+        VERSION,
+        response.status_code,
+        response.reason_phrase,
+        list(response.items()),
+        body,
+        [morsel.OutputString() for morsel in response.cookies.values()],
+        codec_name,
+        variants,
+        expires,
+    )
+
+
+def is_encoded_response(value: Any) -> bool:
+    """
+    Returns ``True`` if ``value`` was produced by ``encode_response``.
+    """
+    return (
+        isinstance(value, tuple)
+        and len(value) == 10
+        and value[0] == MARKER
+        and value[1] == VERSION
+    )
+
+
+def decode_response(
+    value: EncodedResponse, accept_encoding: str = ""
+) -> HttpResponse:
+    """
+    Rebuilds a response from the output of ``encode_response``.
+
+    If the body was stored compressed, or with pre-compressed variants, the
+    best encoding allowed by ``accept_encoding`` (the request's
+    ``Accept-Encoding`` header) is served as-is with a ``Content-Encoding``
+    header. This skips both decompressing here and re-compressing in
+    ``GZipMiddleware``. Otherwise the identity body is served.
+    """
+    status, reason, headers, body, cookies, codec_name, variants = value[2:9]
+    header_dict = dict(headers)
+    codec = get_codec(codec_name) if codec_name else None
+    available = dict(variants)
+    if codec is not None and codec.content_encoding:
+        available.setdefault(codec.content_encoding, body)
+    chosen = negotiate(accept_encoding, list(available)) if available else None
+    if chosen:
+        body = available[chosen]
+        header_dict["Content-Encoding"] = chosen
+        if "Content-Length" in header_dict:
+            header_dict["Content-Length"] = str(len(body))
+        # The encoded body is no longer byte-for-byte identical, so weaken
+        # any strong ETag, as ``GZipMiddleware`` does.
+        etag = header_dict.get("ETag")
+        if etag and etag.startswith('"'):
+            header_dict["ETag"] = "W/" + etag
+    elif codec is not None:
+        body = codec.decompress(body)
+    response = HttpResponse(
+        body, status=status, reason=reason, headers=header_dict
+    )
+    if available:
+        patch_vary_headers(response, ("Accept-Encoding",))
+    if cookies:
+        response.cookies = SimpleCookie()
+        for cookie in cookies:
+            response.cookies.load(cookie)
+    return response
+
+
+def get_expires(value: EncodedResponse) -> Optional[Tuple[float, float]]:
+    """
+    Returns the ``(fresh_until, stale_until)`` timestamps of an encoded
+    response, or ``None`` if it is never served stale.
+    """
+    return value[9]
+
+
+def get_lifetime(value: EncodedResponse) -> Optional[float]:
+    """
+    Returns the seconds until an encoded response expires from the cache, from
+    its ``expires`` or its ``Expires`` header, or ``None`` if it is unknown.
+    """
+    expires = value[9]
+    if expires:
+        return expires[1] - time.time()
+    for name, header in value[4]:
+        if name.lower() == "expires":
+            timestamp = parse_http_date_safe(header)
+            return None if timestamp is None else timestamp - time.time()
+    return None
+
+
+def get_size(value: EncodedResponse) -> int:
+    """
+    Returns the number of bytes of body, including variants, in ``value``.
+    """
+    return len(value[5]) + sum(len(body) for body in value[8].values())
@@ -10,7 +10,15 @@ from django.conf import settings
 class _DefaultSettings:
     WAGTAIL_CACHE = True
     WAGTAIL_CACHE_BACKEND = "default"
+    WAGTAIL_CACHE_BATCH_SIZE = 500
+    WAGTAIL_CACHE_BYPASS_PREFIXES = None
+    WAGTAIL_CACHE_COMPRESS = None
+    WAGTAIL_CACHE_COMPRESS_MIN_SIZE = 1024
+    WAGTAIL_CACHE_ENCODINGS = []
+    WAGTAIL_CACHE_GENERATIONS = False
     WAGTAIL_CACHE_HEADER = "X-Wagtail-Cache"
+    WAGTAIL_CACHE_HIT_COUNTS = False
+    WAGTAIL_CACHE_HIT_COUNTS_INTERVAL = 10
     WAGTAIL_CACHE_IGNORE_COOKIES = True
     WAGTAIL_CACHE_IGNORE_QS = [
         r"^_bta_.*$",  # Bronto
@@ -35,6 +43,30 @@ class _DefaultSettings:
         r"^utm_.*$",  # Google Analytics
     ]
     WAGTAIL_CACHE_KEYRING = False
+    WAGTAIL_CACHE_KEYRING_BUCKETS = 256
+    WAGTAIL_CACHE_KEYRING_CLASS = None
+    WAGTAIL_CACHE_KEYRING_MAX_SIZE = None
+    WAGTAIL_CACHE_LOCAL = False
+    WAGTAIL_CACHE_LOCAL_CHECK_INTERVAL = 1
+    WAGTAIL_CACHE_LOCAL_MAX_BYTES = 64 * 1024 * 1024
+    WAGTAIL_CACHE_LOCAL_MAX_ENTRIES = 1000
+    WAGTAIL_CACHE_LOCAL_TIMEOUT = 30
+    WAGTAIL_CACHE_METRICS = False
+    WAGTAIL_CACHE_METRICS_INTERVAL = 60
+    WAGTAIL_CACHE_METRICS_SINKS = ["wagtailcache.metrics.CacheSink"]
+    WAGTAIL_CACHE_MISS_LOCK = False
+    WAGTAIL_CACHE_MISS_LOCK_TIMEOUT = 5
+    WAGTAIL_CACHE_PURGE_DELAY = 1
+    WAGTAIL_CACHE_PURGE_QUEUE = "wagtailcache.purge.ThreadPurgeQueue"
+    WAGTAIL_CACHE_REVALIDATE_WORKERS = 0
+    WAGTAIL_CACHE_REWARM = False
+    WAGTAIL_CACHE_REWARM_MIN_HITS = 2
+    WAGTAIL_CACHE_REWARM_WORKERS = 2
+    WAGTAIL_CACHE_RULES = []
+    WAGTAIL_CACHE_STALE_WHILE_REVALIDATE = 0
+    WAGTAIL_CACHE_TAGS_HEADER = None
+    WAGTAIL_CACHE_TIMING = []
+    WAGTAIL_CACHE_TRACK_DEPENDENCIES = False
 
     def __getattribute__(self, attr: Text):
         # First load from Django settings.
@@ -0,0 +1,106 @@
+"""
+Timings of each phase of fetching a request from, and storing a response in,
+the cache, reported in a ``Server-Timing`` header or a log record.
+"""
+
+import logging
+import time
+from contextlib import contextmanager
+from contextlib import nullcontext
+from typing import ContextManager
+from typing import Dict
+from typing import Iterator
+
+from django.core.handlers.wsgi import WSGIRequest
+from django.http.response import HttpResponse
+from django.template.response import SimpleTemplateResponse
+
+from wagtailcache.settings import wagtailcache_settings
+
+
+logger = logging.getLogger("wagtail-cache")
+
+# Prefix of each metric name in the ``Server-Timing`` header.
+PREFIX = "cache-"
+
+_untimed = nullcontext()
+
+
+class Timings:
+    """
+    The total seconds spent in each phase of one request.
+    """
+
+    def __init__(self):
+        self.phases: Dict[str, float] = {}
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.phases[name] = self.phases.get(name, 0) + elapsed
+
+    def header(self) -> str:
+        """
+        Returns the phases as ``Server-Timing`` metrics, in milliseconds.
+        """
+        return ", ".join(
+            f"{PREFIX}{name};dur={seconds * 1000:.3f}"
+            for name, seconds in self.phases.items()
+        )
+
+
+def start_timing(request: WSGIRequest) -> None:
+    """
+    Starts timing the phases of a request, if ``WAGTAIL_CACHE_TIMING`` is set.
+    """
+    if wagtailcache_settings.WAGTAIL_CACHE_TIMING and not hasattr(
+        request, "_wagtailcache_timings"
+    ):
+        setattr(request, "_wagtailcache_timings", Timings())
+
+
+def timed(request: WSGIRequest, name: str) -> ContextManager:
+    """
+    Returns a context manager which adds the time spent in it to phase
+    ``name`` of the request. Does nothing unless the request is being timed.
+    """
+    timings = getattr(request, "_wagtailcache_timings", None)
+    return _untimed if timings is None else timings.phase(name)
+
+
+def finish_timing(request: WSGIRequest, response: HttpResponse) -> None:
+    """
+    Reports the timings of a request, once its response has been rendered,
+    as each of ``WAGTAIL_CACHE_TIMING`` says.
+    """
+    timings = getattr(request, "_wagtailcache_timings", None)
+    if timings is None or not timings.phases:
+        return
+    if isinstance(response, SimpleTemplateResponse) and not (
+        response.is_rendered
+    ):
+        # Wait for ``UpdateCacheMiddleware`` to see the rendered response.
+        return
+    delattr(request, "_wagtailcache_timings")
+    outputs = wagtailcache_settings.WAGTAIL_CACHE_TIMING
+    if "header" in outputs:
+        header = timings.header()
+        if response.has_header("Server-Timing"):
+            header = f"{response['Server-Timing']}, {header}"
+        response["Server-Timing"] = header
+    if "log" in outputs:
+        logger.debug(
+            "Cache timings of %s: %s",
+            request.path,
+            timings.header(),
+            extra={
+                "wagtailcache_timings": {
+                    name: seconds * 1000
+                    for name, seconds in timings.phases.items()
+                }
+            },
+        )
@@ -0,0 +1,144 @@
+"""
+An index of the URLs in the keyring, to find the URLs to clear without testing
+every pattern against every URL.
+"""
+
+import re
+from bisect import bisect_left
+from functools import lru_cache
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Pattern
+from typing import Set
+from typing import Tuple
+from urllib.parse import urlsplit
+
+
+# Characters which end the literal prefix of a regular expression.
+_SPECIAL = set(".^$*+?{}[]\\|()")
+# Escaped characters which are literal.
+_ESCAPED = set(".^$*+?{}[]\\|()/-:&=#~%")
+# Quantifiers which make the preceding character optional.
+_OPTIONAL = set("?*{")
+
+
+@lru_cache(maxsize=1024)
+def compile_pattern(pattern: str) -> Tuple[Pattern, str]:
+    """
+    Compiles ``pattern`` once, and returns it along with the literal text which
+    every URL it matches with ``re.match`` must start with.
+    """
+    compiled = re.compile(pattern)
+    # Alternatives each have their own prefix.
+    if "|" in pattern or compiled.flags & re.IGNORECASE:
+        return compiled, ""
+    prefix = []
+    i = 1 if pattern.startswith("^") else 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == "\\" and i + 1 < len(pattern) and pattern[i + 1] in _ESCAPED:
+            literal = pattern[i + 1]
+            i += 2
+        elif char in _SPECIAL:
+            break
+        else:
+            literal = char
+            i += 1
+        if i < len(pattern) and pattern[i] in _OPTIONAL:
+            break
+        prefix.append(literal)
+    return compiled, "".join(prefix)
+
+
+def _split(uri: str) -> Tuple[str, str]:
+    """
+    Splits an absolute URI into its origin and the rest.
+    """
+    parts = urlsplit(uri)
+    origin = f"{parts.scheme}://{parts.netloc}"
+    return origin, uri[len(origin) :]
+
+
+class UrlIndex:
+    """
+    The URLs of the keyring, sorted by path under each origin (scheme and
+    host), so that exact URLs and URL prefixes are found by binary search.
+    Paths starting with ``/`` are looked up under every origin.
+    """
+
+    def __init__(self, uris: Iterable[str]):
+        by_origin: Dict[str, List[str]] = {}
+        for uri in uris:
+            origin, path = _split(uri)
+            by_origin.setdefault(origin, []).append(path)
+        self.origins: Dict[str, List[str]] = {
+            origin: sorted(paths) for origin, paths in by_origin.items()
+        }
+
+    def _origins_for(self, url: str) -> List[Tuple[str, str]]:
+        if url.startswith("/"):
+            return [(origin, url) for origin in self.origins]
+        origin, path = _split(url)
+        return [(origin, path)] if origin in self.origins else []
+
+    def exact(self, urls: Iterable[str]) -> Set[str]:
+        """
+        Returns the URLs in the index equal to any of ``urls``.
+        """
+        found = set()
+        for url in urls:
+            for origin, path in self._origins_for(url):
+                paths = self.origins[origin]
+                i = bisect_left(paths, path)
+                if i < len(paths) and paths[i] == path:
+                    found.add(origin + path)
+        return found
+
+    def prefix(self, prefixes: Iterable[str]) -> Set[str]:
+        """
+        Returns the URLs in the index starting with any of ``prefixes``.
+        """
+        found = set()
+        for prefix in prefixes:
+            if "://" in prefix and not _split(prefix)[1]:
+                # A prefix may end partway through the host.
+                found.update(
+                    origin + path
+                    for origin, paths in self.origins.items()
+                    if origin.startswith(prefix)
+                    for path in paths
+                )
+                continue
+            for origin, path in self._origins_for(prefix):
+                paths = self.origins[origin]
+                i = bisect_left(paths, path)
+                while i < len(paths) and paths[i].startswith(path):
+                    found.add(origin + paths[i])
+                    i += 1
+        return found
+
+    def match(self, patterns: Iterable[str]) -> Set[str]:
+        """
+        Returns the URLs in the index which match any of the regular
+        expressions ``patterns``. Each pattern is only tested against the URLs
+        starting with its literal prefix.
+        """
+        found = set()
+        for pattern in patterns:
+            compiled, literal = compile_pattern(pattern)
+            if "://" in literal and _split(literal)[1]:
+                candidates = self.prefix([literal])
+            else:
+                candidates = (
+                    origin + path
+                    for origin, paths in self.origins.items()
+                    if origin.startswith(literal)
+                    for path in paths
+                )
+            found.update(
+                uri
+                for uri in candidates
+                if uri not in found and compiled.match(uri)
+            )
+        return found
@@ -6,11 +6,16 @@ from typing import Dict
 from typing import List
 
 from django.core.cache import caches
+from django.http import HttpResponse
 from django.http import HttpResponseRedirect
 from django.shortcuts import render
 from django.urls import reverse
 
 from wagtailcache.cache import clear_cache
+from wagtailcache.cache import nocache_page
+from wagtailcache.keyring import get_keyring
+from wagtailcache.metrics import get_metrics
+from wagtailcache.metrics import render_prometheus
 from wagtailcache.settings import wagtailcache_settings
 
 
@@ -20,12 +25,16 @@ def index(request):
     """
     # Get the keyring to show cache contents.
     _wagcache = caches[wagtailcache_settings.WAGTAIL_CACHE_BACKEND]
-    keyring: Dict[str, List[str]] = _wagcache.get("keyring", {})
+    keyring: Dict[str, List[str]] = get_keyring(_wagcache).as_dict()
+    metrics = None
+    if wagtailcache_settings.WAGTAIL_CACHE_METRICS:
+        metrics = get_metrics()
     return render(
         request,
         "wagtailcache/index.html",
         {
             "keyring": keyring,
+            "metrics": metrics,
         },
     )
 
@@ -36,3 +45,16 @@ def clear(request):
     """
     clear_cache()
     return HttpResponseRedirect(reverse("wagtailcache_admin:index"))
+
+
+@nocache_page
+def prometheus_view(request):
+    """
+    Serves the metrics of every process in the Prometheus text format. This is
+    not added to the wagtail admin, so that it can be scraped without logging
+    in. Add it to the project's URLs, and restrict access to it as needed.
+    """
+    return HttpResponse(
+        render_prometheus(get_metrics()),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
@@ -10,6 +10,7 @@ from wagtail import hooks
 from wagtail.admin.menu import MenuItem
 
 from wagtailcache import urls
+from wagtailcache.dependencies import collect_served_page
 
 
 class CacheMenuItem(MenuItem):
@@ -56,3 +57,11 @@ def register_icons(icons):
     # https://github.com/wagtail/wagtail/pull/6028
     icons.append("wagtailcache/wagtailcache-bolt.svg")
     return icons
+
+
+@hooks.register("before_serve_page")
+def collect_served(page, request, serve_args, serve_kwargs):
+    """
+    Tracks dependencies on the served page rather than its ancestors.
+    """
+    collect_served_page(page)
@@ -0,0 +1,301 @@
+"""
+Warms the cache by rendering pages before visitors request them.
+"""
+
+import io
+import logging
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Set
+from urllib.parse import quote
+from urllib.parse import unquote
+from urllib.parse import urlsplit
+from xml.etree import ElementTree
+
+from django.core.cache import caches
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.handlers.wsgi import WSGIRequest
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.http.response import HttpResponse
+
+from wagtailcache.hits import NOT_COUNTED
+from wagtailcache.hits import get_hit_counts
+from wagtailcache.keyring import get_keyring
+from wagtailcache.settings import wagtailcache_settings
+
+
+logger = logging.getLogger("wagtail-cache")
+
+SITEMAP_NS = "{http://www.sitemaps.org/schemas/sitemap/0.9}"
+# Characters which are not encoded again when requesting a URI, including "%"
+# so that escapes are left as they are.
+URI_SAFE = ":/?#[]@!$&'()*+,;=%~"
+
+
+def get_page_urls(sites: Iterable[object] = ()) -> List[str]:
+    """
+    Returns the URL of every live, public Wagtail page, shallowest first.
+    Only pages in ``sites`` are returned if given.
+    """
+    from wagtail.models import Page
+    from wagtail.models import Site
+
+    pages = Page.objects.live().public().order_by("depth", "path")
+    if sites:
+        hostnames = [getattr(site, "hostname", site) for site in sites]
+        site_pages = Page.objects.none()
+        for site in Site.objects.filter(hostname__in=hostnames):
+            site_pages |= pages.descendant_of(site.root_page, inclusive=True)
+        pages = site_pages.order_by("depth", "path")
+    urls = []
+    for page in pages:
+        url = page.get_full_url()
+        if url:
+            urls.append(url)
+    return urls
+
+
+def get_keyring_urls() -> List[str]:
+    """
+    Returns every URL in the keyring, i.e. every URL which has been cached.
+    """
+    _wagcache = caches[wagtailcache_settings.WAGTAIL_CACHE_BACKEND]
+    return [uri for uri, _ in get_keyring(_wagcache).items()]
+
+
+class _RateLimiter:
+    """
+    Spaces out calls to ``wait()`` across threads to at most ``rate`` per
+    second.
+    """
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate
+        self.lock = threading.Lock()
+        self.next = time.monotonic()
+
+    def wait(self) -> None:
+        with self.lock:
+            now = time.monotonic()
+            at = max(now, self.next)
+            self.next = at + self.interval
+        if at > now:
+            time.sleep(at - now)
+
+
+class Warmer:
+    """
+    Requests URLs through the project's full middleware stack, exactly as a
+    visitor would, so that ``UpdateCacheMiddleware`` stores each page under
+    the same key as real traffic.
+    """
+
+    def __init__(
+        self,
+        workers: int = 4,
+        rate: Optional[float] = None,
+        headers: Optional[Dict[str, str]] = None,
+    ):
+        self.workers = max(1, workers)
+        self.limiter = _RateLimiter(rate) if rate else None
+        # Extra WSGI environ entries, such as ``HTTP_ACCEPT_ENCODING``.
+        self.headers = headers or {}
+        self.handler = WSGIHandler()
+
+    def build_request(self, uri: str) -> WSGIRequest:
+        # URIs from the keyring are decoded, apart from reserved characters.
+        parts = urlsplit(quote(uri, safe=URI_SAFE))
+        environ = {
+            "REQUEST_METHOD": "GET",
+            "SCRIPT_NAME": "",
+            "PATH_INFO": unquote(parts.path) or "/",
+            "QUERY_STRING": parts.query,
+            "SERVER_NAME": parts.hostname or "",
+            "SERVER_PORT": str(
+                parts.port or (443 if parts.scheme == "https" else 80)
+            ),
+            "SERVER_PROTOCOL": "HTTP/1.1",
+            "HTTP_HOST": parts.netloc,
+            "wsgi.url_scheme": parts.scheme or "http",
+            "wsgi.input": io.BytesIO(b""),
+            "wsgi.errors": io.StringIO(),
+            NOT_COUNTED: True,
+            **self.headers,
+        }
+        return WSGIRequest(environ)
+
+    def render(self, uri: str) -> HttpResponse:
+        """
+        Requests ``uri``, returning the response.
+        """
+        if self.limiter is not None:
+            self.limiter.wait()
+        response = self.handler.get_response(self.build_request(uri))
+        # Closing the response also closes old database connections.
+        response.close()
+        return response
+
+    def _warm_one(self, uri: str) -> str:
+        try:
+            response = self.render(uri)
+        except Exception:
+            logger.exception("Could not warm %s.", uri)
+            return "error"
+        return response.get(wagtailcache_settings.WAGTAIL_CACHE_HEADER, "none")
+
+    def warm(self, uris: Iterable[str]) -> Counter:
+        """
+        Requests each of ``uris`` in a pool of worker threads, in order, or in
+        the current thread if there is only one worker. Returns the number of
+        responses with each cache status, e.g. how many were a ``"miss"`` and
+        are now cached.
+        """
+        if self.workers == 1:
+            return Counter(map(self._warm_one, uris))
+        with ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="wagtailcache-warm"
+        ) as executor:
+            return Counter(executor.map(self._warm_one, uris))
+
+
+def get_sitemap_urls(url: str, warmer: Optional[Warmer] = None) -> List[str]:
+    """
+    Returns the URLs listed in the sitemap at ``url``, following sitemap
+    indexes. The sitemap is rendered by the project itself.
+    """
+    warmer = warmer or Warmer()
+    response = warmer.render(url)
+    if response.status_code != 200:
+        return []
+    root = ElementTree.fromstring(response.content)
+    urls = []
+    for loc in root.iter(f"{SITEMAP_NS}loc"):
+        text = (loc.text or "").strip()
+        if root.tag == f"{SITEMAP_NS}sitemapindex":
+            urls.extend(get_sitemap_urls(text, warmer))
+        elif text:
+            urls.append(text)
+    return urls
+
+
+def prioritize(uris: Iterable[str]) -> List[str]:
+    """
+    Orders ``uris`` by their number of recent requests, most requested first.
+    Requires ``WAGTAIL_CACHE_HIT_COUNTS``, otherwise the order is unchanged.
+    """
+    uris = list(dict.fromkeys(uris))
+    if not wagtailcache_settings.WAGTAIL_CACHE_HIT_COUNTS:
+        return uris
+    counts = get_hit_counts(uris)
+    # Sorting is stable, so URLs with equal counts keep their order.
+    return sorted(uris, key=lambda uri: -counts[uri])
+
+
+@lru_cache(maxsize=None)
+def _get_rewarm_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(
+        max_workers=max(1, wagtailcache_settings.WAGTAIL_CACHE_REWARM_WORKERS),
+        thread_name_prefix="wagtailcache-rewarm",
+    )
+
+
+@lru_cache(maxsize=None)
+def _get_rewarm_warmer() -> Warmer:
+    return Warmer(workers=1)
+
+
+@receiver(setting_changed)
+def _reset_rewarm(*, setting: str, **kwargs) -> None:
+    if setting == "WAGTAIL_CACHE_REWARM_WORKERS":
+        _get_rewarm_executor().shutdown(wait=True)
+        _get_rewarm_executor.cache_clear()
+
+
+# URLs waiting to be re-warmed, so each is only queued once.
+_rewarming: Set[str] = set()
+_rewarming_lock = threading.Lock()
+
+
+def _rewarm_one(uri: str) -> None:
+    with _rewarming_lock:
+        _rewarming.discard(uri)
+    _get_rewarm_warmer()._warm_one(uri)
+
+
+def rewarm(uris: Iterable[str]) -> None:
+    """
+    Re-renders purged URLs in background threads, if ``WAGTAIL_CACHE_REWARM``
+    is on. With ``WAGTAIL_CACHE_HIT_COUNTS``, URLs requested fewer than
+    ``WAGTAIL_CACHE_REWARM_MIN_HITS`` times recently are skipped, and the rest
+    are re-rendered most requested first.
+    """
+    if not wagtailcache_settings.WAGTAIL_CACHE_REWARM:
+        return
+    uris = list(dict.fromkeys(uris))
+    if wagtailcache_settings.WAGTAIL_CACHE_HIT_COUNTS:
+        counts = get_hit_counts(uris)
+        min_hits = wagtailcache_settings.WAGTAIL_CACHE_REWARM_MIN_HITS
+        uris = sorted(
+            (uri for uri in uris if counts[uri] >= min_hits),
+            key=lambda uri: -counts[uri],
+        )
+    with _rewarming_lock:
+        uris = [uri for uri in uris if uri not in _rewarming]
+        _rewarming.update(uris)
+    executor = _get_rewarm_executor()
+    for uri in uris:
+        executor.submit(_rewarm_one, uri)
+
+
+def warm_cache(
+    urls: Optional[Iterable[str]] = None,
+    sites: Iterable[object] = (),
+    sitemap: Optional[str] = None,
+    keyring: bool = False,
+    limit: Optional[int] = None,
+    workers: int = 4,
+    rate: Optional[float] = None,
+    headers: Optional[Dict[str, str]] = None,
+) -> Counter:
+    """
+    Renders pages into the cache, most requested first.
+
+    :param urls: Absolute URLs to warm. If not given, every live, public page
+    in ``sites`` (or every site) is warmed.
+
+    :param sitemap: The absolute URL of a sitemap listing the URLs to warm.
+
+    :param keyring: Warm every URL in the keyring, i.e. every URL which has
+    been cached, rather than only pages.
+
+    :param limit: The maximum number of URLs to warm.
+
+    :param workers: The number of pages rendered at once.
+
+    :param rate: The maximum number of pages requested per second.
+
+    :param headers: Extra WSGI environ entries for each request, such as
+    ``{"HTTP_ACCEPT_ENCODING": "gzip"}``, to warm the variant real visitors
+    will request.
+    """
+    warmer = Warmer(workers=workers, rate=rate, headers=headers)
+    if urls is not None:
+        uris = list(urls)
+    elif sitemap:
+        uris = get_sitemap_urls(sitemap, warmer)
+    elif keyring:
+        uris = get_keyring_urls()
+    else:
+        uris = get_page_urls(sites)
+    uris = prioritize(uris)
+    if limit is not None:
+        uris = uris[:limit]
+    return warmer.warm(uris)